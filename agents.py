@@ -1,25 +1,57 @@
 import json
+import sys
 import time
 import threading
 from typing import List, Dict, Any
-import math
 from config import *
+import cost_matrix
+import geo
+from route_planner import RoutePlanner
+from time_windows import DeadlineIndex, current_minute, dispatch_key, order_window, window_penalty
+import batch_assignment
+from spatial_index import GridIndex
+from state_sync import StateTracker
+
+# Статусы агентов. Повторяющиеся строки (статусы, приоритеты, временные окна,
+# типы транспорта) интернируются: сотни тысяч заказов разделяют один объект строки
+ORDER_STATUSES = ("pending", "assigned", "in_progress", "delivered", "cancelled")
+COURIER_STATUSES = ("available", "busy", "offline", "emergency")
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
 
 
 class CourierAgent:
+    # Без __dict__ у каждого экземпляра
+    __slots__ = ("id", "location", "transport_type", "max_capacity", "current_capacity",
+                 "current_orders", "_listener", "_status", "speed", "name", "last_update")
+
     def __init__(self, agent_id: int, location: List[float], transport_type: str,
                  max_capacity: float, name: str = ""):
         self.id = agent_id
-        self.location = location  # [lat, lon]
-        self.transport_type = transport_type
+        self.location = tuple(location)  # (lat, lon)
+        self.transport_type = _intern(transport_type)
         self.max_capacity = max_capacity
         self.current_capacity = 0.0
         self.current_orders = []
-        self.status = "available"  # available, busy, offline, emergency
+        self._listener = None  # Диспетчер, которому сообщается о смене статуса
+        self._status = "available"  # available, busy, offline, emergency
         self.speed = TRANSPORT_SPEEDS.get(transport_type, 10)
         self.name = name or f"Courier_{agent_id}"
         self.last_update = time.time()
 
+    @property
+    def status(self):
+        return self._status
+
+    @status.setter
+    def status(self, value):
+        previous = self._status
+        self._status = _intern(value)
+        if self._listener is not None and previous != value:
+            self._listener.courier_status_changed(self, previous, value)
+
     def can_accept_order(self, order) -> bool:
         """Проверяет, может ли курьер принять заказ"""
         if self.status != "available":
@@ -30,6 +62,12 @@ class CourierAgent:
             return False
         return True
 
+    def has_free_slot(self) -> bool:
+        """Проверяет, может ли курьер сейчас принять хотя бы один заказ"""
+        return (self.status == "available"
+                and len(self.current_orders) < MAX_ORDERS_PER_COURIER
+                and self.current_capacity < self.max_capacity)
+
     def accept_order(self, order):
         """Добавляет заказ курьеру"""
         self.current_orders.append(order)
@@ -45,16 +83,29 @@ class CourierAgent:
             if order.id == order_id:
                 self.current_orders.remove(order)
                 self.current_capacity -= order.weight
+                if self._listener is not None:
+                    self._listener.courier_order_removed(self, order)
                 order.status = "delivered"
                 break
 
         if len(self.current_orders) < MAX_ORDERS_PER_COURIER and self.status != "emergency":
             self.status = "available"
 
+    def release_order(self, order_id):
+        """Снимает заказ с курьера без отметки о доставке"""
+        for order in self.current_orders:
+            if order.id == order_id:
+                self.current_orders.remove(order)
+                self.current_capacity -= order.weight
+                if self._listener is not None:
+                    self._listener.courier_order_removed(self, order)
+                return order
+        return None
+
     def to_dict(self):
         return {
             "id": self.id,
-            "location": self.location,
+            "location": list(self.location),
             "transport_type": self.transport_type,
             "max_capacity": self.max_capacity,
             "current_capacity": self.current_capacity,
@@ -65,22 +116,48 @@ class CourierAgent:
 
 
 class OrderAgent:
+    # Без __dict__ у каждого экземпляра: заказов в памяти могут быть сотни тысяч
+    __slots__ = ("id", "destination", "weight", "priority", "time_window", "window_start", "window_end",
+                 "description", "_listener", "_status", "assigned_courier", "_created_time")
+
     def __init__(self, order_id: int, destination: List[float], weight: float,
-                 priority: str, time_window: str, description: str = ""):
+                 priority: str, time_window: str, description: str = "", created_time: float = None):
         self.id = order_id
-        self.destination = destination  # [lat, lon]
+        self.destination = tuple(destination)  # (lat, lon)
         self.weight = weight
-        self.priority = priority  # high, normal, low
-        self.time_window = time_window  # "HH:MM-HH:MM"
+        self.priority = _intern(priority)  # high, normal, low
+        self.time_window = _intern(time_window)  # "HH:MM-HH:MM"
         self.description = description
-        self.status = "pending"  # pending, assigned, in_progress, delivered, cancelled
+        self._listener = None  # Диспетчер, которому сообщается о смене статуса
+        self._status = "pending"  # pending, assigned, in_progress, delivered, cancelled
         self.assigned_courier = None
-        self.created_time = time.time()
+        self.created_time = time.time() if created_time is None else created_time
+
+    @property
+    def created_time(self):
+        return self._created_time
+
+    @created_time.setter
+    def created_time(self, value):
+        # Окно привязано к суткам создания, поэтому пересчитывается вместе с ним
+        self._created_time = value
+        self.window_start, self.window_end = order_window(self.time_window, value)  # Минуты, см. time_windows
+
+    @property
+    def status(self):
+        return self._status
+
+    @status.setter
+    def status(self, value):
+        previous = self._status
+        self._status = _intern(value)
+        if self._listener is not None and previous != value:
+            self._listener.order_status_changed(self, previous, value)
 
     def to_dict(self):
         return {
             "id": self.id,
-            "destination": self.destination,
+            "destination": list(self.destination),
             "weight": self.weight,
             "priority": self.priority,
             "time_window": self.time_window,
@@ -92,85 +169,430 @@ class OrderAgent:
 
 
 class DispatcherAgent:
-    def __init__(self):
+    def __init__(self, engine: str = DISPATCH_ENGINE, use_spatial_index: bool = USE_SPATIAL_INDEX,
+                 mode: str = ASSIGNMENT_MODE):
         self.couriers = {}
         self.orders = {}
         self.assignments = []
         self.traffic_data = {}  # Имитация данных о трафике
+        self.engine = engine  # "python" или "numpy"
+        self.mode = mode  # "greedy" или "batch"
+        self.use_spatial_index = use_spatial_index
+        # Сетка в проекции с учетом сжатия долготы, чтобы соседи совпадали с geo.distance
+        # Только курьеры со свободным местом: поиск ближайших не обходит занятых
+        self.courier_index = GridIndex(lon_scale=geo.lon_scale(GEO_REFERENCE_LATITUDE))
+        self.order_index = GridIndex(lon_scale=geo.lon_scale(GEO_REFERENCE_LATITUDE))  # Только ожидающие заказы
+
+        # Реестры по статусам: {статус: {id: None}} (dict сохраняет порядок добавления)
+        self.orders_by_status = {}
+        self.couriers_by_status = {}
+        self.active_assignments = {}  # {order_id: назначение} для заказов в статусе assigned
+        self.tracker = StateTracker()  # Изменения для рассылки дельт
+        self.routes = RoutePlanner()  # Порядок объезда заказов каждого курьера
+        self.deadline_index = DeadlineIndex()  # Ожидающие заказы по сроку окна
+        self.clock = current_minute  # Текущее время в минутах от полуночи (см. time_windows.DAY_ZERO)
+        self.current_minute = self.clock()  # Обновляется в начале каждого прохода
+        self.assignment_listener = None  # Вызывается (курьер, заказ, назначение) сразу после закрепления
 
     def add_courier(self, courier: CourierAgent):
         self.couriers[courier.id] = courier
+        self._index_courier(courier)
+        self.couriers_by_status.setdefault(courier.status, {})[courier.id] = None
+        courier._listener = self
+        self.tracker.courier_changed(courier.id)
+
+    def update_courier_location(self, courier: CourierAgent, location):
+        """Обновляет местоположение курьера и его позицию в индексе"""
+        courier.location = tuple(location)
+        self._index_courier(courier)
+        self.tracker.courier_changed(courier.id)
+
+    def _index_courier(self, courier):
+        """Держит курьера в индексе, только пока он может принять заказ"""
+        if courier.has_free_slot():
+            self.courier_index.insert(courier.id, courier.location)
+        else:
+            self.courier_index.remove(courier.id)
 
     def add_order(self, order: OrderAgent):
         self.orders[order.id] = order
+        self.orders_by_status.setdefault(order.status, {})[order.id] = None
+        if order.status == "pending":
+            self.order_index.insert(order.id, order.destination)
+            self.deadline_index.insert(order)
+        order._listener = self
+        self.tracker.order_changed(order.id)
+
+    def remove_courier(self, courier_id):
+        """Убирает курьера из диспетчера (например, при переходе в другой регион)"""
+        courier = self.couriers.pop(courier_id, None)
+        if courier is None:
+            return None
+        self.courier_index.remove(courier_id)
+        self.couriers_by_status.get(courier.status, {}).pop(courier_id, None)
+        self.routes.routes.pop(courier_id, None)
+        courier._listener = None
+        self.tracker.courier_removed(courier_id)
+        return courier
+
+    def remove_order(self, order_id):
+        """Убирает заказ из диспетчера вместе с записями в реестрах и индексах"""
+        order = self.orders.pop(order_id, None)
+        if order is None:
+            return None
+        self.orders_by_status.get(order.status, {}).pop(order_id, None)
+        if order.status == "pending":
+            self.order_index.remove(order_id)
+            self.deadline_index.remove(order_id)
+        self.active_assignments.pop(order_id, None)
+        order._listener = None
+        return order
+
+    def order_status_changed(self, order, previous, status):
+        """Переносит заказ между реестрами при смене статуса"""
+        self.orders_by_status[previous].pop(order.id, None)
+        self.orders_by_status.setdefault(status, {})[order.id] = None
+
+        if previous == "pending":
+            self.order_index.remove(order.id)
+            self.deadline_index.remove(order.id)
+        elif previous == "assigned":
+            if self.active_assignments.pop(order.id, None) is not None:
+                self.tracker.assignment_removed(order.id)
+        if status == "pending":
+            self.order_index.insert(order.id, order.destination)
+            self.deadline_index.insert(order)
+
+        self.tracker.order_changed(order.id)
+        if order.assigned_courier is not None:
+            # Изменился и список заказов курьера
+            self.tracker.courier_changed(order.assigned_courier)
+
+    def courier_status_changed(self, courier, previous, status):
+        """Переносит курьера между реестрами при смене статуса"""
+        self.couriers_by_status[previous].pop(courier.id, None)
+        self.couriers_by_status.setdefault(status, {})[courier.id] = None
+        self._index_courier(courier)
+        self.tracker.courier_changed(courier.id)
+
+    def courier_order_removed(self, courier, order):
+        """Заказ снят с курьера (доставлен или возвращен в ожидание)"""
+        self.routes.remove(courier, order)
+        self._index_courier(courier)  # Освободилось место
+
+    def order_count(self, status):
+        return len(self.orders_by_status.get(status, ()))
+
+    def courier_count(self, status):
+        return len(self.couriers_by_status.get(status, ()))
+
+    def pending_orders(self):
+        """Ожидающие заказы от самых срочных (см. time_windows.dispatch_key)"""
+        return list(self.iter_pending_orders())
+
+    def iter_pending_orders(self):
+        """Ожидающие заказы от самых срочных; распределять их можно во время обхода"""
+        for order_id in self.deadline_index.order_ids():
+            order = self.orders[order_id]
+            if order.status == "pending":
+                yield order
+
+    def available_couriers(self):
+        return [self.couriers[courier_id] for courier_id in self.couriers_by_status.get("available", ())]
 
     def calculate_distance(self, point1, point2):
-        """Рассчитывает расстояние между двумя точками (упрощенная формула)"""
-        lat1, lon1 = point1
-        lat2, lon2 = point2
-        return math.sqrt((lat2 - lat1) ** 2 + (lon2 - lon1) ** 2) * 111  # Примерно км
+        """Рассчитывает расстояние между двумя точками по поверхности Земли, км"""
+        return geo.distance(point1, point2)
 
-    def estimate_delivery_time(self, courier, order):
-        """Оценивает время доставки с учетом трафика"""
-        distance = self.calculate_distance(courier.location, order.destination)
+    def travel_time(self, courier, distance):
+        """Время в пути на расстояние distance (км) с учетом трафика, мин"""
         base_time = (distance / courier.speed) * 60  # в минутах
 
         # Учет трафика (упрощенно)
         traffic_factor = self.traffic_data.get("factor", 1.0)
         return base_time * traffic_factor
 
-    def assign_orders(self):
-        """Основной алгоритм распределения заказов"""
-        pending_orders = [order for order in self.orders.values() if order.status == "pending"]
-        available_couriers = [courier for courier in self.couriers.values()
-                              if courier.status == "available"]
+    def estimate_delivery_time(self, courier, order):
+        """Оценивает время доставки с учетом трафика и маршрута курьера:
+        заказ встает в маршрут туда, где меньше всего его удлиняет"""
+        _, _, route_distance = self.routes.evaluate(courier, order)
+        return self.travel_time(courier, route_distance)
 
-        if not pending_orders or not available_couriers:
-            return
+    def score_assignment(self, courier, order):
+        """Возвращает (оценка, время доставки) для пары курьер-заказ.
 
-        # Сортируем заказы по приоритету и времени создания
-        pending_orders.sort(key=lambda x: (x.priority != "high", x.created_time))
+        Основа оценки - на сколько минут заказ удлиняет маршрут курьера;
+        для свободного курьера это время пути до заказа.
+        """
+        extra_distance, _, route_distance = self.routes.evaluate(courier, order)
+        insertion_time = self.travel_time(courier, extra_distance)
+        delivery_time = self.travel_time(courier, route_distance)
 
-        for order in pending_orders:
-            best_courier = None
-            best_score = float('inf')
+        # Приоритетные заказы получают бонус, низкоприоритетные - штраф
+        priority_bonus = PRIORITY_BONUSES.get(order.priority, 0)
+
+        # Учет загруженности курьера
+        load_penalty = courier.current_capacity * LOAD_PENALTY_FACTOR
+
+        # Штраф за опоздание к концу временного окна
+        late_penalty = self.late_penalty(order, delivery_time)
+
+        # Приехав до начала окна, курьер ждет его: доставка не раньше начала окна.
+        # В оценку ожидание не входит - иначе все успевающие заранее курьеры равны
+        delivery_time += self.early_wait(order, delivery_time)
+
+        return insertion_time + priority_bonus + load_penalty + late_penalty, delivery_time
+
+    def late_penalty(self, order, delivery_time):
+        """Штраф, если заказ будет доставлен после конца временного окна"""
+        if self.current_minute + delivery_time <= order.window_end:
+            return 0.0
+        return window_penalty(order)
+
+    def early_wait(self, order, delivery_time):
+        """Сколько минут курьер ждет начала окна, если приедет раньше"""
+        return max(0.0, order.window_start - self.current_minute - delivery_time)
+
+    def certainly_late(self, courier, order):
+        """Курьер опоздает, даже если поедет к заказу напрямую.
+
+        Путь по маршруту не короче прямого, поэтому такую пару можно
+        отбросить без оценки вставки в маршрут.
+        """
+        direct_time = self.travel_time(courier, geo.distance(courier.location, order.destination))
+        return self.current_minute + direct_time > order.window_end + 1e-6
 
-            for courier in available_couriers:
-                if not courier.can_accept_order(order):
+    def assign_orders(self):
+        """Основной алгоритм распределения заказов"""
+        available_couriers = self.available_couriers()
+        if not self.deadline_index or not available_couriers:
+            return
+        self.current_minute = self.clock()
+
+        # Заказы идут от самых срочных: приоритет, затем срок окна
+        pending_orders = None
+        if self.mode == "batch":
+            pending_orders, available_couriers = self._assign_orders_batch(self.pending_orders(), available_couriers)
+            if not pending_orders or not available_couriers:
+                return
+
+        if self.engine == "numpy":
+            if cost_matrix.HAS_NUMPY:
+                self._assign_orders_numpy(pending_orders or self.pending_orders(), available_couriers)
+                return
+            print("⚠️ NumPy не установлен, используется движок python")
+
+        # Жадный проход берет заказы из индекса по одному и останавливается,
+        # когда свободных курьеров не остается
+        self._assign_orders_python(pending_orders or self.iter_pending_orders(), available_couriers)
+
+    def dispatch_orders(self, orders):
+        """Инкрементальное распределение: только переданные заказы
+        сопоставляются с курьерами-кандидатами. Возвращает новые назначения"""
+        pending_orders = [order for order in orders if order.status == "pending"]
+        if not pending_orders:
+            return []
+
+        first_new = len(self.assignments)
+        self.current_minute = self.clock()
+        pending_orders.sort(key=dispatch_key)
+        self._assign_orders_python(pending_orders, None)
+        return self.assignments[first_new:]
+
+    def dispatch_order(self, order: OrderAgent):
+        """Распределяет один новый заказ"""
+        return self.dispatch_orders([order])
+
+    def dispatch_for_courier(self, courier: CourierAgent):
+        """Распределяет ожидающие заказы рядом с освободившимся курьером.
+
+        Каждый из ближайших заказов по-прежнему выбирает лучшего из своих
+        кандидатов, так что заказ может уйти и к соседнему курьеру.
+        """
+        return self.dispatch_for_couriers([courier])
+
+    def dispatch_for_couriers(self, couriers):
+        """Один проход распределения для заказов рядом с несколькими
+        освободившимися курьерами"""
+        return self.dispatch_orders(self.orders_near_couriers(couriers))
+
+    def orders_near_couriers(self, couriers):
+        """Ожидающие заказы рядом с курьерами, у которых есть свободный слот"""
+        nearby_ids = {}
+        for courier in couriers:
+            if not courier.has_free_slot():
+                continue
+            for order_id in self.order_index.nearest(
+                    courier.location,
+                    k=INCREMENTAL_ORDER_CANDIDATES,
+                    predicate=lambda order_id: courier.can_accept_order(self.orders[order_id])):
+                nearby_ids[order_id] = None
+        return [self.orders[order_id] for order_id in nearby_ids]
+
+    def _candidate_couriers(self, order, available_couriers=None):
+        """Курьеры, которых стоит оценивать для заказа"""
+        if not self.use_spatial_index:
+            if available_couriers is None:
+                return self.available_couriers()
+            return available_couriers
+
+        # Только k ближайших курьеров, способных принять заказ
+        nearest_ids = self.courier_index.nearest(
+            order.destination,
+            k=SPATIAL_CANDIDATES_K,
+            predicate=lambda courier_id: self.couriers[courier_id].can_accept_order(order)
+        )
+        return [self.couriers[courier_id] for courier_id in nearest_ids]
+
+    def _assign_orders_python(self, pending_orders, available_couriers):
+        """Жадное распределение: цикл по заказам и курьерам-кандидатам.
+
+        Заказ, к окну которого не успевает ни один кандидат, откладывается
+        и распределяется после остальных: иначе безнадежно срочные заказы
+        первыми занимают курьеров, которые успели бы к другим окнам.
+        """
+        late_orders = []
+        for order in pending_orders:
+            if not self.couriers_by_status.get("available"):
+                return  # Остальным заказам назначать некому
+            if order.window_end < self.current_minute:
+                late_orders.append(order)  # Окно уже закрылось - опоздает любой курьер
+                continue
+            choice = self._best_courier(order, available_couriers)
+            if choice is None:
+                continue
+            courier, delivery_time, score = choice
+            if self.current_minute + delivery_time > order.window_end:
+                late_orders.append(order)
+                continue
+            self._commit_assignment(courier, order, delivery_time, score)
+
+        for order in late_orders:
+            if not self.couriers_by_status.get("available"):
+                return
+            choice = self._best_courier(order, available_couriers)
+            if choice is not None:
+                self._commit_assignment(choice[0], order, choice[1], choice[2])
+
+    def _best_courier(self, order, available_couriers):
+        """(курьер, время доставки, оценка) с минимальной оценкой или None"""
+        best_courier = None
+        best_score = float('inf')
+        best_time = 0.0
+
+        # Опоздавшая пара набирает не меньше late_floor, поэтому после
+        # успевающего кандидата ее можно не оценивать
+        late_floor = window_penalty(order) + PRIORITY_BONUSES.get(order.priority, 0)
+        for courier in self._candidate_couriers(order, available_couriers):
+            if not courier.can_accept_order(order):
+                continue
+            if best_score < late_floor and self.certainly_late(courier, order):
+                continue
+
+            score, delivery_time = self.score_assignment(courier, order)
+            if score < best_score:
+                best_score = score
+                best_courier = courier
+                best_time = delivery_time
+
+        if best_courier is None:
+            return None
+        return best_courier, best_time, best_score
+
+    def _assign_orders_numpy(self, pending_orders, available_couriers):
+        """Жадное распределение по матрице оценок, рассчитанной одним пакетом.
+
+        Матрица строится по всем доступным курьерам, пространственный
+        индекс здесь не используется.
+        """
+        traffic_factor = self.traffic_data.get("factor", 1.0)
+        cost_matrix.greedy_assign(available_couriers, pending_orders, traffic_factor,
+                                  routes=self.routes, commit=self._commit_assignment,
+                                  current_minute=self.current_minute)
+
+    def _assign_orders_batch(self, pending_orders, available_couriers):
+        """Пакетное распределение с оптимумом по всем ожидающим заказам.
+
+        Слоты курьеров оцениваются по числу заказов, а вес проверяется при
+        закреплении, поэтому отклоненные по вместимости заказы решаются
+        повторно. Возвращает заказы и курьеров, оставшихся для жадного прохода.
+        """
+        deadline = time.perf_counter() + BATCH_TIME_BUDGET
+        while pending_orders and available_couriers:
+            budget = deadline - time.perf_counter()
+            matches, timed_out = batch_assignment.solve_batch_assignment(
+                self, pending_orders, available_couriers, budget)
+
+            # После первого отказа по весу менее приоритетные заказы откладываются
+            # до следующего решения, чтобы не занять вместимость раньше отклоненного
+            committed = 0
+            rejected_rank = None
+            for courier, order, delivery_time, score in matches:
+                rank = PRIORITY_RANKS.get(order.priority, PRIORITY_RANKS["normal"])
+                if rejected_rank is not None and rank > rejected_rank:
                     continue
+                if courier.can_accept_order(order):
+                    self._commit_assignment(courier, order, delivery_time, score)
+                    committed += 1
+                elif rejected_rank is None:
+                    rejected_rank = rank
+
+            pending_orders = [order for order in pending_orders if order.status == "pending"]
+            available_couriers = [courier for courier in available_couriers if courier.status == "available"]
+
+            if timed_out:
+                print(f"⏱️ Пакетное распределение не уложилось в {BATCH_TIME_BUDGET} с, "
+                      f"остаток распределяется жадным алгоритмом")
+                break
+            if committed == 0 or committed == len(matches):
+                break
 
-                # Расчет оценки для этого курьера и заказа
-                delivery_time = self.estimate_delivery_time(courier, order)
-
-                # Приоритетные заказы получают бонус
-                priority_bonus = 0
-                if order.priority == "high":
-                    priority_bonus = -50  # Уменьшаем оценку для приоритетных
-                elif order.priority == "low":
-                    priority_bonus = 20  # Увеличиваем для низкоприоритетных
-
-                # Учет загруженности курьера
-                load_penalty = courier.current_capacity * 0.1
-
-                score = delivery_time + priority_bonus + load_penalty
-
-                if score < best_score:
-                    best_score = score
-                    best_courier = courier
-
-            if best_courier:
-                best_courier.accept_order(order)
-                assignment = {
-                    "courier_id": best_courier.id,
-                    "order_id": order.id,
-                    "estimated_time": f"{delivery_time:.1f} мин",
-                    "score": best_score
-                }
-                self.assignments.append(assignment)
-                print(f"Заказ {order.id} назначен курьеру {best_courier.id} (оценка: {best_score:.2f})")
-
-    def handle_emergency(self, courier_id):
-        """Обработка чрезвычайной ситуации с курьером"""
+        return pending_orders, available_couriers
+
+    def apply_assignment(self, courier, order):
+        """Назначает заказ, выбранный вне этого диспетчера (например, процессом
+        региона), если пара все еще допустима. Оценка пересчитывается по
+        текущему маршруту курьера. Возвращает назначение или None"""
+        if order.status != "pending" or not courier.can_accept_order(order):
+            return None
+        score, delivery_time = self.score_assignment(courier, order)
+        return self._commit_assignment(courier, order, delivery_time, score)
+
+    def _commit_assignment(self, courier, order, delivery_time, score):
+        """Закрепляет заказ за курьером и записывает назначение"""
+        self.routes.insert(courier, order)
+        courier.accept_order(order)
+        self._index_courier(courier)  # Заказ занял вес или последнее место
+        assignment = {
+            "courier_id": courier.id,
+            "order_id": order.id,
+            "estimated_time": f"{delivery_time:.1f} мин",
+            "score": score
+        }
+        self.assignments.append(assignment)
+        self.active_assignments[order.id] = assignment
+        self.tracker.assignment_added(order.id)
+        self.tracker.courier_changed(courier.id)
+        print(f"Заказ {order.id} назначен курьеру {courier.id} (оценка: {score:.2f})")
+        if self.assignment_listener is not None:
+            self.assignment_listener(courier, order, assignment)
+        return assignment
+
+    def unassign_order(self, order):
+        """Снимает заказ с курьера и возвращает в ожидание (распределяет вызывающий)"""
+        courier = self.couriers.get(order.assigned_courier)
+        if courier is not None:
+            courier.release_order(order.id)
+            self.tracker.courier_changed(courier.id)
+        order.assigned_courier = None
+        order.status = "pending"
+
+    def handle_emergency(self, courier_id, redispatch: bool = True):
+        """Обработка чрезвычайной ситуации с курьером.
+
+        При redispatch=False снятые заказы остаются в ожидании, их
+        распределяет вызывающий (например, планировщик распределения).
+        """
         if courier_id not in self.couriers:
             return False
 
@@ -180,12 +602,13 @@ class DispatcherAgent:
         # Перераспределение заказов
         orders_to_redistribute = courier.current_orders.copy()
         for order in orders_to_redistribute:
-            courier.complete_order(order.id)
-            order.status = "pending"  # Возвращаем в ожидание
+            courier.release_order(order.id)
             order.assigned_courier = None
+            order.status = "pending"  # Возвращаем в ожидание
 
         print(f"ЧП: Курьер {courier_id} снят с маршрута. Заказы перераспределяются.")
-        self.assign_orders()
+        if redispatch:
+            self.dispatch_orders(orders_to_redistribute)
         return True
 
 
@@ -202,18 +625,16 @@ class MonitorAgent:
         }
 
     def update_statistics(self, dispatcher: DispatcherAgent):
-        orders = list(dispatcher.orders.values())
-        couriers = list(dispatcher.couriers.values())
-
-        self.statistics["total_orders"] = len(orders)
-        self.statistics["delivered"] = len([o for o in orders if o.status == "delivered"])
-        self.statistics["in_progress"] = len([o for o in orders if o.status == "assigned"])
-        self.statistics["pending"] = len([o for o in orders if o.status == "pending"])
-        self.statistics["cancelled"] = len([o for o in orders if o.status == "cancelled"])
+        # Счетчики берутся из реестров диспетчера, без перебора всех заказов
+        self.statistics["total_orders"] = len(dispatcher.orders)
+        self.statistics["delivered"] = dispatcher.order_count("delivered")
+        self.statistics["in_progress"] = dispatcher.order_count("assigned")
+        self.statistics["pending"] = dispatcher.order_count("pending")
+        self.statistics["cancelled"] = dispatcher.order_count("cancelled")
 
         # Расчет утилизации курьеров
-        busy_couriers = len([c for c in couriers if c.status in ["busy", "emergency"]])
-        total_active = len([c for c in couriers if c.status != "offline"])
+        busy_couriers = dispatcher.courier_count("busy") + dispatcher.courier_count("emergency")
+        total_active = len(dispatcher.couriers) - dispatcher.courier_count("offline")
         if total_active > 0:
             self.statistics["courier_utilization"] = (busy_couriers / total_active) * 100
 
@@ -0,0 +1,138 @@
+import asyncio
+
+from fanout import ClientChannel, FanoutStats
+from server import CourierServer
+from config import SERVER_HOST, SERVER_PORT, SERVER_BACKLOG, BUFFER_SIZE, PERIODIC_INTERVAL, ASYNC_READ_LIMIT
+
+
+class AsyncChannel(ClientChannel):
+    """Канал подключения asyncio: очередь разбирает задача в цикле событий"""
+
+    def __init__(self, writer: asyncio.StreamWriter, stats: FanoutStats, **kwargs):
+        super().__init__(stats, **kwargs)
+        self.writer = writer
+        self.loop = asyncio.get_running_loop()
+        self.ready = asyncio.Event()
+        self.task = self.loop.create_task(self._drain())
+
+    def _wakeup(self):
+        # Рассылка может идти и из других потоков
+        self.loop.call_soon_threadsafe(self.ready.set)
+
+    def _abort(self):
+        self.loop.call_soon_threadsafe(self.writer.close)
+
+    async def _drain(self):
+        """Отправляет накопленные сообщения, соблюдая обратное давление транспорта"""
+        try:
+            while not self.closed:
+                await self.ready.wait()
+                self.ready.clear()
+                items = self.take_all()
+                if not items:
+                    continue
+                data = b"".join(items)
+                self.writer.write(data)
+                self.stats.add("sent_bytes", len(data))
+                await self.writer.drain()
+        except (ConnectionError, OSError):
+            self.close()
+            self.writer.close()
+
+
+class AsyncCourierServer(CourierServer):
+    """Сервер на одном цикле событий asyncio вместо потока на каждого клиента.
+
+    Протокол (JSON-строки через \\n или согласованные бинарные кадры)
+    и обработчики parse_message те же, что и у CourierServer: сообщения
+    применяет поток состояния, цикл событий только читает и пишет сокеты.
+    """
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Читает сообщения одного клиента до отключения"""
+        address = writer.get_extra_info("peername")
+        connection = AsyncChannel(writer, self.fanout.stats)
+        # Регистрация и отключение - командами в потоке состояния; цикл событий их не ждет блокируясь
+        await self.call_command(self.register_client, connection, address, connection)
+        decoder = self.clients[connection]["decoder"]
+        decoder.max_message_size = ASYNC_READ_LIMIT
+
+        try:
+            while self.running and not connection.closed:
+                data = await reader.read(BUFFER_SIZE)
+                if not data:
+                    break
+
+                decoder.feed(data)
+                try:
+                    for message in decoder.messages():
+                        command = self.parse_message(message, connection)
+                        if command is not None:
+                            await self.submit_command(*command)
+                except ValueError as e:
+                    # Сообщение длиннее ASYNC_READ_LIMIT или поврежденный кадр
+                    print(f"❌ Некорректное сообщение от {address}: {e}")
+                    break
+
+        except (ConnectionResetError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            print(f"❌ Ошибка с клиентом {address}: {e}")
+        finally:
+            # shield: отмена задачи при остановке не должна отменять снятие регистрации
+            await asyncio.shield(self.call_command(self.unregister_client, connection, address))
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+    async def periodic_loop(self):
+        """Периодические задачи в том же цикле событий"""
+        while self.running:
+            await asyncio.sleep(PERIODIC_INTERVAL)
+            await self.submit_command(self.run_periodic_tick)
+
+    async def submit_command(self, function, *args):
+        """Ставит команду в поток состояния; при полной очереди ждет места в
+        пуле потоков, а цикл событий тем временем обслуживает остальных клиентов"""
+        while True:
+            future = self.state_loop.submit_nowait(function, *args)
+            if future is not None:
+                return future
+            # Обратное давление только на этого клиента: его чтение встает до освобождения очереди
+            await asyncio.get_running_loop().run_in_executor(None, self.state_loop.wait_for_space)
+
+    async def call_command(self, function, *args):
+        """Выполняет команду в потоке состояния и ждет результата, не блокируя цикл событий"""
+        return await asyncio.wrap_future(await self.submit_command(function, *args))
+
+    async def serve(self):
+        server = await asyncio.start_server(
+            self.handle_connection, SERVER_HOST, SERVER_PORT,
+            limit=ASYNC_READ_LIMIT, reuse_address=True, backlog=SERVER_BACKLOG
+        )
+        print(f"🚀 Сервер (asyncio) запущен на {SERVER_HOST}:{SERVER_PORT}")
+        print("⏳ Ожидание подключений...")
+
+        periodic_task = asyncio.create_task(self.periodic_loop())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            periodic_task.cancel()
+            for connection in list(self.clients):
+                connection.close()
+                connection.writer.close()
+
+    def start_server(self):
+        """Запускает сервер"""
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            print("\n🛑 Остановка сервера...")
+        except Exception as e:
+            print(f"❌ Ошибка сервера: {e}")
+        finally:
+            self.running = False
+            self.shutdown()
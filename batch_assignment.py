@@ -0,0 +1,189 @@
+"""Пакетное распределение заказов: задача о назначениях минимальной стоимости
+с вместимостью курьеров (поток минимальной стоимости)"""
+import bisect
+import heapq
+import time
+
+from config import MAX_ORDERS_PER_COURIER, BATCH_UNASSIGNED_COSTS
+
+
+class CapacitatedAssignment:
+    """Назначение заказов в слоты курьеров с минимальной суммарной оценкой.
+
+    Сеть: заказ -> курьер (стоимость = оценка пары), курьер -> сток
+    (пропускная способность = число свободных слотов), заказ -> сток
+    (стоимость = штраф за нераспределенный заказ). Заказы добавляются
+    по одному, каждый раз ищется кратчайший увеличивающий путь (Дейкстра
+    с потенциалами), поэтому после каждого шага решение оптимально для
+    уже добавленных заказов.
+    """
+
+    def __init__(self, slots, edges, unassigned_costs):
+        self.order_count = len(edges)
+        self.courier_count = len(slots)
+        self.sink = self.order_count + self.courier_count
+
+        # Стоимости сдвигаются так, чтобы все ребра были неотрицательными:
+        # каждый заказ выходит ровно по одному ребру, поэтому оптимум не меняется
+        lowest = min([0.0] + [cost for order_edges in edges for _, cost in order_edges])
+        self.shift = -lowest
+        self.edges = [{self.order_count + i: cost + self.shift for i, cost in order_edges}
+                      for order_edges in edges]
+        self.unassigned_costs = [cost + self.shift for cost in unassigned_costs]
+
+        self.slots_left = list(slots)
+        self.assigned_to = [None] * self.order_count  # узел курьера, self.sink или None
+        self.courier_orders = [dict() for _ in range(self.courier_count)]  # {заказ: стоимость}
+
+        # Потенциалы хранятся со смещением: pi(v) = potential[v] + self.offset
+        self.potential = [0.0] * (self.sink + 1)
+        self.offset = 0.0
+
+    def _pi(self, node):
+        return self.potential[node] + self.offset
+
+    def _neighbors(self, node):
+        """Ребра остаточной сети: (вершина, стоимость)"""
+        if node < self.order_count:
+            current = self.assigned_to[node]
+            for courier_node, cost in self.edges[node].items():
+                if courier_node != current:
+                    yield courier_node, cost
+            if current != self.sink:
+                yield self.sink, self.unassigned_costs[node]
+        elif node < self.sink:
+            courier = node - self.order_count
+            for order, cost in self.courier_orders[courier].items():
+                yield order, -cost  # Обратное ребро: снять заказ с курьера
+            if self.slots_left[courier] > 0:
+                yield self.sink, 0.0
+
+    def add_order(self, order):
+        """Добавляет заказ и перестраивает назначения по кратчайшему пути"""
+        # Потенциал новой вершины делает приведенные стоимости ее ребер неотрицательными
+        required = max([self._pi(node) - cost for node, cost in self._neighbors(order)] + [0.0])
+        self.potential[order] = required - self.offset
+
+        distance = {order: 0.0}
+        parent = {order: None}
+        settled = []
+        heap = [(0.0, order)]
+        done = set()
+        potential = self.potential
+        sink = self.sink
+        while heap:
+            dist, node = heapq.heappop(heap)
+            if node in done:
+                continue
+            done.add(node)
+            settled.append(node)
+            if node == sink:
+                break
+            base = dist + potential[node]  # Смещение offset сокращается в приведенной стоимости
+            for neighbor, cost in self._neighbors(node):
+                if neighbor in done:
+                    continue
+                candidate = base + cost - potential[neighbor]
+                if candidate < dist:
+                    candidate = dist  # Отсекаем погрешность округления
+                if candidate < distance.get(neighbor, float('inf')):
+                    distance[neighbor] = candidate
+                    parent[neighbor] = node
+                    heapq.heappush(heap, (candidate, neighbor))
+
+        sink_distance = distance[self.sink]
+
+        # pi(v) += min(d(v), d(сток)): для непросмотренных вершин - через общее смещение
+        self.offset += sink_distance
+        for node in settled:
+            self.potential[node] -= sink_distance - distance[node]
+
+        self._augment(parent)
+
+    def _augment(self, parent):
+        node = self.sink
+        while parent[node] is not None:
+            previous = parent[node]
+            if previous < self.order_count:
+                # Заказ уходит к курьеру или в нераспределенные
+                self.assigned_to[previous] = node
+                if node != self.sink:
+                    courier = node - self.order_count
+                    self.courier_orders[courier][previous] = self.edges[previous][node]
+            elif node == self.sink:
+                self.slots_left[previous - self.order_count] -= 1
+            else:
+                # Курьер отдает заказ, который дальше по пути уходит в другое место
+                self.courier_orders[previous - self.order_count].pop(node, None)
+            node = previous
+
+    def assignment(self):
+        """Возвращает {индекс заказа: индекс курьера} для распределенных заказов"""
+        return {order: node - self.order_count
+                for order, node in enumerate(self.assigned_to)
+                if node is not None and node != self.sink}
+
+
+def _capacity_slots(courier, prefix_weights):
+    """Свободные слоты курьера: не больше MAX_ORDERS_PER_COURIER и не больше
+    числа самых легких заказов, которые помещаются в оставшуюся вместимость"""
+    free_slots = MAX_ORDERS_PER_COURIER - len(courier.current_orders)
+    remaining = courier.max_capacity - courier.current_capacity
+    fitting = bisect.bisect_right(prefix_weights, remaining)
+    return max(0, min(free_slots, fitting))
+
+
+def solve_batch_assignment(dispatcher, orders, couriers, time_budget):
+    """Решает пакетное распределение за отведенное время.
+
+    Заказы добавляются в переданном порядке (сначала приоритетные). Если время
+    истекло, возвращается оптимум для уже добавленных заказов, остальные
+    остаются для жадного алгоритма. Возвращает (список (курьер, заказ, время
+    доставки, оценка), признак истечения времени).
+    """
+    deadline = time.perf_counter() + time_budget
+
+    prefix_weights = []
+    total = 0.0
+    for weight in sorted(order.weight for order in orders):
+        total += weight
+        prefix_weights.append(total)
+
+    courier_position = {courier.id: i for i, courier in enumerate(couriers)}
+    slots = [_capacity_slots(courier, prefix_weights) for courier in couriers]
+
+    # Ребра строятся по тем же кандидатам и оценкам, что и в жадном алгоритме
+    edges = []
+    pair_info = {}
+    for j, order in enumerate(orders):
+        order_edges = []
+        for courier in dispatcher._candidate_couriers(order, couriers):
+            i = courier_position.get(courier.id)
+            if i is None or not slots[i] or not courier.can_accept_order(order):
+                continue
+            score, delivery_time = dispatcher.score_assignment(courier, order)
+            order_edges.append((i, score))
+            pair_info[(j, i)] = (delivery_time, score)
+        edges.append(order_edges)
+
+        if time.perf_counter() > deadline:
+            return [], True
+
+    unassigned_costs = [BATCH_UNASSIGNED_COSTS.get(order.priority, BATCH_UNASSIGNED_COSTS["normal"])
+                        for order in orders]
+    solver = CapacitatedAssignment(slots, edges, unassigned_costs)
+    timed_out = False
+    for j in range(len(orders)):
+        if time.perf_counter() > deadline:
+            timed_out = True
+            break
+        solver.add_order(j)
+
+    matches = []
+    result = solver.assignment()
+    for j, order in enumerate(orders):
+        i = result.get(j)
+        if i is not None:
+            delivery_time, score = pair_info[(j, i)]
+            matches.append((couriers[i], order, delivery_time, score))
+    return matches, timed_out
@@ -0,0 +1,272 @@
+"""Замеры распределения на синтетическом городе (benchmarks/fixtures.py)
+от 10^2 до 10^5 заказов: время и пропускная способность
+DispatcherAgent.assign_orders, handle_emergency, MonitorAgent.update_statistics
+и CourierServer._prepare_status_data, память на заказ. Результат сравнивается
+с сохраненным эталоном; ухудшение сверх допуска - код возврата 1.
+
+Запуск из корня проекта:
+    python benchmarks/dispatch_suite.py                     # сравнить с эталоном
+    python benchmarks/dispatch_suite.py --save-baseline     # записать эталон
+    python benchmarks/dispatch_suite.py --scales 100 1000 --engine numpy
+    python benchmarks/dispatch_suite.py --full                  # и 10^5 заказов (минуты)
+
+Время зависит от машины: эталон стоит записывать на той же машине,
+на которой потом проверяются изменения.
+"""
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_loader import DataLoader  # noqa: E402
+from agents import MonitorAgent  # noqa: E402
+from server import CourierServer  # noqa: E402
+from fixtures import make_fixture, pin_created_time, FIXTURE_MINUTE  # noqa: E402
+import geo  # noqa: E402
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_SCALES = (100, 1000, 10000)
+FULL_SCALES = DEFAULT_SCALES + (100000,)
+QUICK_SCALE = 10000  # Выше этого числа заказов замер не повторяется и пик памяти не снимается
+EMERGENCY_CALLS = 50  # Сколько занятых курьеров снимается с маршрута за замер
+
+# Показатели: (подпись, что лучше). "lower"/"higher" сравниваются с допуском,
+# "exact" - результат распределения, который при том же seed не должен меняться
+METRICS = {
+    "build_s": ("загрузка агентов, с", "lower"),
+    "assign_s": ("assign_orders, с", "lower"),
+    "assign_orders_per_s": ("назначений в секунду", "higher"),
+    "assigned": ("назначено заказов", "exact"),
+    "late": ("назначено с опозданием", "exact"),
+    "emergency_ms": ("handle_emergency, мс", "lower"),
+    "statistics_us": ("update_statistics, мкс", "lower"),
+    "status_ms": ("_prepare_status_data, мс", "lower"),
+    "status_kb": ("снимок статуса в JSON, КБ", "lower"),
+    "bytes_per_order": ("память на заказ, байт", "lower"),
+    "peak_mb": ("пик памяти при распределении, МБ", "lower"),
+}
+
+
+def build_dispatcher(data, engine, mode):
+    geo.clear_cache()
+    dispatcher = DataLoader.initialize_agents_from_data(data)
+    dispatcher.engine = engine
+    dispatcher.mode = mode
+    dispatcher.clock = lambda: FIXTURE_MINUTE  # Окна заказов рассчитаны на это время
+    return dispatcher
+
+
+def late_count(dispatcher):
+    late = 0
+    for assignment in dispatcher.assignments:
+        delivery_time = float(assignment["estimated_time"].split()[0])
+        late += FIXTURE_MINUTE + delivery_time > dispatcher.orders[assignment["order_id"]].window_end
+    return late
+
+
+@contextlib.contextmanager
+def quiet():
+    """Диспетчер печатает каждое назначение; в замер вывод в терминал не входит"""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+@contextlib.contextmanager
+def no_gc():
+    """Как в timeit: сборщик мусора не срабатывает посреди замера"""
+    gc.collect()
+    gc.disable()
+    try:
+        yield
+    finally:
+        gc.enable()
+
+
+def per_call(repeat, action):
+    """Медиана времени одного вызова action(), с: вызовы повторяются, пока
+    замер не займет хотя бы 0.2 с (timeit.Timer.autorange), и так repeat раз.
+    Медиана меньше зависит от случайно удачного или неудачного повтора, чем минимум"""
+    timer = timeit.Timer(action)
+    number, _ = timer.autorange()
+    return statistics.median(timer.repeat(repeat, number)) / number
+
+
+def run_scale(orders, engine, mode, repeat, seed, measure_memory):
+    data = pin_created_time(make_fixture(orders, seed=seed))
+    result = {}
+
+    result["build_s"] = per_call(repeat, lambda: build_dispatcher(data, engine, mode))
+
+    # Распределение меняет состояние: каждый повтор - на свежем диспетчере
+    assign_times = []
+    for _ in range(repeat):
+        dispatcher = build_dispatcher(data, engine, mode)
+        with no_gc(), quiet():
+            started = time.perf_counter()
+            dispatcher.assign_orders()
+            assign_times.append(time.perf_counter() - started)
+    result["assign_s"] = statistics.median(assign_times)
+    result["assigned"] = len(dispatcher.assignments)
+    result["assign_orders_per_s"] = result["assigned"] / result["assign_s"] if result["assign_s"] else 0.0
+    result["late"] = late_count(dispatcher)
+
+    monitor = MonitorAgent()
+    result["statistics_us"] = per_call(repeat, lambda: monitor.update_statistics(dispatcher)) * 1e6
+
+    with quiet():
+        server = CourierServer(journal_dir=None, orders_file=None)
+    try:
+        server.dispatcher = dispatcher
+        server.monitor = monitor
+        result["status_ms"] = per_call(repeat, server._prepare_status_data) * 1000
+        result["status_kb"] = len(json.dumps(server._prepare_status_data(), ensure_ascii=False).encode()) / 1024
+    finally:
+        # Потоки сервера иначе переживут замер; результаты в output_results.json не пишутся
+        with quiet():
+            server.shutdown(save=False)
+
+    # ЧП с перераспределением снятых заказов; курьеры берутся в порядке id,
+    # берется медиана: вызовы различаются числом снятых заказов
+    busy = [courier.id for courier in dispatcher.couriers.values() if courier.current_orders][:EMERGENCY_CALLS]
+    emergency_times = []
+    with no_gc(), quiet():
+        for courier_id in busy:
+            started = time.perf_counter()
+            dispatcher.handle_emergency(courier_id)
+            emergency_times.append(time.perf_counter() - started)
+    result["emergency_ms"] = statistics.median(emergency_times) * 1000 if busy else 0.0
+
+    del server, dispatcher
+    if measure_memory:
+        result.update(measure_memory_use(data, engine, mode, with_peak=orders <= QUICK_SCALE))
+    return result
+
+
+def measure_memory_use(data, engine, mode, with_peak=True):
+    """Память, которую занимают агенты после загрузки, и пик при распределении.
+    Отдельный проход: трассировка tracemalloc замедляет замеры времени,
+    а на больших масштабах распределение под ней идет слишком долго"""
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    dispatcher = build_dispatcher(data, engine, mode)
+    gc.collect()
+    loaded = tracemalloc.get_traced_memory()[0] - baseline
+    result = {"bytes_per_order": loaded / len(data["orders"])}
+    if not with_peak:
+        tracemalloc.stop()
+        return result
+    if hasattr(tracemalloc, "reset_peak"):  # Python 3.9+
+        tracemalloc.reset_peak()
+    with quiet():
+        dispatcher.assign_orders()
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    del dispatcher
+    gc.collect()
+    result["peak_mb"] = peak / 2 ** 20
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """Печатает сравнение с эталоном; возвращает список ухудшений"""
+    regressions = []
+    for scale, metrics in results.items():
+        reference = baseline.get(scale)
+        if reference is None:
+            print(f"ℹ️ {scale} заказов: в эталоне нет такого масштаба")
+            continue
+        print(f"\n📏 {scale} заказов")
+        print(f"{'Показатель':<36}{'эталон':>14}{'сейчас':>14}{'разница':>10}")
+        for name, value in metrics.items():
+            if name not in reference:
+                continue
+            label, better = METRICS[name]
+            before = reference[name]
+            change = (value - before) / before if before else 0.0
+            if better == "exact":
+                worse = value != before
+            elif better == "lower":
+                worse = change > tolerance
+            else:
+                worse = change < -tolerance
+            mark = " ❌" if worse else ""
+            print(f"{label:<36}{before:>14.4g}{value:>14.4g}{change * 100:>+9.0f}%{mark}")
+            if worse:
+                regressions.append(f"{scale} заказов: {label} {before:.4g} -> {value:.4g}")
+    return regressions
+
+
+def print_results(results):
+    for scale, metrics in results.items():
+        print(f"\n📏 {scale} заказов")
+        for name, value in metrics.items():
+            print(f"{METRICS[name][0]:<36}{value:>14.4g}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Замеры распределения заказов')
+    parser.add_argument('--scales', type=int, nargs='+', help='Числа заказов')
+    parser.add_argument('--full', action='store_true', help='Все масштабы, включая 10^5 заказов')
+    parser.add_argument('--engine', choices=['python', 'numpy'], default='python', help='Движок распределения')
+    parser.add_argument('--mode', choices=['greedy', 'batch'], default='greedy', help='Режим распределения')
+    parser.add_argument('--repeat', type=int, default=5, help='Повторов замера (берется медиана)')
+    parser.add_argument('--seed', type=int, default=1, help='Зерно генератора данных')
+    parser.add_argument('--no-memory', action='store_true', help='Не измерять память')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='Файл эталона')
+    parser.add_argument('--save-baseline', action='store_true', help='Записать результат как эталон')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Допустимое ухудшение времени (доля) по медиане повторов')
+    args = parser.parse_args()
+
+    config_key = f"{args.engine}/{args.mode}/seed={args.seed}"
+    print(f"Python {platform.python_version()}, {platform.machine()}, {config_key}")
+
+    scales = args.scales or (FULL_SCALES if args.full else DEFAULT_SCALES)
+    results = {}
+    for scale in scales:
+        # Большие масштабы не повторяем: один проход идет минуты
+        repeat = args.repeat if scale <= QUICK_SCALE else 1
+        started = time.perf_counter()
+        results[str(scale)] = run_scale(scale, args.engine, args.mode, repeat, args.seed, not args.no_memory)
+        print(f"⏱️ {scale} заказов: {time.perf_counter() - started:.1f} с")
+
+    stored = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            stored = json.load(f)
+
+    if args.save_baseline:
+        stored.setdefault(config_key, {}).update(results)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(stored, f, ensure_ascii=False, indent=2)
+        print_results(results)
+        print(f"\n💾 Эталон записан: {args.baseline} ({config_key})")
+        return 0
+
+    if config_key not in stored:
+        print_results(results)
+        print(f"\n⚠️ Нет эталона для {config_key}; запишите его флагом --save-baseline")
+        return 0
+
+    regressions = compare(results, stored[config_key], args.tolerance)
+    if regressions:
+        print("\n❌ Ухудшения относительно эталона:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print("\n✅ Ухудшений относительно эталона нет")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
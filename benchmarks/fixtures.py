@@ -0,0 +1,133 @@
+"""Синтетические данные городского масштаба для замеров: курьеры и заказы
+по районам, похожим на Москву. Один и тот же seed дает те же данные.
+
+Данные - в формате input_data.json, их можно и записать в файл для сервера:
+    python benchmarks/fixtures.py --orders 100000 --out backlog.json
+    python server.py --orders backlog.json
+"""
+import argparse
+import json
+import math
+import random
+import time
+from datetime import date
+
+CITY_CENTER = (55.7558, 37.6173)
+KM_PER_DEGREE = 111.2
+
+# Районы: (название, широта, долгота, вес, разброс в км)
+DISTRICTS = (
+    ("Центр", 55.7558, 37.6173, 6, 2.0),
+    ("Москва-Сити", 55.7495, 37.5375, 3, 1.0),
+    ("Черемушки", 55.6700, 37.5530, 2, 1.5),
+    ("Ясенево", 55.6060, 37.5330, 2, 1.5),
+    ("Марьино", 55.6500, 37.7440, 2, 1.5),
+    ("Выхино", 55.7150, 37.8170, 2, 1.5),
+    ("Перово", 55.7500, 37.7850, 2, 1.5),
+    ("Отрадное", 55.8630, 37.6050, 2, 1.5),
+    ("Медведково", 55.8880, 37.6600, 2, 1.5),
+    ("Строгино", 55.8030, 37.4030, 2, 1.5),
+    ("Митино", 55.8450, 37.3620, 1, 1.5),
+    ("Бутово", 55.5450, 37.5700, 1, 2.0),
+)
+BACKGROUND_SHARE = 0.1  # Доля точек, равномерно разбросанных по городу
+CITY_RADIUS_KM = 17.5  # Примерно МКАД
+
+TRANSPORT_MIX = (("foot", 0.2), ("bicycle", 0.35), ("car", 0.3), ("motorcycle", 0.15))
+PRIORITY_MIX = (("high", 0.15), ("normal", 0.65), ("low", 0.2))
+CAPACITIES = {"foot": 10.0, "bicycle": 20.0, "car": 100.0, "motorcycle": 30.0}
+FIXTURE_MINUTE = 10 * 60  # Время суток, на которое рассчитаны окна: 10:00
+COURIERS_PER_ORDER = 0.1
+
+
+def _offset(lat, lon, north_km, east_km):
+    return (round(lat + north_km / KM_PER_DEGREE, 6),
+            round(lon + east_km / (KM_PER_DEGREE * math.cos(math.radians(lat))), 6))
+
+
+def _weighted(rng, mix):
+    value = rng.random()
+    for item, share in mix:
+        value -= share
+        if value < 0:
+            return item
+    return mix[-1][0]
+
+
+def city_point(rng):
+    """Точка в городе: чаще в плотных районах, реже где угодно внутри МКАД"""
+    if rng.random() < BACKGROUND_SHARE:
+        radius = CITY_RADIUS_KM * math.sqrt(rng.random())
+        angle = rng.uniform(0, 2 * math.pi)
+        return _offset(*CITY_CENTER, radius * math.cos(angle), radius * math.sin(angle))
+    _, lat, lon, _, spread = rng.choices(DISTRICTS, weights=[d[3] for d in DISTRICTS])[0]
+    return _offset(lat, lon, rng.gauss(0, spread), rng.gauss(0, spread))
+
+
+def make_couriers(count, seed=1, first_id=1):
+    rng = random.Random(seed)
+    couriers = []
+    for courier_id in range(first_id, first_id + count):
+        transport = _weighted(rng, TRANSPORT_MIX)
+        couriers.append({
+            "id": courier_id,
+            "location": list(city_point(rng)),
+            "transport_type": transport,
+            "max_capacity": CAPACITIES[transport],
+            "name": f"Курьер {courier_id}"
+        })
+    return couriers
+
+
+def make_orders(count, seed=1, first_id=100001):
+    """Заказы с окнами от 09:00 до 20:00 длиной 1-4 часа: к FIXTURE_MINUTE
+    часть окон уже близка к концу, большинство - впереди"""
+    rng = random.Random(seed + 1)
+    orders = []
+    for order_id in range(first_id, first_id + count):
+        start = rng.randint(9, 17)
+        end = min(start + rng.randint(1, 4), 21)
+        orders.append({
+            "id": order_id,
+            "destination": list(city_point(rng)),
+            "weight": round(min(15.0, rng.lognormvariate(0.8, 0.7)), 1),
+            "priority": _weighted(rng, PRIORITY_MIX),
+            "time_window": f"{start:02d}:00-{end:02d}:00",
+            "description": f"Заказ #{order_id}"
+        })
+    return orders
+
+
+def make_fixture(orders, couriers=None, seed=1):
+    """Данные в формате input_data.json; курьеров по умолчанию - десятая часть заказов"""
+    if couriers is None:
+        couriers = max(1, int(orders * COURIERS_PER_ORDER))
+    return {"couriers": make_couriers(couriers, seed), "orders": make_orders(orders, seed)}
+
+
+def pin_created_time(data):
+    """Заказы создаются сегодня в FIXTURE_MINUTE: окна заказа отсчитываются от
+    момента создания (time_windows.order_window), и без этого результат замера
+    зависел бы от времени запуска"""
+    created_time = time.mktime(date.today().timetuple()) + FIXTURE_MINUTE * 60
+    for order in data["orders"]:
+        order["created_time"] = created_time
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Синтетические курьеры и заказы')
+    parser.add_argument('--orders', type=int, default=1000, help='Число заказов')
+    parser.add_argument('--couriers', type=int, help='Число курьеров (по умолчанию десятая часть заказов)')
+    parser.add_argument('--seed', type=int, default=1, help='Зерно генератора')
+    parser.add_argument('--out', default='fixture.json', help='Файл для записи')
+    args = parser.parse_args()
+
+    data = make_fixture(args.orders, args.couriers, args.seed)
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    print(f"✅ {args.out}: курьеров {len(data['couriers'])}, заказов {len(data['orders'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Память на один заказ: OrderAgent со __slots__ и интернированными строками
+против прежнего представления (атрибуты в __dict__, списки координат).
+
+Запуск из корня проекта:
+    python benchmarks/memory_agents.py --orders 200000
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents import OrderAgent, DispatcherAgent  # noqa: E402
+from time_windows import parse_time_window  # noqa: E402
+
+
+class LegacyOrderAgent:
+    """Прежнее представление заказа: обычный объект с __dict__"""
+
+    def __init__(self, order_id, destination, weight, priority, time_window, description=""):
+        self.id = order_id
+        self.destination = destination
+        self.weight = weight
+        self.priority = priority
+        self.time_window = time_window
+        self.window_start, self.window_end = parse_time_window(time_window)
+        self.description = description
+        self._listener = None
+        self._status = "pending"
+        self.assigned_courier = None
+        self.created_time = time.time()
+
+    @property
+    def status(self):
+        return self._status
+
+
+def make_records(count, seed=42):
+    """Заказы в том виде, в каком их отдает json.loads: у каждого свои объекты строк"""
+    rng = random.Random(seed)
+    records = [{
+        "id": i,
+        "destination": [55.75 + rng.uniform(-0.1, 0.1), 37.62 + rng.uniform(-0.1, 0.1)],
+        "weight": round(rng.uniform(0.5, 15), 1),
+        "priority": rng.choice(["high", "normal", "normal", "low"]),
+        "time_window": f"{rng.randint(8, 14)}:00-{rng.randint(15, 21)}:00",
+        "description": f"Заказ #{i}"
+    } for i in range(count)]
+    return json.loads(json.dumps(records, ensure_ascii=False))
+
+
+def measure(factory, count, register):
+    """Байт на заказ, которые остаются после того, как входные записи освобождены"""
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+
+    records = make_records(count)
+    dispatcher = DispatcherAgent() if register else None
+    orders = []
+    for data in records:
+        order = factory(data["id"], data["destination"], data["weight"], data["priority"],
+                        data["time_window"], data.get("description", ""))
+        orders.append(order)
+        if dispatcher is not None:
+            dispatcher.add_order(order)
+    del records, data
+    gc.collect()
+
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    del orders, dispatcher
+    gc.collect()
+    return retained / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Память на один заказ')
+    parser.add_argument('--orders', type=int, default=200000, help='Число заказов')
+    args = parser.parse_args()
+
+    print(f"Заказов: {args.orders}")
+    print(f"{'Вариант':<40}{'байт/заказ':>12}")
+    results = {}
+    for label, factory, register in (
+            ("прежний (__dict__), только объекты", LegacyOrderAgent, False),
+            ("__slots__ + интернирование, только объекты", OrderAgent, False),
+            ("прежний (__dict__), в диспетчере", LegacyOrderAgent, True),
+            ("__slots__ + интернирование, в диспетчере", OrderAgent, True)):
+        results[label] = measure(factory, args.orders, register)
+        print(f"{label:<40}{results[label]:>12.0f}")
+
+    before = results["прежний (__dict__), только объекты"]
+    after = results["__slots__ + интернирование, только объекты"]
+    print(f"Экономия на заказ: {before - after:.0f} байт ({(1 - after / before) * 100:.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""Проверки поведения, которое уже ломалось: каждая - функция check_*.
+
+Функция проходит молча или падает с AssertionError. Код возврата 1,
+если хоть одна проверка не прошла.
+
+Запуск из корня проекта:
+    python benchmarks/regressions.py
+    python benchmarks/regressions.py state_loop   # только проверки с этой подстрокой в имени
+"""
+import asyncio
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents import CourierAgent, DispatcherAgent, OrderAgent  # noqa: E402
+from data_loader import DataLoader, _iter_json_orders  # noqa: E402
+from fixtures import make_fixture, pin_created_time, FIXTURE_MINUTE  # noqa: E402
+from async_server import AsyncCourierServer  # noqa: E402
+from server import CourierServer  # noqa: E402
+from state_loop import StateLoop  # noqa: E402
+from subscriptions import Subscription, courier_topics  # noqa: E402
+from time_windows import DAY_ZERO, MINUTES_PER_DAY, order_window  # noqa: E402
+
+
+def _courier_update(courier_id, status="available"):
+    return {"type": "courier_update", "courier_id": courier_id, "location": [55.75, 37.62],
+            "transport_type": "car", "name": f"Courier_{courier_id}", "status": status}
+
+
+def check_state_loop_survives_cancelled_command():
+    """Отмененная до выполнения команда пропускается, поток состояния живет дальше"""
+    loop = StateLoop(publish=lambda: None)
+    try:
+        started, release = threading.Event(), threading.Event()
+        loop.submit(lambda: (started.set(), release.wait(5)))
+        assert started.wait(5)
+        ran = []
+        future = loop.submit(ran.append, 1)
+        assert future.cancel(), "команда в очереди должна отменяться"
+        release.set()
+        assert loop.call(lambda: 42) == 42
+        assert loop.thread.is_alive()
+        assert not ran, "отмененная команда выполнилась"
+        stats = loop.stats()
+        assert stats["cancelled"] == 1 and stats["errors"] == 0, stats
+    finally:
+        loop.stop()
+
+
+def check_event_loop_not_blocked_by_full_state_queue():
+    """При полной очереди команд цикл событий asyncio продолжает работать"""
+    loop = StateLoop(publish=lambda: None, limit=1)
+    server = type("Server", (), {"state_loop": loop})()
+    try:
+        started, release = threading.Event(), threading.Event()
+        loop.submit(lambda: (started.set(), release.wait(5)))
+        assert started.wait(5)
+        loop.submit(lambda: None)  # Очередь заполнена
+        assert loop.submit_nowait(lambda: None) is None
+
+        async def scenario():
+            ticks = 0
+            submit = asyncio.ensure_future(AsyncCourierServer.submit_command(server, lambda: 7))
+            for _ in range(10):
+                await asyncio.sleep(0.01)
+                ticks += 1
+            assert not submit.done() and ticks == 10, "цикл событий ждал очередь"
+            release.set()
+            return await asyncio.wrap_future(await submit)
+
+        assert asyncio.run(scenario()) == 7
+    finally:
+        release.set()
+        loop.stop()
+
+
+def check_restored_courier_gets_no_orders_before_reconnect():
+    """После восстановления из журнала курьер offline, пока не пришлет courier_update"""
+    directory = tempfile.mkdtemp()
+    try:
+        server = CourierServer(journal_dir=directory, orders_file=None)
+        server.state_loop.call(server._apply_courier_update, _courier_update(1))
+        server.state_loop.call(server.broadcast_system_status)
+        server.shutdown(save=False)
+
+        restored = CourierServer(journal_dir=directory, orders_file=None)
+        try:
+            dispatcher = restored.dispatcher
+            assert dispatcher.couriers[1].status == "offline"
+            order = OrderAgent(1, [55.751, 37.621], 1.0, "normal", "00:00-23:59")
+            restored.state_loop.call(dispatcher.add_order, order)
+            restored.state_loop.call(dispatcher.assign_orders)
+            assert order.status == "pending", "заказ назначен курьеру, который не на связи"
+
+            restored.state_loop.call(restored._apply_courier_update, _courier_update(1))
+            restored.state_loop.call(dispatcher.assign_orders)
+            assert order.assigned_courier == 1
+        finally:
+            restored.shutdown(save=False)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def check_inactive_couriers_expire_without_full_scan():
+    """Истекшие курьеры снимаются с начала очереди активных, статистика - по счетчикам"""
+    server = CourierServer(journal_dir=None, orders_file=None)
+    try:
+        for courier_id in (1, 2, 3):
+            server.state_loop.call(server._apply_courier_update, _courier_update(courier_id))
+        server.state_loop.call(server._apply_courier_update, _courier_update(2, status="busy"))
+        assert list(server.active_courier_ids) == [1, 3, 2], "курьер не перенесен в конец"
+
+        server.active_courier_ids[1] -= 10 ** 6  # Курьер 1 давно не выходил на связь
+
+        def expire():
+            server.expire_inactive_couriers()
+            return server.dispatcher.tracker.next_version()[2]
+
+        assert server.state_loop.call(expire) == {1}
+        assert [c.id for c in server._active_couriers()] == [3, 2]
+
+        server.state_loop.call(server._refresh_statistics)
+        assert server.monitor.statistics["courier_utilization"] == 50
+    finally:
+        server.shutdown(save=False)
+
+
+def check_numpy_engine_matches_python_without_spatial_index():
+    """Матрица оценок назначает так же, как цикл python, если тот оценивает всех курьеров"""
+    import cost_matrix
+    if not cost_matrix.HAS_NUMPY:
+        return
+
+    def assignments(engine):
+        dispatcher = DataLoader.initialize_agents_from_data(pin_created_time(make_fixture(1000, seed=3)))
+        dispatcher.engine = engine
+        dispatcher.use_spatial_index = False  # Матрица индекс не использует
+        dispatcher.clock = lambda: FIXTURE_MINUTE
+        dispatcher.assign_orders()
+        return [(a["order_id"], a["courier_id"]) for a in dispatcher.assignments]
+
+    python_assignments = assignments("python")
+    assert python_assignments, "при этом seed должны быть назначения"
+    assert assignments("numpy") == python_assignments
+
+
+def check_order_stream_skips_other_fields():
+    """Поля кроме "orders" пропускаются по скобкам, при любом разбиении на чтения"""
+    orders = [{"id": i, "description": 'скобки ]}[{ и кавычки \\" в строке'} for i in range(50)]
+    text = json.dumps({"meta": {"notes": ["]\\", {"a": [1, -2.5e3, None]}]}, "orders": orders, "tail": 7})
+    for read_size in (1, 2, 3, 7, 64 * 1024):
+        assert list(_iter_json_orders(io.StringIO(text), read_size)) == orders, read_size
+
+
+def check_order_stream_fails_fast_on_corrupt_field():
+    """Непарная скобка в пропускаемом поле - ошибка сразу, а не после чтения до конца файла"""
+    class CountingFile(io.StringIO):
+        reads = 0
+
+        def read(self, size=-1):
+            self.reads += 1
+            return super().read(size)
+
+    f = CountingFile('{"meta": [1, 2}' + " " * 10 ** 6 + ', "orders": []}')
+    try:
+        list(_iter_json_orders(f, 64 * 1024))
+    except json.JSONDecodeError:
+        assert f.reads == 1, f"файл прочитан {f.reads} раз"
+    else:
+        raise AssertionError("поврежденный JSON разобран без ошибки")
+
+
+def check_courier_subscription_accepts_string_ids():
+    """Подписка курьера по умолчанию работает и для id-строки, и для числа"""
+    server = CourierServer(journal_dir=None, orders_file=None)
+    try:
+        dispatcher = server.dispatcher
+        for courier_id in ("a1", 7):
+            server.state_loop.call(server._apply_courier_update, _courier_update(courier_id))
+        order = OrderAgent(1, [55.751, 37.621], 1.0, "normal", "00:00-23:59")
+        server.state_loop.call(dispatcher.add_order, order)
+        server.state_loop.call(dispatcher._commit_assignment, dispatcher.couriers["a1"], order, 5.0, 1.0)
+
+        subscription = Subscription(courier_topics("a1"))
+        snapshot = subscription.filter_status(dispatcher, 1, [], {}, "normal", "")
+        assert [a["order_id"] for a in snapshot["assignments"]] == [1], snapshot
+
+        other = Subscription(courier_topics(7))
+        assert other.filter_status(dispatcher, 1, [], {}, "normal", "")["assignments"] == []
+        delta = {"seq": 2, "couriers": [], "removed_couriers": [], "orders": [],
+                 "assignments": [{"courier_id": 7, "order_id": 2}], "removed_assignments": [],
+                 "statistics": {}, "traffic": "normal", "timestamp": ""}
+        assert other.filter_delta(delta)["assignments"] == delta["assignments"]
+        assert subscription.filter_delta(delta) is None
+    finally:
+        server.shutdown(save=False)
+
+
+def check_unacked_courier_releases_all_orders():
+    """Без подтверждений курьер offline и без заказов; подключение без
+    assignment_acks не ждет подтверждений"""
+    from config import ASSIGNMENT_PUSH_ATTEMPTS
+    server = CourierServer(journal_dir=None, orders_file=None)
+    try:
+        dispatcher = server.dispatcher
+
+        def connect(handle, acks=None):
+            server.clients[handle] = {"address": handle, "courier_id": None, "subscription": Subscription()}
+            update = _courier_update(1)
+            if acks is not None:
+                update["assignment_acks"] = acks
+            server.handle_courier_update(update, handle)
+
+        server.state_loop.call(connect, "first", True)
+        orders = [OrderAgent(i, [55.751, 37.621], 1.0, "normal", "00:00-23:59") for i in (1, 2)]
+        for order in orders:
+            server.state_loop.call(dispatcher.add_order, order)
+            server.state_loop.call(dispatcher._commit_assignment, dispatcher.couriers[1], order, 5.0, 1.0)
+        assert set(server.pending_acks) == {1, 2}
+
+        server.state_loop.call(connect, "second")  # Переподключение без assignment_acks
+        assert not server.pending_acks, server.pending_acks
+
+        server.state_loop.call(connect, "third", True)
+        server.state_loop.call(server._expect_ack, 1, 1, ASSIGNMENT_PUSH_ATTEMPTS)
+        server.state_loop.call(server._check_assignment_ack, 1, ASSIGNMENT_PUSH_ATTEMPTS)
+        courier = dispatcher.couriers[1]
+        assert courier.status == "offline" and not courier.current_orders
+        assert all(order.assigned_courier is None for order in orders)
+        assert not dispatcher.active_assignments and not server.pending_acks
+    finally:
+        server.shutdown(save=False)
+
+
+def _at_minute(minute):
+    """Момент времени minute минут от полуночи DAY_ZERO"""
+    return time.mktime(DAY_ZERO.timetuple()) + minute * 60
+
+
+def check_time_window_rolls_over_to_next_day():
+    """Окно, закончившееся к созданию заказа, - окно следующих суток"""
+    late_evening = _at_minute(23 * 60 + 50)
+    assert order_window("08:00-10:00", late_evening) == (MINUTES_PER_DAY + 480, MINUTES_PER_DAY + 600)
+    assert order_window("22:00-01:00", late_evening) == (1320, MINUTES_PER_DAY + 60)
+    assert order_window("22:00-01:00", _at_minute(MINUTES_PER_DAY + 30)) == (1320, MINUTES_PER_DAY + 60)
+    assert order_window("08:00-10:00", _at_minute(7 * 60)) == (480, 600)
+
+    order = OrderAgent(1, [55.751, 37.621], 1.0, "normal", "08:00-10:00")
+    order.created_time = late_evening
+    dispatcher = DispatcherAgent(use_spatial_index=False)
+    dispatcher.clock = lambda: 23 * 60 + 55
+    dispatcher.add_courier(CourierAgent(1, [55.75, 37.62], "car", 50.0))
+    dispatcher.add_order(order)
+    dispatcher.assign_orders()
+    assert order.assigned_courier == 1
+    assert dispatcher.late_penalty(order, 30.0) == 0, "заказ на завтра посчитан опоздавшим"
+
+
+def check_early_arrival_waits_for_window_start():
+    """Курьер, приехавший до начала окна, ждет: доставка не раньше начала окна"""
+    import cost_matrix
+    for engine in ("python", "numpy") if cost_matrix.HAS_NUMPY else ("python",):
+        order = OrderAgent(1, [55.751, 37.621], 1.0, "normal", "12:00-14:00")
+        order.created_time = _at_minute(10 * 60)
+        dispatcher = DispatcherAgent(engine=engine, use_spatial_index=False)
+        dispatcher.clock = lambda: 10 * 60
+        dispatcher.add_courier(CourierAgent(1, [55.75, 37.62], "car", 50.0))
+        dispatcher.add_order(order)
+        dispatcher.assign_orders()
+        assert dispatcher.assignments[0]["estimated_time"] == "120.0 мин", (engine, dispatcher.assignments)
+
+
+def main():
+    selected = sys.argv[1] if len(sys.argv) > 1 else ""
+    checks = [(name, function) for name, function in globals().items()
+              if name.startswith("check_") and selected in name]
+    failed = 0
+    for name, function in checks:
+        output = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(output):
+                function()
+        except Exception:
+            failed += 1
+            print(f"❌ {name}\n{traceback.format_exc()}")
+        else:
+            print(f"✅ {name}")
+    print(f"Проверок: {len(checks)}, не прошло: {failed}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
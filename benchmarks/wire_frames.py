@@ -0,0 +1,80 @@
+"""Размер бинарных кадров частых сообщений, которые отправляют клиенты.
+
+Проверяет, что courier_update от CourierClient и генератора нагрузки
+кодируется компактным кадром (TAG_COURIER_UPDATE), а не JSON: лишний
+ключ в сообщении незаметно переводит его на TAG_JSON. Код возврата 1,
+если частое сообщение ушло в JSON.
+
+Запуск из корня проекта:
+    python benchmarks/wire_frames.py
+"""
+import contextlib
+import io
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from client_courier import CourierClient  # noqa: E402
+from load_generator import SimulatedCourier, LoadStats  # noqa: E402
+from wire_protocol import (TAG_COURIER_UPDATE, TAG_ORDER_DELIVERED, TAG_JSON,  # noqa: E402
+                           StreamDecoder, encode_frame)
+
+
+class _CaptureSocket:
+    """Сокет, который запоминает отправленные кадры"""
+
+    def __init__(self):
+        self.frames = []
+
+    def sendall(self, data):
+        self.frames.append(bytes(data))
+
+
+class _Generator:
+    """Минимум генератора нагрузки, нужный SimulatedCourier"""
+
+    def __init__(self):
+        self.stats = LoadStats()
+        self.args = type("Args", (), {"binary": True})()
+
+
+def courier_client_frames():
+    """Кадры CourierClient: регистрация, обновление, доставка"""
+    client = CourierClient(1, name="Иван", location=[55.75, 37.62])
+    client.socket = _CaptureSocket()
+    client.connected = True
+    client.use_binary = True
+    with contextlib.redirect_stdout(io.StringIO()):
+        client.send_courier_update(register=True)
+        client.send_courier_update()
+        client.send_order_delivered(7)
+    registration, update, delivered = client.socket.frames
+    return [("courier_update (регистрация)", registration, TAG_JSON),
+            ("courier_update", update, TAG_COURIER_UPDATE),
+            ("order_delivered", delivered, TAG_ORDER_DELIVERED)]
+
+
+def load_generator_frames():
+    """Кадр обновления местоположения курьера генератора нагрузки"""
+    courier = SimulatedCourier(_Generator(), 1, random.Random(1))
+    return [("courier_update (генератор)", encode_frame(courier.update_message()), TAG_COURIER_UPDATE)]
+
+
+def main():
+    failed = 0
+    for name, frame, expected in courier_client_frames() + load_generator_frames():
+        tag = frame[4]
+        decoder = StreamDecoder()
+        decoder.binary = True
+        decoder.feed(frame)
+        decoded = list(decoder.messages())
+        ok = tag == expected and len(decoded) == 1
+        failed += not ok
+        print(f"{'✅' if ok else '❌'} {name:32} {len(frame):5} Б  тег {tag} (ожидался {expected})")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,10 +4,12 @@ import time
 import random
 import threading
 from config import SERVER_HOST, SERVER_PORT
+from state_sync import StateReplica
+from wire_protocol import StreamDecoder, BINARY_PROTOCOL, encode
 
 
 class CourierClient:
-    def __init__(self, courier_id, name="", location=None, transport_type="car"):
+    def __init__(self, courier_id, name="", location=None, transport_type="car", binary=False, stats=False):
         self.courier_id = courier_id
         self.name = name or f"Courier_{courier_id}"
         self.location = location or [55.75 + random.uniform(-0.01, 0.01),
@@ -16,6 +18,14 @@ class CourierClient:
         self.socket = None
         self.connected = False
         self.assigned_orders = []
+        self.delivered_orders = set()
+        self.replica = StateReplica()  # Локальная копия состояния сервера
+        self.binary = binary  # Запросить бинарный протокол при подключении
+        self.use_binary = False  # Бинарный протокол согласован
+        self.stats = stats  # Подписаться и на общую статистику (по умолчанию - только свои назначения)
+        self.decoder = StreamDecoder()
+        self.protocol_ready = threading.Event()
+        self.send_lock = threading.Lock()
 
     def connect(self):
         """Подключается к серверу"""
@@ -26,35 +36,61 @@ class CourierClient:
             self.connected = True
             print(f"✅ Курьер {self.name} подключен к серверу")
 
-            # Регистрируем курьера на сервере
-            self.send_courier_update()
-
             # Запускаем поток для получения сообщений
             receive_thread = threading.Thread(target=self.receive_messages)
             receive_thread.daemon = True
             receive_thread.start()
 
+            if self.binary:
+                self.negotiate_protocol()
+
+            # Регистрируем курьера на сервере
+            self.send_courier_update(register=True)
+            if self.stats:
+                self.send_message({"type": "subscribe",
+                                   "topics": [f"assignments:{self.courier_id}", "stats"]})
+
             return True
         except Exception as e:
             print(f"❌ Ошибка подключения: {e}")
             return False
 
+    def negotiate_protocol(self, timeout=5.0):
+        """Запрашивает бинарный протокол; без подтверждения остается на JSON"""
+        self.send_message({"type": "hello", "protocol": BINARY_PROTOCOL})
+        if not self.protocol_ready.wait(timeout) or not self.use_binary:
+            print("ℹ️ Сервер не поддерживает бинарный протокол, используется JSON")
+
+    def handle_hello_ack(self, message):
+        """Переключается на бинарные кадры после подтверждения сервера"""
+        if message.get("protocol") == BINARY_PROTOCOL:
+            # Все следующие байты от сервера - кадры
+            self.decoder.binary = True
+            self.use_binary = True
+        self.protocol_ready.set()
+
     def send_message(self, message):
         """Отправляет сообщение на сервер"""
         if not self.connected:
             return False
 
         try:
-            data = json.dumps(message, ensure_ascii=False) + "\n"
-            self.socket.send(data.encode('utf-8'))
+            data = encode(message, self.use_binary)
+            with self.send_lock:
+                self.socket.sendall(data)
             return True
         except Exception as e:
             print(f"❌ Ошибка отправки сообщения: {e}")
             self.connected = False
             return False
 
-    def send_courier_update(self):
-        """Отправляет обновление статуса курьера"""
+    def send_courier_update(self, register=False):
+        """Отправляет обновление статуса курьера.
+
+        При регистрации курьер один раз объявляет, что подтверждает назначения;
+        сервер запоминает это для подключения, а частые обновления остаются
+        компактными кадрами (набор ключей COURIER_UPDATE_KEYS).
+        """
         message = {
             "type": "courier_update",
             "courier_id": self.courier_id,
@@ -63,6 +99,8 @@ class CourierClient:
             "name": self.name,
             "transport_type": self.transport_type
         }
+        if register:
+            message["assignment_acks"] = True  # Подтверждаем назначения, присланные сообщением assignment
 
         return self.send_message(message)
 
@@ -75,26 +113,23 @@ class CourierClient:
         }
 
         if self.send_message(message):
+            self.delivered_orders.add(order_id)
             print(f"✅ Заказ {order_id} отмечен как доставленный")
             return True
         return False
 
     def receive_messages(self):
         """Получает сообщения от сервера"""
-        buffer = ""
         while self.connected:
             try:
-                data = self.socket.recv(4096).decode('utf-8')
+                data = self.socket.recv(4096)
                 if not data:
                     break
 
-                buffer += data
-
-                # Обрабатываем полные сообщения (разделенные \n)
-                while '\n' in buffer:
-                    message_str, buffer = buffer.split('\n', 1)
-                    if message_str.strip():
-                        self.handle_server_message(message_str.strip())
+                # Обрабатываем полные сообщения (строки JSON или бинарные кадры)
+                self.decoder.feed(data)
+                for message in self.decoder.messages():
+                    self.handle_server_message(message)
 
             except socket.timeout:
                 continue
@@ -105,39 +140,82 @@ class CourierClient:
         self.connected = False
         print("🔌 Соединение с сервером разорвано")
 
-    def handle_server_message(self, message_str):
-        """Обрабатывает сообщения от сервера"""
+    def handle_server_message(self, message):
+        """Обрабатывает сообщения от сервера (строку JSON или декодированный кадр)"""
         try:
-            message = json.loads(message_str)
+            if isinstance(message, str):
+                message = json.loads(message)
             msg_type = message.get("type")
 
-            if msg_type == "system_status":
+            if msg_type == "hello_ack":
+                self.handle_hello_ack(message)
+            elif msg_type == "assignment":
+                self.handle_assignment(message)
+            elif msg_type == "system_status":
                 self.handle_system_status(message)
+            elif msg_type == "state_delta":
+                self.handle_state_delta(message)
             elif msg_type == "periodic_update":
                 self.handle_periodic_update(message)
 
         except json.JSONDecodeError as e:
             print(f"❌ Ошибка декодирования JSON: {e}")
 
+    def handle_assignment(self, message):
+        """Назначение, отправленное лично нам: берем в работу и подтверждаем
+        (и повторно присланное - подтверждение могло потеряться)"""
+        self._take_new_assignments([message])
+        self.send_message({"type": "assignment_ack", "courier_id": self.courier_id,
+                           "order_id": message.get("order_id")})
+
     def handle_system_status(self, message):
-        """Обрабатывает статус системы"""
-        # Обновляем список наших заказов
-        assignments = message.get("assignments", [])
-        my_assignments = [a for a in assignments if a.get("courier_id") == self.courier_id]
+        """Обрабатывает полный снимок статуса системы"""
+        self.replica.apply_snapshot(message)
+        self._take_new_assignments(message.get("assignments", []))
+        self._print_statistics()
+
+    def handle_state_delta(self, message):
+        """Применяет дельту состояния к локальной копии"""
+        if not self.replica.apply_delta(message):
+            # Пропущена версия - запрашиваем полный снимок
+            self.send_message({"type": "resync"})
+            return
 
-        # Находим новые заказы
+        # Заказы, снятые с нас или переназначенные (например, после ЧП), больше не везем
+        changed_orders = message.get("removed_assignments", []) + [
+            a.get("order_id") for a in message.get("assignments", [])]
+        for order_id in changed_orders:
+            assignment = self.replica.assignments.get(order_id)
+            if order_id in self.assigned_orders and (
+                    assignment is None or assignment.get("courier_id") != self.courier_id):
+                self.assigned_orders.remove(order_id)
+                print(f"↩️ Заказ {order_id} передан другому курьеру")
+
+        if self._take_new_assignments(message.get("assignments", [])):
+            self._print_statistics()
+
+    def _take_new_assignments(self, assignments):
+        """Добавляет в работу новые назначенные нам заказы"""
         new_orders = []
-        for assignment in my_assignments:
+        for assignment in assignments:
             order_id = assignment.get("order_id")
-            if order_id and order_id not in self.assigned_orders:
+            if (assignment.get("courier_id") == self.courier_id and order_id
+                    and order_id not in self.assigned_orders and order_id not in self.delivered_orders):
                 new_orders.append(order_id)
                 self.assigned_orders.append(order_id)
 
         if new_orders:
             print(f"🎯 Получены новые заказы: {new_orders}")
-
-        # Статистика
-        stats = message.get("statistics", {})
+        return new_orders
+
+    def _print_statistics(self):
+        my_assignments = [a for a in self.replica.assignments.values()
+                          if a.get("courier_id") == self.courier_id]
+        stats = self.replica.statistics
+        if not stats:
+            # Без подписки на stats сервер присылает только наши назначения
+            print(f"📊 Мои заказы: {len(my_assignments)}")
+            return
         pending = stats.get('pending', 0)
         delivered = stats.get('delivered', 0)
 
@@ -208,6 +286,10 @@ def main():
     parser.add_argument('--name', help='Имя курьера')
     parser.add_argument('--transport', choices=['foot', 'bicycle', 'car', 'motorcycle'],
                         default='car', help='Тип транспорта')
+    parser.add_argument('--binary', action='store_true',
+                        help='Использовать компактный бинарный протокол')
+    parser.add_argument('--stats', action='store_true',
+                        help='Получать и общую статистику (больше трафика)')
 
     args = parser.parse_args()
 
@@ -222,7 +304,9 @@ def main():
         courier_id=args.id,
         name=args.name,
         location=location,
-        transport_type=args.transport
+        transport_type=args.transport,
+        binary=args.binary,
+        stats=args.stats
     )
 
     if courier.connect():
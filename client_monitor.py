@@ -4,17 +4,33 @@ import time
 import threading
 from datetime import datetime
 from config import SERVER_HOST, SERVER_PORT
+from state_sync import StateReplica
+from wire_protocol import StreamDecoder, BINARY_PROTOCOL, encode
 
 
 class MonitorClient:
-    def __init__(self, server_host=SERVER_HOST, server_port=SERVER_PORT):
+    def __init__(self, server_host=SERVER_HOST, server_port=SERVER_PORT, binary=False):
         self.server_host = server_host
         self.server_port = server_port
         self.socket = None
         self.connected = False
         self.buffer = ""
         self.auto_refresh = False
-        self.last_status = None
+        self.replica = StateReplica()  # Локальная копия состояния сервера
+        self.binary = binary  # Запросить бинарный протокол при подключении
+        self.use_binary = False  # Бинарный протокол согласован
+        self.decoder = StreamDecoder()
+        self.protocol_ready = threading.Event()
+        self.send_lock = threading.Lock()
+        self.last_metrics = None  # Последний ответ на get_metrics
+        self.metrics_ready = threading.Event()
+
+    @property
+    def last_status(self):
+        """Последнее известное состояние системы в формате system_status"""
+        if self.replica.seq is None:
+            return None
+        return self.replica.to_status()
 
     def connect(self):
         """Подключается к серверу"""
@@ -30,19 +46,37 @@ class MonitorClient:
             receive_thread.daemon = True
             receive_thread.start()
 
+            if self.binary:
+                self.negotiate_protocol()
+
             return True
         except Exception as e:
             print(f"❌ Ошибка подключения к {self.server_host}:{self.server_port}: {e}")
             return False
 
+    def negotiate_protocol(self, timeout=5.0):
+        """Запрашивает бинарный протокол; без подтверждения остается на JSON"""
+        self.send_message({"type": "hello", "protocol": BINARY_PROTOCOL})
+        if not self.protocol_ready.wait(timeout) or not self.use_binary:
+            print("ℹ️ Сервер не поддерживает бинарный протокол, используется JSON")
+
+    def handle_hello_ack(self, message):
+        """Переключается на бинарные кадры после подтверждения сервера"""
+        if message.get("protocol") == BINARY_PROTOCOL:
+            # Все следующие байты от сервера - кадры
+            self.decoder.binary = True
+            self.use_binary = True
+        self.protocol_ready.set()
+
     def send_message(self, message):
         """Отправляет сообщение на сервер"""
         if not self.connected:
             return False
 
         try:
-            data = json.dumps(message, ensure_ascii=False) + "\n"
-            self.socket.send(data.encode('utf-8'))
+            data = encode(message, self.use_binary)
+            with self.send_lock:
+                self.socket.sendall(data)
             return True
         except Exception as e:
             print(f"❌ Ошибка отправки сообщения: {e}")
@@ -60,22 +94,25 @@ class MonitorClient:
             return self.last_status
         return None
 
+    def request_metrics(self, timeout=5.0):
+        """Запрашивает метрики сервера и ждет ответа"""
+        self.metrics_ready.clear()
+        if self.send_message({"type": "get_metrics"}) and self.metrics_ready.wait(timeout):
+            return self.last_metrics
+        return None
+
     def receive_messages(self):
         """Получает сообщения от сервера"""
-        buffer = ""
         while self.connected:
             try:
-                data = self.socket.recv(8192).decode('utf-8')
+                data = self.socket.recv(8192)
                 if not data:
                     break
 
-                buffer += data
-
-                # Обрабатываем полные сообщения (разделенные \n)
-                while '\n' in buffer:
-                    message_str, buffer = buffer.split('\n', 1)
-                    if message_str.strip():
-                        self.handle_server_message(message_str.strip())
+                # Обрабатываем полные сообщения (строки JSON или бинарные кадры)
+                self.decoder.feed(data)
+                for message in self.decoder.messages():
+                    self.handle_server_message(message)
 
             except socket.timeout:
                 continue
@@ -86,16 +123,24 @@ class MonitorClient:
         self.connected = False
         print("🔌 Соединение с сервером разорвано")
 
-    def handle_server_message(self, message_str):
-        """Обрабатывает сообщения от сервера"""
+    def handle_server_message(self, message):
+        """Обрабатывает сообщения от сервера (строку JSON или декодированный кадр)"""
         try:
-            message = json.loads(message_str)
+            if isinstance(message, str):
+                message = json.loads(message)
             msg_type = message.get("type")
 
-            if msg_type == "system_status":
-                self.last_status = message
-                if self.auto_refresh:
-                    self.display_status(message)
+            if msg_type == "hello_ack":
+                self.handle_hello_ack(message)
+            elif msg_type == "system_status":
+                self.replica.apply_snapshot(message)
+            elif msg_type == "state_delta":
+                if not self.replica.apply_delta(message):
+                    # Пропущена версия - запрашиваем полный снимок
+                    self.send_message({"type": "resync"})
+            elif msg_type == "metrics":
+                self.last_metrics = message
+                self.metrics_ready.set()
             elif msg_type == "periodic_update":
                 # Автообновление статистики
                 stats = message.get("statistics", {})
@@ -213,6 +258,69 @@ class MonitorClient:
         print("=" * 70)
         return True
 
+    def display_metrics(self, metrics):
+        """Отображает метрики сервера: задержки по видам работы и счетчики"""
+        if not metrics:
+            print("❌ Сервер не прислал метрики")
+            return False
+
+        print("\n" + "=" * 86)
+        print(f"⏱️ МЕТРИКИ СЕРВЕРА - {datetime.now().strftime('%H:%M:%S')} "
+              f"(работает {metrics.get('uptime', 0):.0f} с, клиентов {metrics.get('clients', 0)})")
+        print("=" * 86)
+        if not metrics.get("enabled", True):
+            print("   ⚠️ Сбор метрик выключен (METRICS_ENABLED)")
+
+        latency = metrics.get("latency", {})
+        print(f"{'Операция':<34}{'число':>9}{'сред.':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'макс.':>9}  мс")
+        for name in sorted(latency):
+            item = latency[name]
+            print(f"{name:<34}{item['count']:>9}{item['avg_ms']:>9.2f}{item['p50_ms']:>9.2f}"
+                  f"{item['p90_ms']:>9.2f}{item['p99_ms']:>9.2f}{item['max_ms']:>9.2f}")
+
+        counters = metrics.get("counters", {})
+        if counters:
+            print("\n📈 СЧЕТЧИКИ:")
+            for name in sorted(counters):
+                print(f"   {name}: {counters[name]}")
+
+        fanout = metrics.get("fanout", {})
+        if fanout:
+            print(f"\n📡 РАССЫЛКА: {fanout.get('broadcasts', 0)} рассылок, "
+                  f"сериализовано {fanout.get('serialized_bytes', 0)} байт, "
+                  f"отправлено {fanout.get('sent_bytes', 0)} байт, "
+                  f"заменено {fanout.get('coalesced', 0)}, отброшено {fanout.get('dropped', 0)}")
+
+        state = metrics.get("state", {})
+        if state:
+            print(f"🧵 ПОТОК СОСТОЯНИЯ: команд {state.get('commands', 0)}, пачек {state.get('batches', 0)} "
+                  f"(в среднем {state.get('batch_avg', 0):.1f}, макс. {state.get('batch_max', 0)}), "
+                  f"в очереди {state.get('queue', 0)} (макс. {state.get('queue_max', 0)}), "
+                  f"рассылок {state.get('publishes', 0)}, ошибок {state.get('errors', 0)}")
+
+        scheduler = metrics.get("scheduler", {})
+        if scheduler:
+            print(f"🎯 ПЛАНИРОВЩИК: проходов {scheduler.get('passes', 0)}, "
+                  f"поводов на проход {scheduler.get('absorbed_avg', 0):.1f}, "
+                  f"задержка {scheduler.get('latency_avg_ms', 0):.0f} мс "
+                  f"(макс. {scheduler.get('latency_max_ms', 0):.0f})")
+
+        shards = metrics.get("shards")
+        if shards:
+            print(f"🧩 РЕГИОНЫ: процессов {shards.get('shards', 0)}, проходов {shards.get('passes', 0)} "
+                  f"(в сервере {shards.get('local_passes', 0)}), назначено {shards.get('committed', 0)} "
+                  f"из {shards.get('proposals', 0)} предложений, передано соседям {shards.get('handed_off', 0)} "
+                  f"(назначено {shards.get('handoff_committed', 0)}), курьеров по регионам "
+                  f"{shards.get('shard_couriers', [])}, перестроений {shards.get('rebalances', 0)}")
+
+        pool = metrics.get("pool")
+        if pool:
+            print(f"🧮 ПУЛ РАСЧЕТА: процессов {pool.get('workers', 0)}, проходов {pool.get('passes', 0)}, "
+                  f"назначено {pool.get('committed', 0)} из {pool.get('proposals', 0)} предложений, "
+                  f"устарело {pool.get('stale_couriers', 0)}, заказ уже занят {pool.get('taken_orders', 0)}")
+        print("=" * 86)
+        return True
+
     def start_auto_refresh(self, interval=5):
         """Запускает автоматическое обновление статуса"""
         if not self.connected:
@@ -224,8 +332,8 @@ class MonitorClient:
 
         try:
             while self.connected and self.auto_refresh:
-                # Запрашиваем статус
-                self.send_message({"type": "get_status"})
+                # Реплика обновляется дельтами от сервера, запрашивать снимок не нужно
+                self.display_status(self.last_status)
                 time.sleep(interval)
 
         except KeyboardInterrupt:
@@ -246,9 +354,8 @@ class MonitorClient:
         print("\n🎮 ИНТЕРАКТИВНЫЙ РЕЖИМ УПРАВЛЕНИЯ")
         self.show_help()
 
-        # Показываем начальный статус
+        # Показываем начальный статус (снимок приходит сразу после подключения)
         print("\n🔄 Получаем текущий статус...")
-        self.send_message({"type": "get_status"})
         time.sleep(1)
         if self.last_status:
             self.display_status(self.last_status)
@@ -260,19 +367,21 @@ class MonitorClient:
                 if command in ["quit", "exit", "q"]:
                     break
                 elif command == "status":
-                    print("🔄 Обновление статуса...")
-                    self.send_message({"type": "get_status"})
-                    time.sleep(0.5)
+                    # Реплика актуальна благодаря дельтам от сервера
                     if self.last_status:
                         self.display_status(self.last_status)
                     else:
                         print("❌ Не удалось получить статус")
+                elif command == "metrics":
+                    self.display_metrics(self.request_metrics())
                 elif command == "traffic":
                     self.handle_traffic_command()
                 elif command == "emergency":
                     self.handle_emergency_command()
                 elif command == "add_order":
                     self.add_test_order()
+                elif command == "add_batch":
+                    self.add_orders_from_file()
                 elif command == "auto_on":
                     self.start_auto_refresh_in_thread()
                 elif command == "auto_off":
@@ -295,9 +404,11 @@ class MonitorClient:
         """Показывает справку по командам"""
         print("\n📋 ДОСТУПНЫЕ КОМАНДЫ:")
         print("  status    - показать текущий статус системы")
+        print("  metrics   - показать метрики сервера (задержки, рассылка)")
         print("  traffic   - изменить состояние трафика")
         print("  emergency - сообщить о ЧП")
         print("  add_order - добавить тестовый заказ")
+        print("  add_batch - отправить пачку заказов из JSON файла")
         print("  auto_on   - включить автообновление (каждые 5 сек)")
         print("  auto_off  - выключить автообновление")
         print("  help      - показать эту справку")
@@ -366,11 +477,33 @@ class MonitorClient:
 
         if self.send_message(order_data):
             print(f"✅ Добавлен тестовый заказ #{order_id}")
-            # Запрашиваем обновленный статус
-            self.send_message({"type": "get_status"})
         else:
             print("❌ Ошибка добавления заказа")
 
+    def add_orders_from_file(self, filename=None):
+        """Отправляет заказы из JSON файла одной пачкой (new_orders_batch).
+
+        Файл - список заказов или объект с ключом "orders", как input_data.json.
+        """
+        filename = filename or input("📁 Файл с заказами: ").strip()
+        try:
+            with open(filename, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"❌ Ошибка чтения файла {filename}: {e}")
+            return False
+
+        orders = data.get("orders", []) if isinstance(data, dict) else data
+        if not orders:
+            print("❌ В файле нет заказов")
+            return False
+
+        if self.send_message({"type": "new_orders_batch", "orders": orders}):
+            print(f"✅ Отправлена пачка из {len(orders)} заказов")
+            return True
+        print("❌ Ошибка отправки пачки заказов")
+        return False
+
     def start_auto_refresh_in_thread(self):
         """Запускает автообновление в отдельном потоке"""
         import threading
@@ -397,10 +530,12 @@ def main():
     parser = argparse.ArgumentParser(description='Клиент мониторинга системы доставки')
     parser.add_argument('--host', default=SERVER_HOST, help='Адрес сервера')
     parser.add_argument('--port', type=int, default=SERVER_PORT, help='Порт сервера')
+    parser.add_argument('--binary', action='store_true',
+                        help='Использовать компактный бинарный протокол')
 
     args = parser.parse_args()
 
-    monitor = MonitorClient(server_host=args.host, server_port=args.port)
+    monitor = MonitorClient(server_host=args.host, server_port=args.port, binary=args.binary)
 
     if monitor.connect():
         try:
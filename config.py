@@ -2,12 +2,96 @@
 SERVER_HOST = "localhost"  # Для локального запуска
 SERVER_PORT = 8000
 BUFFER_SIZE = 4096
+SERVER_BACKLOG = 1024  # Очередь входящих подключений (тысячи курьеров подключаются разом)
+
+# Модель сервера: "threaded" (поток на клиента) или "asyncio" (один цикл событий)
+SERVER_MODE = "threaded"
+PERIODIC_INTERVAL = 10  # Период фоновых задач сервера, сек
+COURIER_ACTIVE_TIMEOUT = 300  # Курьер без обновлений дольше этого срока не показывается, сек
+ASYNC_READ_LIMIT = 16 * 1024 * 1024  # Максимальная длина одного сообщения, байт
+
+# Поток состояния (state_loop.py): обработчики ставят команды в очередь,
+# один поток применяет их пачками и делает одну рассылку на пачку
+STATE_QUEUE_LIMIT = 10000  # Команд в очереди; при переполнении обработчики ждут
+STATE_BATCH_LIMIT = 500  # Максимум команд в одной пачке
+
+# Подписки клиентов на темы (subscriptions.py). Первый снимок новому клиенту уходит
+# с задержкой: курьер успевает представиться и получает только свои назначения
+CONNECT_SNAPSHOT_DELAY = 0.2  # сек
+
+# Назначения отправляются курьеру отдельным сообщением assignment сразу после
+# закрепления; курьер, объявивший assignment_acks, подтверждает их assignment_ack
+ASSIGNMENT_ACK_TIMEOUT = 5.0  # Ожидание подтверждения до повторной отправки, сек
+ASSIGNMENT_PUSH_ATTEMPTS = 3  # Отправок без подтверждения до перераспределения заказов курьера
+
+# Метрики сервера (metrics.py): счетчики и гистограммы задержек, запрос get_metrics
+METRICS_ENABLED = True
+
+# Рассылка клиентам
+FANOUT_QUEUE_LIMIT = 256  # Максимум сообщений в очереди отправки одного клиента
+SLOW_CONSUMER_POLICY = "coalesce"  # "coalesce" (заменить свежим снимком) или "disconnect"
+
+# Потоковая загрузка заказов из больших файлов (NDJSON или JSON)
+ORDER_STREAM_CHUNK = 1000  # Заказов в одной пачке
+ORDER_STREAM_READ_SIZE = 64 * 1024  # Размер чтения из файла, символов
+
+# Журнал состояния: восстановление после сбоя без потери заказов и назначений
+JOURNAL_ENABLED = False  # По умолчанию выключен; включается флагом server.py --journal
+JOURNAL_DIR = "journal"  # Каталог журнала и снимков
+JOURNAL_FLUSH_INTERVAL = 0.02  # Окно групповой фиксации (один fsync на окно), сек
+JOURNAL_SNAPSHOT_EVERY = 1000  # Снимок после стольких записанных версий
 
 # Параметры алгоритма распределения
 MAX_ORDERS_PER_COURIER = 5
 TIME_WINDOW_PENALTY = 1000
 PRIORITY_WEIGHT = 2.0
 
+# Составляющие оценки пары курьер-заказ
+PRIORITY_BONUSES = {"high": -50, "normal": 0, "low": 20}
+PRIORITY_RANKS = {"high": 0, "normal": 1, "low": 2}
+LOAD_PENALTY_FACTOR = 0.1
+
+# Движок расчета оценок: "python" (цикл по парам) или "numpy" (матрица оценок)
+DISPATCH_ENGINE = "python"
+
+# Геодезические расстояния (geo.py)
+GEO_REFERENCE_LATITUDE = 55.75  # Широта города для проекции сетки (Москва)
+GEO_CACHE_SIZE = 200000  # Пар точек в LRU-кэше расстояний
+GEO_CACHE_PRECISION = 5  # Знаков после запятой при округлении координат (~1 м)
+
+# Маршруты курьеров с несколькими заказами (route_planner.py)
+ROUTE_OPTIMIZATION_BUDGET = 0.002  # Лимит времени 2-opt на одну вставку, сек
+
+# Пространственный индекс курьеров
+USE_SPATIAL_INDEX = True
+SPATIAL_CELL_SIZE = 0.01  # Размер ячейки сетки в градусах широты (~1 км)
+SPATIAL_CANDIDATES_K = 8  # Сколько ближайших курьеров оценивать для заказа
+INCREMENTAL_ORDER_CANDIDATES = 10  # Сколько ближайших заказов проверять для освободившегося курьера
+
+# Планировщик распределения: поводы (новые заказы, освободившиеся курьеры)
+# объединяются в один проход за окно; 0 - распределять сразу
+DISPATCH_WINDOW = 0.2  # Окно накопления поводов, сек
+HIGH_PRIORITY_MAX_LATENCY = 0.05  # Максимальное ожидание для срочных заказов и ЧП, сек
+
+# Распределение по регионам города в отдельных процессах (sharding.py)
+DISPATCH_SHARDS = 0  # Число процессов-регионов; 0 или 1 - распределение в процессе сервера
+SHARD_BORDER_KM = 1.0  # Заказ ближе к границе региона может быть передан соседнему региону
+SHARD_MIN_ORDERS = 200  # Проходы с меньшим числом заказов выполняются в процессе сервера
+SHARD_REBALANCE_RATIO = 1.5  # Регионы строятся заново, если в одном курьеров больше этой доли от среднего
+SHARD_REBALANCE_MIN_PASSES = 20  # Не чаще, чем раз в столько проходов по регионам
+
+# Расчет назначений в пуле процессов по снимку состояния (dispatch_pool.py):
+# сервер не держит блокировку состояния, пока идет расчет
+DISPATCH_POOL_WORKERS = 0  # Процессов в пуле; 0 - проходы выполняются в процессе сервера
+DISPATCH_POOL_MIN_ORDERS = 200  # Проходы с меньшим числом заказов выполняются на месте
+DISPATCH_POOL_MOVE_TOLERANCE_KM = 0.5  # Сдвиг курьера после снимка, при котором предложение еще закрепляется
+
+# Режим распределения: "greedy" (по одному заказу) или "batch" (оптимум по всем заказам)
+ASSIGNMENT_MODE = "greedy"
+BATCH_TIME_BUDGET = 0.5  # Лимит времени пакетного режима, сек
+# Штраф за оставленный без курьера заказ в пакетном режиме
+BATCH_UNASSIGNED_COSTS = {"high": 2000, "normal": 1000, "low": 500}
+
 # Типы транспорта и их скорости (км/ч)
 TRANSPORT_SPEEDS = {
     "foot": 5,
@@ -0,0 +1,187 @@
+"""Векторизованный расчет матрицы оценок курьер×заказ (NumPy)"""
+import geo
+from time_windows import window_penalty
+from config import MAX_ORDERS_PER_COURIER, PRIORITY_BONUSES, LOAD_PENALTY_FACTOR
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:  # NumPy - необязательная зависимость
+    np = None
+    HAS_NUMPY = False
+
+
+def build_time_matrix(couriers, orders, traffic_factor=1.0):
+    """Матрица времени доставки в минутах размером курьеры × заказы"""
+    speeds = np.array([c.speed for c in couriers], dtype=np.float64)
+
+    # То же расстояние, что и DispatcherAgent.calculate_distance, но для всех пар сразу
+    distance = geo.distance_matrix([c.location for c in couriers], [o.destination for o in orders])
+
+    return (distance / speeds[:, None]) * 60 * traffic_factor
+
+
+class _DistanceRows:
+    """Расстояния от точек маршрутов до заказов.
+
+    Остановки не меняют положения за проход, поэтому строка для точки
+    считается один раз; после назначения новой считается только строка
+    вставленного заказа.
+    """
+
+    def __init__(self, destinations):
+        self.destinations = geo.radians(destinations)
+        self.rows = {}  # {точка: (первый столбец, строка расстояний)}
+
+    def from_column(self, start):
+        """Функция точка -> расстояния до заказов с номера start"""
+        def distances_from(point):
+            cached = self.rows.get(point)
+            if cached is None or cached[0] > start:
+                cached = self.rows[point] = (start, geo.haversine_matrix(geo.radians(point),
+                                                                         self.destinations[start:])[0])
+            return cached[1][start - cached[0]:]
+        return distances_from
+
+    def for_columns(self, columns):
+        """Функция точка -> расстояния до заказов с номерами columns (по возрастанию)"""
+        suffix = self.from_column(int(columns[0]))
+        offsets = columns - columns[0]
+        return lambda point: suffix(point)[offsets]
+
+
+def _route_times(routes, courier, distances_from, traffic_factor):
+    """Время удлинения маршрута и время до заказа по маршруту, мин"""
+    extra, route_distance = routes.evaluate_many(courier, distances_from)
+    scale = 60 * traffic_factor
+    return (extra / courier.speed) * scale, (route_distance / courier.speed) * scale
+
+
+def greedy_assign(couriers, orders, traffic_factor=1.0, routes=None, commit=None, current_minute=None):
+    """Жадное распределение по матрице оценок.
+
+    Заказы обрабатываются в переданном порядке, для каждого выбирается курьер
+    с минимальной оценкой среди допустимых. Загрузка, число заказов и статус
+    курьеров пересчитываются в массивах после каждого назначения, поэтому
+    результат совпадает с циклом DispatcherAgent.assign_orders при
+    use_spatial_index=False. С индексом python-движок оценивает только
+    SPATIAL_CANDIDATES_K ближайших курьеров, а матрица - всех переданных,
+    и назначения могут расходиться.
+
+    routes - RoutePlanner диспетчера: тогда оценка строится по удлинению
+    маршрута курьера, как в DispatcherAgent.score_assignment. commit(курьер,
+    заказ, время доставки, оценка) вызывается сразу после выбора пары, чтобы
+    маршрут обновился до оценки следующих заказов; строка курьера в матрице
+    затем пересчитывается.
+
+    current_minute - время прохода в минутах (см. time_windows): пары, которые
+    не успевают к концу окна заказа, получают window_penalty, а заказы,
+    к которым не успевает лучший курьер, распределяются после остальных
+    (как в DispatcherAgent._assign_orders_python). Ожидание начала окна
+    прибавляется ко времени доставки, как в DispatcherAgent.early_wait.
+    Возвращает список (курьер, заказ, время доставки, оценка).
+    """
+    if not couriers or not orders:
+        return []
+
+    time_matrix = build_time_matrix(couriers, orders, traffic_factor)
+    delivery_matrix = time_matrix
+    rows = None
+    if routes is not None:
+        # Для курьера без заказов удлинение маршрута - это путь до заказа
+        delivery_matrix = time_matrix.copy()
+        rows = _DistanceRows([o.destination for o in orders])
+        for i, courier in enumerate(couriers):
+            if courier.current_orders:
+                time_matrix[i], delivery_matrix[i] = _route_times(routes, courier, rows.from_column(0),
+                                                                  traffic_factor)
+
+    bonuses = np.array([PRIORITY_BONUSES.get(o.priority, 0) for o in orders], dtype=np.float64)
+    base_scores = time_matrix + bonuses[None, :]
+    window_starts = np.array([o.window_start for o in orders], dtype=np.float64)
+    window_ends = np.array([o.window_end for o in orders], dtype=np.float64)
+    penalties = np.array([window_penalty(o) for o in orders], dtype=np.float64)
+
+    load = np.array([c.current_capacity for c in couriers], dtype=np.float64)
+    max_capacity = np.array([c.max_capacity for c in couriers], dtype=np.float64)
+    order_counts = np.array([len(c.current_orders) for c in couriers], dtype=np.int64)
+    available = np.array([c.status == "available" for c in couriers], dtype=bool)
+    available &= order_counts < MAX_ORDERS_PER_COURIER
+
+    def refresh(i, columns, distances_from):
+        """Маршрут курьера i изменился - пересчитываем его строку для столбцов columns"""
+        time_matrix[i, columns], delivery_matrix[i, columns] = _route_times(
+            routes, couriers[i], distances_from, traffic_factor)
+        base_scores[i, columns] = time_matrix[i, columns] + bonuses[columns]
+
+    def choose(j):
+        """(курьер, оценка, опоздание) с минимальной оценкой для заказа j или None"""
+        feasible = available & (load + orders[j].weight <= max_capacity)
+        if not feasible.any():
+            return None
+        scores = base_scores[:, j] + load * LOAD_PENALTY_FACTOR
+        late = None
+        if current_minute is not None:
+            late = current_minute + delivery_matrix[:, j] > window_ends[j]
+            scores = scores + np.where(late, penalties[j], 0.0)
+        scores = np.where(feasible, scores, np.inf)
+        i = int(np.argmin(scores))
+        return i, float(scores[i]), late is not None and bool(late[i])
+
+    def accept(i, j, score):
+        delivery_time = float(delivery_matrix[i, j])
+        if current_minute is not None:
+            delivery_time += max(0.0, float(window_starts[j]) - current_minute - delivery_time)  # Ожидание начала окна
+        match = (couriers[i], orders[j], delivery_time, score)
+        matches.append(match)
+        if commit is not None:
+            commit(*match)
+
+        # Повторяем изменения, которые внесет CourierAgent.accept_order
+        load[i] += orders[j].weight
+        order_counts[i] += 1
+        if order_counts[i] >= MAX_ORDERS_PER_COURIER:
+            available[i] = False
+
+    matches = []
+    late_columns = []
+    for j in range(len(orders)):
+        if not available.any():
+            return matches
+        if current_minute is not None and window_ends[j] < current_minute:
+            late_columns.append(j)  # Окно уже закрылось - опоздает любой курьер
+            continue
+        choice = choose(j)
+        if choice is None:
+            continue
+        i, score, late = choice
+        if late:
+            late_columns.append(j)
+            continue
+        accept(i, j, score)
+        if routes is not None and available[i] and j + 1 < len(orders):
+            refresh(i, slice(j + 1, None), rows.from_column(j + 1))
+
+    if not late_columns:
+        return matches
+
+    # Отложенные заказы: строки курьеров, чьи маршруты изменились, устарели
+    late_columns = np.array(late_columns)
+    if routes is not None:
+        for i, courier in enumerate(couriers):
+            if available[i] and courier.current_orders:
+                refresh(i, late_columns, rows.for_columns(late_columns))
+
+    for n, j in enumerate(late_columns.tolist()):
+        if not available.any():
+            break
+        choice = choose(j)
+        if choice is None:
+            continue
+        i, score, _ = choice
+        accept(i, j, score)
+        rest = late_columns[n + 1:]
+        if routes is not None and available[i] and len(rest):
+            refresh(i, rest, rows.for_columns(rest))
+
+    return matches
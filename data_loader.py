@@ -1,7 +1,9 @@
 import json
 import os
-from typing import Dict, Any
+import re
+from typing import Dict, Any, Iterator, List
 from agents import CourierAgent, OrderAgent
+from config import ORDER_STREAM_CHUNK, ORDER_STREAM_READ_SIZE
 
 
 class DataLoader:
@@ -19,6 +21,40 @@ class DataLoader:
             print(f"Ошибка чтения JSON: {e}")
             return DataLoader.get_default_data()
 
+    @staticmethod
+    def iter_order_chunks(filename: str, chunk_size: int = ORDER_STREAM_CHUNK,
+                          read_size: int = ORDER_STREAM_READ_SIZE) -> Iterator[List[Dict[str, Any]]]:
+        """Потоково читает заказы из файла и отдает их пачками по chunk_size.
+
+        Поддерживаются NDJSON (.ndjson/.jsonl, один заказ на строку), массив
+        заказов верхнего уровня и объект с ключом "orders" (как input_data.json).
+        Файл разбирается по частям, в памяти одновременно не больше одной пачки.
+        """
+        try:
+            f = open(filename, 'r', encoding='utf-8')
+        except FileNotFoundError:
+            print(f"Файл {filename} не найден. Используются данные по умолчанию.")
+            yield DataLoader.get_default_data()["orders"]
+            return
+
+        with f:
+            if filename.endswith((".ndjson", ".jsonl")):
+                records = _iter_ndjson(f)
+            else:
+                records = _iter_json_orders(f, read_size)
+
+            chunk = []
+            try:
+                for record in records:
+                    chunk.append(record)
+                    if len(chunk) >= chunk_size:
+                        yield chunk
+                        chunk = []
+            except json.JSONDecodeError as e:
+                print(f"Ошибка чтения JSON: {e}")
+            if chunk:
+                yield chunk
+
     @staticmethod
     def get_default_data() -> Dict[str, Any]:
         """Возвращает данные по умолчанию"""
@@ -85,7 +121,8 @@ class DataLoader:
                 weight=order_data["weight"],
                 priority=order_data["priority"],
                 time_window=order_data["time_window"],
-                description=order_data.get("description", "")
+                description=order_data.get("description", ""),
+                created_time=order_data.get("created_time")  # Окно считается от суток создания
             )
             dispatcher.add_order(order)
 
@@ -110,4 +147,168 @@ class DataLoader:
             print(f"Ошибка сохранения результатов: {e}")
 
 
+def _iter_ndjson(f):
+    """Заказы из NDJSON: по одному объекту на строку"""
+    for line in f:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+_STRUCTURE = re.compile(r'[][{}"]')  # Скобки и начало строки
+_STRING_END = re.compile(r'["\\]')  # Конец строки или экранирование
+_SCALAR_END = re.compile(r'[,\]}\s]')  # Конец числа, true, false, null
+_OPENING = {"]": "[", "}": "{"}
+
+
+class _JSONStream:
+    """Инкрементальный разбор JSON из файла: буфер дочитывается по мере надобности"""
+
+    def __init__(self, f, read_size):
+        self.f = f
+        self.read_size = read_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _read_more(self):
+        data = self.f.read(self.read_size)
+        if not data:
+            self.eof = True
+            return False
+        # Разобранная часть буфера больше не нужна
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Следующий значащий символ (пробелы пропускаются) или "" в конце файла"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._read_more():
+                return ""
+
+    def expect(self, chars):
+        char = self.peek()
+        if char not in chars:
+            raise json.JSONDecodeError(f"ожидался один из символов {chars!r}", self.buffer, self.pos)
+        self.pos += 1
+        return char
+
+    def _read_on(self, i, keep):
+        """Дочитывает буфер посреди значения: возвращает позицию i в новом буфере
+        или None в конце файла. keep=False - просмотренное отбрасывается"""
+        if not keep:
+            self.pos = i
+        start = self.pos
+        if not self._read_more():
+            return None
+        return i - start
+
+    def _value_end(self, keep):
+        """Конец значения, которое начинается с pos.
+
+        Строки и скобки просматриваются без разбора, после дочитывания - с места
+        остановки, поэтому время линейно от размера значения. Непарная скобка
+        обнаруживается сразу, а не в конце файла.
+        """
+        if not self.peek():
+            raise json.JSONDecodeError("ожидалось значение", self.buffer, self.pos)
+        i = self.pos
+        if self.buffer[i] not in '[{"':
+            while True:
+                match = _SCALAR_END.search(self.buffer, i)
+                if match is not None:
+                    return match.start()
+                i = self._read_on(len(self.buffer), keep)
+                if i is None:
+                    return len(self.buffer)
+
+        stack = []
+        in_string = False
+        while True:
+            buffer = self.buffer
+            while i < len(buffer):
+                if in_string:
+                    match = _STRING_END.search(buffer, i)
+                    if match is None:
+                        i = len(buffer)
+                        break
+                    if match.group() == "\\":
+                        if match.end() == len(buffer):
+                            i = match.start()  # Экранированный символ еще не прочитан
+                            break
+                        i = match.end() + 1
+                        continue
+                    in_string = False
+                    i = match.end()
+                else:
+                    match = _STRUCTURE.search(buffer, i)
+                    if match is None:
+                        i = len(buffer)
+                        break
+                    char = match.group()
+                    i = match.end()
+                    if char == '"':
+                        in_string = True
+                    elif char in "[{":
+                        stack.append(char)
+                    elif not stack or stack.pop() != _OPENING[char]:
+                        raise json.JSONDecodeError("непарная скобка", buffer, match.start())
+                if not stack and not in_string:
+                    return i
+            i = self._read_on(i, keep)
+            if i is None:
+                raise json.JSONDecodeError("значение не закончено", self.buffer, len(self.buffer))
+
+    def value(self):
+        """Следующее значение целиком"""
+        end = self._value_end(keep=True)
+        value, decoded_end = self.decoder.raw_decode(self.buffer, self.pos)
+        if decoded_end != end:
+            raise json.JSONDecodeError("лишние символы в значении", self.buffer, decoded_end)
+        self.pos = end
+        return value
+
+    def skip(self):
+        """Пропускает следующее значение, не разбирая и не держа его в памяти целиком"""
+        self.pos = self._value_end(keep=False)
+
+    def array_items(self):
+        """Элементы массива, открывающая скобка которого уже прочитана"""
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(",]") == "]":
+                return
+
+
+def _iter_json_orders(f, read_size):
+    """Заказы из массива верхнего уровня или из поля "orders" объекта"""
+    stream = _JSONStream(f, read_size)
+    opening = stream.expect("[{")
+    if opening == "[":
+        yield from stream.array_items()
+        return
+
+    if stream.peek() == "}":
+        return
+    while True:
+        key = stream.value()
+        stream.expect(":")
+        if key == "orders" and stream.peek() == "[":
+            stream.expect("[")
+            yield from stream.array_items()
+        else:
+            stream.skip()  # Прочие поля не нужны
+        if stream.expect(",}") == "}":
+            return
+
+
 import time  # Добавляем импорт для timestamp
\ No newline at end of file
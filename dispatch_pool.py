@@ -0,0 +1,149 @@
+"""Расчет назначений в пуле процессов: снимок, расчет, закрепление.
+
+В потоке состояния (state_loop.py) снимается компактный неизменяемый
+снимок: ожидающие заказы прохода и курьеры со свободным местом. Назначения
+по снимку считает процесс пула, а поток состояния в это время продолжает
+применять сообщения клиентов. Затем предложения закрепляются командой в
+потоке состояния, но только для курьеров, чье состояние с момента снимка
+не изменилось (статус, заказы, загрузка, местоположение в пределах
+DISPATCH_POOL_MOVE_TOLERANCE_KM), и заказов, которые все еще ожидают.
+Заказы с устаревшими предложениями уходят в следующий проход.
+"""
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import geo
+from agents import DispatcherAgent
+from config import DISPATCH_POOL_WORKERS, DISPATCH_POOL_MIN_ORDERS, DISPATCH_POOL_MOVE_TOLERANCE_KM
+from sharding import ShardDispatcher, order_payload, courier_payload
+
+
+class DispatchSnapshot:
+    """Неизменяемый снимок для одного прохода: кортежи курьеров и заказов
+    (см. sharding.courier_payload и order_payload) и параметры расчета"""
+    __slots__ = ("couriers", "orders", "order_ids", "clock", "traffic", "engine", "mode")
+
+    def __init__(self, couriers, orders, order_ids, clock, traffic, engine, mode):
+        self.couriers = couriers
+        self.orders = orders
+        self.order_ids = order_ids  # None - полный проход по всем заказам снимка
+        self.clock = clock
+        self.traffic = traffic
+        self.engine = engine
+        self.mode = mode
+
+
+def solve_snapshot(snapshot):
+    """Считает назначения по снимку (в процессе пула).
+
+    Возвращает предложения (id курьера, id заказа, с опозданием ли) в том
+    порядке, в каком их выбрал жадный или пакетный проход.
+    """
+    dispatcher = ShardDispatcher(snapshot.engine, snapshot.mode)
+    return dispatcher.run({
+        "sync": {"couriers": snapshot.couriers, "orders": snapshot.orders,
+                 "removed_couriers": (), "removed_orders": ()},
+        "clock": snapshot.clock,
+        "traffic": snapshot.traffic,
+        "full": snapshot.order_ids is None,
+        "order_ids": snapshot.order_ids or ()
+    })["proposals"]
+
+
+def _silence():
+    """Инициализация процесса пула: назначения печатает сервер при закреплении"""
+    sys.stdout = open(os.devnull, "w")
+
+
+class DispatchPool:
+    """Пул процессов для проходов распределения DispatcherAgent"""
+
+    def __init__(self, dispatcher: DispatcherAgent, workers: int = DISPATCH_POOL_WORKERS,
+                 min_orders: int = DISPATCH_POOL_MIN_ORDERS,
+                 move_tolerance_km: float = DISPATCH_POOL_MOVE_TOLERANCE_KM):
+        self.dispatcher = dispatcher
+        self.min_orders = min_orders
+        self.move_tolerance_km = move_tolerance_km
+        # spawn: у сервера уже работают потоки, fork мог бы унаследовать занятые блокировки
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=_silence)
+        self.workers = workers
+        self.metrics = {"passes": 0, "proposals": 0, "committed": 0, "stale_couriers": 0, "taken_orders": 0}
+
+    def snapshot(self, orders=None):
+        """Снимок для прохода по заказам orders (None - все ожидающие).
+
+        Вызывается в потоке состояния. Возвращает None, если проход
+        мал и выгоднее выполнить его на месте.
+        """
+        dispatcher = self.dispatcher
+        if orders is None:
+            if dispatcher.order_count("pending") < self.min_orders:
+                return None
+            pending = [dispatcher.orders[order_id] for order_id in dispatcher.orders_by_status.get("pending", ())]
+            order_ids = None
+        else:
+            pending = [order for order in orders if order.status == "pending"]
+            if len(pending) < self.min_orders:
+                return None
+            order_ids = tuple(order.id for order in pending)
+
+        couriers = tuple(courier_payload(courier, dispatcher.routes.route(courier))
+                         for courier in dispatcher.available_couriers() if courier.has_free_slot())
+        if not couriers:
+            return None
+        return DispatchSnapshot(couriers, tuple(order_payload(order) for order in pending), order_ids,
+                                dispatcher.clock(), dispatcher.traffic_data.get("factor", 1.0),
+                                dispatcher.engine, dispatcher.mode)
+
+    def solve(self, snapshot):
+        """Считает назначения в процессе пула; вызывается вне потока состояния, который тем временем работает"""
+        return self.executor.submit(solve_snapshot, snapshot).result()
+
+    def commit(self, snapshot, proposals):
+        """Закрепляет предложения, которые все еще допустимы (в потоке состояния).
+
+        Возвращает заказы, которые остались ожидающими из-за изменившихся курьеров.
+        """
+        dispatcher = self.dispatcher
+        dispatcher.current_minute = dispatcher.clock()
+        expected = {payload[0]: payload for payload in snapshot.couriers}
+        unchanged = {}  # {id курьера: состояние совпадает со снимком}
+        stale = {}
+        self.metrics["passes"] += 1
+        self.metrics["proposals"] += len(proposals)
+
+        for courier_id, order_id, _ in proposals:
+            order = dispatcher.orders.get(order_id)
+            if order is None or order.status != "pending":
+                self.metrics["taken_orders"] += 1
+                continue
+            # Курьер сверяется со снимком один раз: дальше его меняют уже наши назначения
+            if courier_id not in unchanged:
+                unchanged[courier_id] = self._unchanged(dispatcher.couriers.get(courier_id), expected[courier_id])
+            courier = dispatcher.couriers.get(courier_id)
+            if not unchanged[courier_id] or dispatcher.apply_assignment(courier, order) is None:
+                self.metrics["stale_couriers"] += 1
+                stale[order.id] = order
+                continue
+            self.metrics["committed"] += 1
+        return list(stale.values())
+
+    def _unchanged(self, courier, payload):
+        """Состояние курьера, важное для назначения, такое же, как в снимке"""
+        if courier is None:
+            return False
+        _, location, _, max_capacity, status, current_capacity, route = payload
+        return (courier.status == status
+                and courier.current_capacity == current_capacity
+                and courier.max_capacity == max_capacity
+                and sorted(order.id for order in courier.current_orders) == sorted(order[0] for order in route)
+                and geo.distance(courier.location, location) <= self.move_tolerance_km)
+
+    def stats(self):
+        return dict(self.metrics, workers=self.workers)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,149 @@
+"""Планировщик распределения: объединяет поводы для распределения в один проход за окно"""
+import threading
+import time
+
+from config import DISPATCH_WINDOW, HIGH_PRIORITY_MAX_LATENCY
+
+
+class DispatchScheduler:
+    """Копит поводы для распределения (новые заказы, освободившиеся курьеры,
+    полный проход) и выполняет один проход на окно DISPATCH_WINDOW.
+
+    Срочный повод (заказ с высоким приоритетом, ЧП) сокращает ожидание
+    до HIGH_PRIORITY_MAX_LATENCY. При окне 0 проход выполняется сразу
+    в вызывающем потоке, как без планировщика.
+
+    run_pass(orders, couriers, full) вызывается из потока планировщика.
+    """
+
+    def __init__(self, run_pass, window: float = DISPATCH_WINDOW,
+                 max_latency: float = HIGH_PRIORITY_MAX_LATENCY):
+        self.run_pass = run_pass
+        self.window = window
+        self.max_latency = max_latency
+        self.condition = threading.Condition()
+        self.running = True
+
+        # Накопленные поводы до следующего прохода
+        self._orders = {}  # {id заказа: заказ}
+        self._couriers = {}  # {id курьера: курьер}
+        self._full = False
+        self._triggers = 0
+        self._first_trigger = None
+        self._deadline = None
+        self._urgent = False
+
+        self.metrics = {
+            "triggers": 0,  # Всего поводов для распределения
+            "passes": 0,  # Выполнено проходов
+            "urgent_passes": 0,  # Проходов, ускоренных срочным поводом
+            "absorbed_last": 0,  # Поводов в последнем проходе
+            "absorbed_max": 0,  # Максимум поводов в одном проходе
+            "latency_total": 0.0,  # Сумма задержек от первого повода до прохода, сек
+            "latency_max": 0.0,
+            "pass_time_total": 0.0  # Суммарное время проходов, сек
+        }
+
+        self.thread = None
+        if self.window > 0:
+            self.thread = threading.Thread(target=self._loop, daemon=True)
+            self.thread.start()
+
+    def request(self, orders=(), couriers=(), full=False, urgent=False):
+        """Отмечает, что нужно распределение. Не блокируется на самом проходе"""
+        with self.condition:
+            now = time.perf_counter()
+            for order in orders:
+                self._orders[order.id] = order
+            for courier in couriers:
+                self._couriers[courier.id] = courier
+            self._full = self._full or full
+            self._triggers += 1
+            self.metrics["triggers"] += 1
+
+            if self._first_trigger is None:
+                self._first_trigger = now
+                self._deadline = now + self.window
+            if urgent:
+                self._urgent = True
+                self._deadline = min(self._deadline, now + self.max_latency)
+            self.condition.notify()
+
+        if self.thread is None:
+            self.flush()
+
+    def flush(self):
+        """Немедленно выполняет накопленный проход (если есть)"""
+        with self.condition:
+            if self._first_trigger is None:
+                return False
+            orders = list(self._orders.values())
+            couriers = list(self._couriers.values())
+            full = self._full
+            triggers = self._triggers
+            latency = time.perf_counter() - self._first_trigger
+            urgent = self._urgent
+
+            self._orders = {}
+            self._couriers = {}
+            self._full = False
+            self._triggers = 0
+            self._first_trigger = None
+            self._deadline = None
+            self._urgent = False
+
+        started = time.perf_counter()
+        try:
+            self.run_pass(orders, couriers, full)
+        except Exception as e:
+            print(f"❌ Ошибка прохода распределения: {e}")
+        finally:
+            self._record_pass(triggers, latency, urgent, time.perf_counter() - started)
+        return True
+
+    def _record_pass(self, triggers, latency, urgent, pass_time):
+        with self.condition:
+            metrics = self.metrics
+            metrics["passes"] += 1
+            metrics["urgent_passes"] += urgent
+            metrics["absorbed_last"] = triggers
+            metrics["absorbed_max"] = max(metrics["absorbed_max"], triggers)
+            metrics["latency_total"] += latency
+            metrics["latency_max"] = max(metrics["latency_max"], latency)
+            metrics["pass_time_total"] += pass_time
+
+    def stats(self):
+        """Сводка метрик: сколько поводов поглощает проход и какой ценой по задержке"""
+        with self.condition:
+            metrics = dict(self.metrics)
+        passes = metrics["passes"]
+        return {
+            "triggers": metrics["triggers"],
+            "passes": passes,
+            "urgent_passes": metrics["urgent_passes"],
+            "absorbed_last": metrics["absorbed_last"],
+            "absorbed_max": metrics["absorbed_max"],
+            "absorbed_avg": metrics["triggers"] / passes if passes else 0.0,
+            "latency_avg_ms": metrics["latency_total"] / passes * 1000 if passes else 0.0,
+            "latency_max_ms": metrics["latency_max"] * 1000,
+            "pass_time_avg_ms": metrics["pass_time_total"] / passes * 1000 if passes else 0.0
+        }
+
+    def _loop(self):
+        while True:
+            with self.condition:
+                while self.running and (self._deadline is None or time.perf_counter() < self._deadline):
+                    timeout = None if self._deadline is None else self._deadline - time.perf_counter()
+                    self.condition.wait(timeout)
+                if not self.running:
+                    return
+            self.flush()
+
+    def stop(self):
+        """Останавливает поток планировщика и выполняет оставшийся проход"""
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+        self.flush()
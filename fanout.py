@@ -0,0 +1,269 @@
+"""Рассылка сообщений клиентам: однократная сериализация и ограниченные очереди отправки"""
+import socket
+import threading
+import time
+from collections import deque
+
+import wire_protocol
+from metrics import registry as metrics
+from config import FANOUT_QUEUE_LIMIT, SLOW_CONSUMER_POLICY
+
+# Виды исходящих сообщений
+SNAPSHOT = "snapshot"  # Полный снимок состояния
+DELTA = "delta"  # Дельта состояния: потеря требует нового снимка
+PERIODIC = "periodic"  # Периодическая статистика: важна только последняя
+REPLY = "reply"  # Прочие ответы, не заменяются
+
+COALESCIBLE = (SNAPSHOT, DELTA, PERIODIC)
+
+
+def encode_message(message) -> bytes:
+    """Сериализует сообщение в строку JSON протокола"""
+    return wire_protocol.encode_line(message)
+
+
+class EncodedMessage:
+    """Сообщение, которое сериализуется не более одного раза для каждого формата
+    (строка JSON или бинарный кадр)"""
+
+    def __init__(self, message, stats=None):
+        self.message = message
+        self.stats = stats
+        self.encoded = {}  # {binary: байты}
+
+    def get(self, binary: bool = False) -> bytes:
+        data = self.encoded.get(binary)
+        if data is None:
+            started = time.perf_counter()
+            data = wire_protocol.encode(self.message, binary)
+            metrics.observe(f"serialize.{self.message.get('type')}", time.perf_counter() - started)
+            metrics.add(f"serialized_bytes.{self.message.get('type')}", len(data))
+            self.encoded[binary] = data
+            if self.stats is not None:
+                self.stats.add("serialized_bytes", len(data))
+        return data
+
+
+class FanoutStats:
+    """Счетчики рассылки, общие для всех подключений"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {
+            "broadcasts": 0,  # Сообщений, разосланных всем
+            "serialized_bytes": 0,  # Байт после однократной сериализации
+            "queued": 0,  # Сообщений, поставленных в очереди
+            "sent_bytes": 0,  # Байт, отправленных клиентам
+            "coalesced": 0,  # Сообщений, замененных более свежим снимком
+            "dropped": 0,  # Сообщений, отброшенных без замены
+            "disconnected": 0  # Медленных клиентов, отключенных по политике
+        }
+
+    def add(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counters)
+
+
+class ClientChannel:
+    """Ограниченная очередь исходящих сообщений одного подключения.
+
+    При переполнении применяется политика медленного клиента:
+    "coalesce" - устаревшие снимки, дельты и статистика выбрасываются,
+    а клиенту при следующей рассылке отправляется свежий снимок;
+    "disconnect" - клиент отключается.
+    """
+
+    def __init__(self, stats: FanoutStats, limit: int = FANOUT_QUEUE_LIMIT,
+                 policy: str = SLOW_CONSUMER_POLICY):
+        self.stats = stats
+        self.limit = limit
+        self.policy = policy
+        self.queue = deque()  # (вид, байты)
+        self.lock = threading.Condition()
+        self.closed = False
+        self.needs_snapshot = False  # Дельты были выброшены, нужна повторная синхронизация
+        self.binary = False  # Клиент согласовал бинарный протокол
+
+    def enqueue(self, message: EncodedMessage, kind: str = REPLY) -> bool:
+        """Ставит сообщение в очередь, не блокируясь на отправке"""
+        with self.lock:
+            if self.closed:
+                return False
+
+            if kind == SNAPSHOT:
+                # Новый снимок делает ненужными все ожидающие снимки и дельты
+                self._drop_queued((SNAPSHOT, DELTA))
+                self.needs_snapshot = False
+            elif kind == DELTA and self.needs_snapshot:
+                self.stats.add("coalesced")
+                return False
+            elif kind == PERIODIC:
+                self._drop_queued((PERIODIC,))
+
+            if len(self.queue) >= self.limit:
+                if not self._make_room():
+                    return False
+                if kind == DELTA:
+                    # Вместо дельты клиент получит свежий снимок
+                    self.stats.add("coalesced")
+                    return False
+
+            # Формат выбирается под блокировкой, чтобы не разойтись с переключением протокола
+            self.queue.append((kind, message.get(self.binary)))
+            self.stats.add("queued")
+            self.lock.notify()
+
+        self._wakeup()
+        return True
+
+    def switch_to_binary(self, ack: EncodedMessage) -> bool:
+        """Отправляет подтверждение строкой JSON и переводит канал на бинарные кадры"""
+        with self.lock:
+            if not self.enqueue(ack):
+                return False
+            self.binary = True
+        return True
+
+    def _drop_queued(self, kinds):
+        kept = deque(item for item in self.queue if item[0] not in kinds)
+        dropped = len(self.queue) - len(kept)
+        if dropped:
+            self.queue = kept
+            self.stats.add("coalesced", dropped)
+            if DELTA in kinds and SNAPSHOT not in kinds:
+                self.needs_snapshot = True
+        return dropped
+
+    def _make_room(self) -> bool:
+        """Освобождает место по политике медленного клиента"""
+        if self.policy == "coalesce" and self._drop_queued(COALESCIBLE):
+            # Клиент получит свежий снимок вместо выброшенных сообщений
+            self.needs_snapshot = True
+            return True
+
+        if self.policy == "disconnect":
+            self.stats.add("disconnected")
+            self.closed = True
+            self.queue.clear()
+            self.lock.notify_all()
+            self._abort()
+        else:
+            self.stats.add("dropped")
+        return False
+
+    def take_all(self, timeout=None):
+        """Забирает все сообщения из очереди (ждет появления, если timeout задан)"""
+        with self.lock:
+            if not self.queue and timeout is not None and not self.closed:
+                self.lock.wait(timeout)
+            items = [data for _, data in self.queue]
+            self.queue.clear()
+            return items
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.queue.clear()
+            self.lock.notify_all()
+        self._wakeup()
+
+    def _wakeup(self):
+        """Будит писателя (для каналов asyncio)"""
+
+    def _abort(self):
+        """Разрывает соединение медленного клиента"""
+
+
+class SocketChannel(ClientChannel):
+    """Канал обычного сокета: очередь разбирает отдельный поток-писатель"""
+
+    def __init__(self, sock, stats: FanoutStats, **kwargs):
+        super().__init__(stats, **kwargs)
+        self.sock = sock
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer.start()
+
+    def _write_loop(self):
+        while not self.closed:
+            items = self.take_all(timeout=1.0)
+            if not items:
+                continue
+            data = b"".join(items)
+            try:
+                self.sock.sendall(data)
+                self.stats.add("sent_bytes", len(data))
+            except (socket.timeout, OSError):
+                # Клиент не принимает данные - закрываем, поток чтения увидит разрыв
+                self.close()
+                self._abort()
+
+    def _abort(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class FanoutEngine:
+    """Рассылает сообщения по каналам подключений, сериализуя каждое один раз"""
+
+    def __init__(self):
+        self.stats = FanoutStats()
+        self.channels = {}  # {подключение: ClientChannel}
+
+    def attach(self, handle, channel: ClientChannel):
+        self.channels[handle] = channel
+
+    def detach(self, handle):
+        channel = self.channels.pop(handle, None)
+        if channel is not None:
+            channel.close()
+
+    def send(self, handle, message, kind: str = REPLY) -> bool:
+        """Отправляет сообщение (или уже готовое EncodedMessage) одному подключению"""
+        channel = self.channels.get(handle)
+        if channel is None:
+            return False
+        if not isinstance(message, EncodedMessage):
+            message = EncodedMessage(message)
+        return channel.enqueue(message, kind)
+
+    def broadcast(self, message, kind: str = REPLY, handles=None) -> int:
+        """Рассылает сообщение всем (или указанным) подключениям.
+
+        Возвращает суммарный размер сериализованных форматов сообщения в байтах.
+        """
+        started = time.perf_counter()
+        encoded = EncodedMessage(message, self.stats)
+        self.stats.add("broadcasts")
+
+        targets = list(self.channels) if handles is None else handles
+        queued = 0
+        for handle in targets:
+            channel = self.channels.get(handle)
+            if channel is not None and channel.enqueue(encoded, kind):
+                queued += 1
+        size = sum(len(data) for data in encoded.encoded.values())
+
+        # Время рассылки включает сериализацию и постановку во все очереди
+        message_type = message.get("type")
+        metrics.observe(f"broadcast.{message_type}", time.perf_counter() - started)
+        metrics.add(f"broadcast_recipients.{message_type}", queued)
+        return size
+
+    def switch_to_binary(self, handle, ack_message) -> bool:
+        """Подтверждает согласование и переводит подключение на бинарные кадры"""
+        channel = self.channels.get(handle)
+        if channel is None:
+            return False
+        return channel.switch_to_binary(EncodedMessage(ack_message))
+
+    def lagging(self):
+        """Подключения, которым нужно отправить свежий снимок"""
+        return [handle for handle, channel in list(self.channels.items()) if channel.needs_snapshot]
@@ -0,0 +1,93 @@
+"""Геодезические расстояния: haversine для пары точек и для пакетов точек.
+
+Координаты - [широта, долгота] в градусах, расстояния - в километрах.
+Перед расчетом координаты округляются до GEO_CACHE_PRECISION знаков, поэтому
+скалярный расчет через кэш и пакетный расчет на NumPy дают одинаковые
+значения для одних и тех же точек.
+"""
+import math
+from functools import lru_cache
+
+from config import GEO_CACHE_SIZE, GEO_CACHE_PRECISION
+
+try:
+    import numpy as np
+except ImportError:  # NumPy - необязательная зависимость
+    np = None
+
+EARTH_RADIUS_KM = 6371.0088  # Средний радиус Земли
+
+_SCALE = 10 ** GEO_CACHE_PRECISION
+
+
+def lon_scale(latitude: float) -> float:
+    """Во сколько раз градус долготы короче градуса широты на данной широте"""
+    return math.cos(math.radians(latitude))
+
+
+def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Расстояние по большому кругу между двумя точками, км"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+
+@lru_cache(maxsize=GEO_CACHE_SIZE)
+def _cached_distance(point1, point2):
+    return haversine(round(point1[0] * _SCALE) / _SCALE, round(point1[1] * _SCALE) / _SCALE,
+                     round(point2[0] * _SCALE) / _SCALE, round(point2[1] * _SCALE) / _SCALE)
+
+
+def distance(point1, point2) -> float:
+    """Расстояние между двумя точками, км (через LRU-кэш).
+
+    Ключ кэша - сами кортежи координат (у агентов они неизменяемые):
+    квантование ключа обходится дороже самого haversine, поэтому
+    координаты квантуются только при расчете промаха.
+    """
+    try:
+        return _cached_distance(point1, point2)
+    except TypeError:  # Координаты пришли списками
+        return _cached_distance(tuple(point1), tuple(point2))
+
+
+def cache_info():
+    """Статистика кэша расстояний (hits, misses, maxsize, currsize)"""
+    return _cached_distance.cache_info()
+
+
+def clear_cache():
+    _cached_distance.cache_clear()
+
+
+def radians(points):
+    """Массив точек N×2 в радианах после того же округления, что и в distance"""
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    return np.radians(np.round(points * _SCALE) / _SCALE)
+
+
+def haversine_matrix(origins, destinations):
+    """Матрица расстояний, км, для точек, уже переведенных в radians()"""
+    d_phi = destinations[None, :, 0] - origins[:, None, 0]
+    d_lambda = destinations[None, :, 1] - origins[:, None, 1]
+    a = (np.sin(d_phi / 2) ** 2
+         + np.cos(origins[:, None, 0]) * np.cos(destinations[None, :, 0]) * np.sin(d_lambda / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def distance_matrix(origins, destinations):
+    """Матрица расстояний origins × destinations, км (NumPy)"""
+    return haversine_matrix(radians(origins), radians(destinations))
+
+
+def distances_from(origin, destinations):
+    """Расстояния от одной точки до каждой из destinations, км.
+
+    С NumPy - один векторный расчет (массив), без него - список через кэш.
+    """
+    if np is None:
+        return [distance(origin, point) for point in destinations]
+    return distance_matrix([origin], destinations)[0]
@@ -0,0 +1,237 @@
+"""Журнал изменений состояния: дозапись версий с групповым fsync, снимки и восстановление.
+
+Каждая разосланная версия (дельта StateTracker) записывается строкой JSON
+в journal.log: курьеры, заказы, новые и снятые назначения, трафик. Запись
+идет через поток-писатель, который сбрасывает накопившиеся строки одним
+write и одним fsync. Снимок (snapshot.json) содержит все состояние на
+момент записи; после него журнал начинается заново. Восстановление -
+снимок плюс хвост журнала с версиями новее снимка.
+
+Рассылка не ждет fsync: клиенты могут увидеть версию, которая еще не
+записана на диск. После сбоя теряется не больше JOURNAL_FLUSH_INTERVAL
+последних версий; клиенты получат снимок восстановленного состояния при
+переподключении. Восстановленные курьеры считаются offline до своего
+первого courier_update.
+"""
+import json
+import os
+import threading
+import time
+
+from config import JOURNAL_FLUSH_INTERVAL, JOURNAL_SNAPSHOT_EVERY
+
+LOG_NAME = "journal.log"
+SNAPSHOT_NAME = "snapshot.json"
+
+
+def _dumps(data) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def _fsync_directory(directory):
+    """Делает переименование файла в каталоге устойчивым к сбою (где это поддерживается)"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class Journal:
+    """Журнал версий состояния с групповой фиксацией на диск"""
+
+    def __init__(self, directory: str, flush_interval: float = JOURNAL_FLUSH_INTERVAL,
+                 snapshot_every: int = JOURNAL_SNAPSHOT_EVERY):
+        self.directory = directory
+        self.log_path = os.path.join(directory, LOG_NAME)
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_NAME)
+        self.flush_interval = flush_interval
+        self.snapshot_every = snapshot_every
+
+        os.makedirs(directory, exist_ok=True)
+        self.file = open(self.log_path, "ab")
+        self.condition = threading.Condition()
+        self.pending = []  # ("record", байты) или ("snapshot", состояние) в порядке поступления
+        self.records_since_snapshot = 0
+        self.running = True
+        self.stats = {
+            "records": 0,  # Записанных версий
+            "commits": 0,  # Выполненных fsync журнала
+            "bytes": 0,  # Байт записано в журнал
+            "snapshots": 0  # Записанных снимков
+        }
+
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer.start()
+
+    def append_version(self, delta):
+        """Ставит в очередь запись версии (сообщения state_delta)"""
+        record = {
+            "seq": delta["seq"],
+            "couriers": delta["couriers"],
+            "orders": delta["orders"],
+            "assignments": delta["assignments"],
+            "removed_assignments": delta["removed_assignments"],
+            "traffic": delta["traffic"]
+        }
+        data = (_dumps(record) + "\n").encode('utf-8')
+        with self.condition:
+            self.pending.append(("record", data))
+            self.records_since_snapshot += 1
+            self.condition.notify()
+
+    def needs_snapshot(self) -> bool:
+        return self.records_since_snapshot >= self.snapshot_every
+
+    def write_snapshot(self, state):
+        """Ставит в очередь снимок состояния; записи до него станут не нужны.
+
+        state - словарь с полями seq, couriers, orders, assignments,
+        active_assignments, traffic (см. CourierServer._journal_snapshot).
+        """
+        with self.condition:
+            self.pending.append(("snapshot", state))
+            self.records_since_snapshot = 0
+            self.condition.notify()
+
+    def _write_loop(self):
+        while True:
+            with self.condition:
+                while self.running and not self.pending:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                running = self.running
+
+            # Даем накопиться записям, пришедшим почти одновременно
+            if running and self.flush_interval > 0:
+                time.sleep(self.flush_interval)
+
+            with self.condition:
+                items = self.pending
+                self.pending = []
+
+            try:
+                self._write_items(items)
+            except OSError as e:
+                print(f"❌ Ошибка записи журнала: {e}")
+
+    def _write_items(self, items):
+        buffer = []
+        for kind, payload in items:
+            if kind == "record":
+                buffer.append(payload)
+                continue
+            self._commit(buffer)
+            buffer = []
+            self._write_snapshot_file(payload)
+        self._commit(buffer)
+
+    def _commit(self, chunks):
+        """Один write и один fsync на все накопленные записи"""
+        if not chunks:
+            return
+        data = b"".join(chunks)
+        self.file.write(data)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.stats["records"] += len(chunks)
+        self.stats["commits"] += 1
+        self.stats["bytes"] += len(data)
+
+    def _write_snapshot_file(self, state):
+        temp_path = self.snapshot_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(_dumps(state))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path)
+        _fsync_directory(self.directory)
+
+        # Все версии до снимка в нем уже есть - начинаем журнал заново
+        self.file.close()
+        self.file = open(self.log_path, "wb")
+        os.fsync(self.file.fileno())
+        self.stats["snapshots"] += 1
+
+    def close(self):
+        """Дописывает очередь на диск и закрывает журнал"""
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.writer.join()
+        self.file.close()
+
+
+def recover(directory: str):
+    """Восстанавливает состояние из снимка и хвоста журнала.
+
+    Возвращает словарь с полями seq, couriers ({id: словарь}), orders
+    ({id: словарь}), assignments (история), active_assignments
+    ({order_id: назначение}), traffic, replayed (число примененных версий)
+    или None, если сохраненного состояния нет.
+    """
+    snapshot_path = os.path.join(directory, SNAPSHOT_NAME)
+    log_path = os.path.join(directory, LOG_NAME)
+    if not os.path.exists(snapshot_path) and not os.path.exists(log_path):
+        return None
+
+    state = {
+        "seq": 0,
+        "couriers": {},
+        "orders": {},
+        "assignments": [],
+        "active_assignments": {},
+        "traffic": "normal",
+        "replayed": 0
+    }
+
+    if os.path.exists(snapshot_path):
+        with open(snapshot_path, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+        state["seq"] = snapshot["seq"]
+        state["couriers"] = {c["id"]: c for c in snapshot["couriers"]}
+        state["orders"] = {o["id"]: o for o in snapshot["orders"]}
+        state["assignments"] = snapshot["assignments"]
+        state["active_assignments"] = {a["order_id"]: a for a in snapshot["active_assignments"]}
+        state["traffic"] = snapshot["traffic"]
+
+    if os.path.exists(log_path):
+        with open(log_path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Недописанная при сбое строка - дальше журнала нет
+                    break
+                if record["seq"] <= state["seq"]:
+                    continue  # Уже учтено в снимке
+                _apply_record(state, record)
+
+    if not state["orders"] and not state["couriers"]:
+        return None
+    return state
+
+
+def _apply_record(state, record):
+    for courier in record["couriers"]:
+        state["couriers"][courier["id"]] = courier
+    for order in record["orders"]:
+        state["orders"][order["id"]] = order
+
+    active = state["active_assignments"]
+    for order_id in record["removed_assignments"]:
+        active.pop(order_id, None)
+    for assignment in record["assignments"]:
+        if active.get(assignment["order_id"]) != assignment:
+            state["assignments"].append(assignment)
+        active[assignment["order_id"]] = assignment
+
+    state["traffic"] = record["traffic"]
+    state["seq"] = record["seq"]
+    state["replayed"] += 1
@@ -0,0 +1,377 @@
+"""Генератор нагрузки: тысячи курьеров и поток заказов из одного процесса.
+
+Каждый курьер - отдельное соединение по обычному протоколу сервера
+(строки JSON или бинарные кадры после hello). Курьер регистрируется,
+шлет ping и обновления местоположения и отмечает доставку назначенных
+ему заказов. Отдельное соединение подает новые заказы. Интервалы между
+событиями случайные (пуассоновский поток) с заданной интенсивностью.
+В конце печатаются перцентили задержки ping/pong и сообщения в секунду.
+
+Генератор сам разбирает все рассылки состояния. Если растет "опоздание
+цикла генератора", задержки завышены им самим: нагрузку стоит разделить
+на несколько процессов с разными --courier-id-base.
+
+    python load_generator.py --couriers 1000 --order-rate 50 --duration 60
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter
+
+from config import SERVER_HOST, SERVER_PORT, BUFFER_SIZE, TRANSPORT_SPEEDS
+from wire_protocol import StreamDecoder, BINARY_PROTOCOL, encode
+
+CITY_CENTER = (55.75, 37.62)
+CITY_SPREAD = (0.15, 0.25)  # Разброс точек по широте и долготе, градусы
+
+
+def random_point(rng):
+    return [CITY_CENTER[0] + rng.uniform(-CITY_SPREAD[0], CITY_SPREAD[0]),
+            CITY_CENTER[1] + rng.uniform(-CITY_SPREAD[1], CITY_SPREAD[1])]
+
+
+def percentile(sorted_values, share):
+    """Перцентиль по отсортированному списку (ближайший ранг)"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(share * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class LoadStats:
+    """Счетчики генератора: отправленные и полученные сообщения, задержки ping"""
+
+    def __init__(self):
+        self.sent = Counter()  # {тип сообщения: количество}
+        self.received = Counter()
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.rtts = []  # Задержки ping -> pong, сек
+        self.connected = 0
+        self.errors = 0
+        self.assignments = 0  # Назначений, увиденных курьерами
+        self.delivered = 0
+        self.loop_lag_max = 0.0  # Наибольшее опоздание цикла событий генератора, сек
+
+    def snapshot(self):
+        return sum(self.sent.values()), sum(self.received.values()), len(self.rtts)
+
+
+class Connection:
+    """Соединение с сервером: отправка и разбор входящих сообщений"""
+
+    def __init__(self, stats: LoadStats, binary: bool):
+        self.stats = stats
+        self.binary = binary
+        self.use_binary = False
+        self.decoder = StreamDecoder()
+        self.reader = None
+        self.writer = None
+        self.protocol_ready = asyncio.Event()
+
+    async def open(self):
+        """Подключается и запускает чтение; с --binary ждет подтверждения протокола.
+
+        Возвращает задачу чтения входящих сообщений.
+        """
+        self.reader, self.writer = await asyncio.open_connection(SERVER_HOST, SERVER_PORT)
+        self.stats.connected += 1
+        reader = asyncio.ensure_future(self.read_loop())
+        if self.binary:
+            self.send({"type": "hello", "protocol": BINARY_PROTOCOL})
+            await asyncio.wait_for(self.protocol_ready.wait(), timeout=10)
+        return reader
+
+    def send(self, message):
+        data = encode(message, self.use_binary)
+        self.writer.write(data)
+        self.stats.sent[message["type"]] += 1
+        self.stats.bytes_sent += len(data)
+
+    async def read_loop(self):
+        while True:
+            data = await self.reader.read(BUFFER_SIZE)
+            if not data:
+                raise ConnectionError("сервер закрыл соединение")
+            self.stats.bytes_received += len(data)
+            self.decoder.feed(data)
+            for message in self.decoder.messages():
+                self.on_message(message)
+
+    def on_message(self, message):
+        if isinstance(message, str):
+            if not self.interesting(message):
+                self.stats.received["skipped"] += 1  # Рассылка без упоминания курьера
+                return
+            message = json.loads(message)
+        message_type = message.get("type")
+        self.stats.received[message_type] += 1
+        if message_type == "hello_ack":
+            if message.get("protocol") == BINARY_PROTOCOL:
+                self.decoder.binary = True
+                self.use_binary = True
+            self.protocol_ready.set()
+        else:
+            self.handle(message)
+
+    def interesting(self, line):
+        """Стоит ли разбирать строку JSON (рассылки состояния дороги в разборе)"""
+        return True
+
+    def handle(self, message):
+        pass
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+class SimulatedCourier(Connection):
+    """Курьер: регистрация, ping, перемещения, доставка назначенных заказов"""
+
+    def __init__(self, generator, courier_id, rng):
+        super().__init__(generator.stats, generator.args.binary)
+        self.generator = generator
+        self.courier_id = courier_id
+        self.rng = rng
+        self.location = random_point(rng)
+        self.transport_type = rng.choice(list(TRANSPORT_SPEEDS))
+        self.orders = set()
+        self.taken = set()  # Все полученные заказы: назначение может прийти дважды
+        self.pings = {}  # {id ping: время отправки}
+        self.ping_ids = itertools.count(1)
+        # Назначение в строке JSON: {"courier_id": <id>, "order_id": ...}
+        self.marker = f'"courier_id": {courier_id},'
+
+    def update_message(self, status="available"):
+        return {
+            "type": "courier_update",
+            "courier_id": self.courier_id,
+            "location": self.location,
+            "status": status,
+            "name": f"Load_{self.courier_id}",
+            "transport_type": self.transport_type
+        }
+
+    async def run(self):
+        async with self.generator.connect_slots:
+            reader = await self.open()
+        # Подтверждение назначений объявляется один раз при регистрации
+        self.send({**self.update_message(), "assignment_acks": True})
+
+        args = self.generator.args
+        tasks = [reader]
+        if args.ping_rate > 0:
+            tasks.append(asyncio.ensure_future(self.every(args.ping_rate, self.ping)))
+        if args.update_rate > 0:
+            tasks.append(asyncio.ensure_future(self.every(args.update_rate, self.move)))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def every(self, rate, action):
+        """Пуассоновский поток событий с интенсивностью rate в секунду"""
+        while True:
+            await asyncio.sleep(self.rng.expovariate(rate))
+            action()
+
+    def ping(self):
+        ping_id = next(self.ping_ids)
+        self.pings[ping_id] = time.perf_counter()
+        self.send({"type": "ping", "id": ping_id})
+
+    def move(self):
+        self.location = [self.location[0] + self.rng.uniform(-0.002, 0.002),
+                         self.location[1] + self.rng.uniform(-0.003, 0.003)]
+        self.send(self.update_message())
+
+    def interesting(self, line):
+        return '"pong"' in line or '"hello_ack"' in line or self.marker in line
+
+    def handle(self, message):
+        message_type = message.get("type")
+        if message_type == "pong":
+            sent = self.pings.pop(message.get("id"), None)
+            if sent is not None:
+                self.stats.rtts.append(time.perf_counter() - sent)
+        elif message_type == "assignment":
+            self.take_order(message["order_id"])
+            self.send({"type": "assignment_ack", "courier_id": self.courier_id, "order_id": message["order_id"]})
+        elif message_type in ("system_status", "state_delta"):
+            for assignment in message.get("assignments", ()):
+                if assignment["courier_id"] == self.courier_id:
+                    self.take_order(assignment["order_id"])
+
+    def take_order(self, order_id):
+        """Берет заказ в работу (назначение приходит и отдельно, и в дельте)"""
+        if order_id not in self.taken:
+            self.taken.add(order_id)
+            self.orders.add(order_id)
+            self.stats.assignments += 1
+            asyncio.ensure_future(self.deliver(order_id))
+
+    async def deliver(self, order_id):
+        rate = self.generator.args.delivery_rate
+        if rate <= 0:
+            return
+        await asyncio.sleep(self.rng.expovariate(rate))
+        if order_id in self.orders and not self.writer.is_closing():
+            self.orders.discard(order_id)
+            self.send({"type": "order_delivered", "courier_id": self.courier_id, "order_id": order_id})
+            self.stats.delivered += 1
+
+
+class OrderFeed(Connection):
+    """Отдельное соединение, подающее новые заказы"""
+
+    def __init__(self, generator, rng):
+        super().__init__(generator.stats, generator.args.binary)
+        self.generator = generator
+        self.rng = rng
+        self.order_ids = itertools.count(generator.args.order_id_base)
+
+    def interesting(self, line):
+        return '"hello_ack"' in line
+
+    async def run(self):
+        reader = await self.open()
+        try:
+            while True:
+                await asyncio.sleep(self.rng.expovariate(self.generator.args.order_rate))
+                self.send(self.new_order())
+        finally:
+            reader.cancel()
+
+    def new_order(self):
+        start_hour = time.localtime().tm_hour
+        end_hour = min(24, start_hour + self.rng.randint(1, 3))
+        order_id = next(self.order_ids)
+        return {
+            "type": "new_order",
+            "order": {
+                "id": order_id,
+                "destination": random_point(self.rng),
+                "weight": round(self.rng.uniform(0.5, 15), 1),
+                "priority": self.rng.choice(["high", "normal", "normal", "low"]),
+                "time_window": f"{start_hour:02d}:00-{end_hour:02d}:00",
+                "description": f"Нагрузочный заказ #{order_id}"
+            }
+        }
+
+
+class LoadGenerator:
+    def __init__(self, args):
+        self.args = args
+        self.stats = LoadStats()
+        self.connect_slots = asyncio.Semaphore(args.connect_concurrency)
+        self.rng = random.Random(args.seed)
+
+    async def run_connection(self, connection):
+        try:
+            await connection.run()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.stats.errors += 1
+            if self.stats.errors <= 5:
+                print(f"❌ Ошибка соединения: {type(e).__name__} {e}")
+        finally:
+            connection.close()
+
+    async def run(self):
+        args = self.args
+        connections = [SimulatedCourier(self, args.courier_id_base + i, random.Random(self.rng.random()))
+                       for i in range(args.couriers)]
+        if args.order_rate > 0:
+            connections.append(OrderFeed(self, random.Random(self.rng.random())))
+
+        print(f"🚀 Нагрузка: {args.couriers} курьеров, заказы {args.order_rate}/с, "
+              f"ping {args.ping_rate}/с, протокол {'binary' if args.binary else 'json'}")
+        tasks = [asyncio.ensure_future(self.run_connection(c)) for c in connections]
+        started = time.perf_counter()
+        reporter = asyncio.ensure_future(self.report_loop(started))
+        lag_probe = asyncio.ensure_future(self.measure_loop_lag())
+        await asyncio.sleep(args.duration)
+
+        reporter.cancel()
+        lag_probe.cancel()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.final_report(time.perf_counter() - started)
+
+    async def measure_loop_lag(self, period=0.05):
+        """Насколько просыпается позже срока сам генератор: если много,
+        задержки ping завышены генератором, а не сервером"""
+        while True:
+            expected = time.perf_counter() + period
+            await asyncio.sleep(period)
+            self.stats.loop_lag_max = max(self.stats.loop_lag_max, time.perf_counter() - expected)
+
+    async def report_loop(self, started):
+        previous = self.stats.snapshot()
+        while True:
+            await asyncio.sleep(self.args.report_interval)
+            current = self.stats.snapshot()
+            interval = self.args.report_interval
+            recent = sorted(self.stats.rtts[previous[2]:])
+            print(f"⏱️ {time.perf_counter() - started:5.0f} с | соединений {self.stats.connected} | "
+                  f"отправлено {(current[0] - previous[0]) / interval:.0f}/с | "
+                  f"получено {(current[1] - previous[1]) / interval:.0f}/с | "
+                  f"ping p50 {percentile(recent, 0.5) * 1000:.1f} мс, "
+                  f"p99 {percentile(recent, 0.99) * 1000:.1f} мс | "
+                  f"опоздание цикла генератора {self.stats.loop_lag_max * 1000:.0f} мс")
+            self.stats.loop_lag_max = 0.0
+            previous = current
+
+    def final_report(self, elapsed):
+        stats = self.stats
+        rtts = sorted(stats.rtts)
+        sent = sum(stats.sent.values())
+        received = sum(stats.received.values())
+        print("\n📊 Итоги нагрузки")
+        print(f"   Время: {elapsed:.1f} с, соединений: {stats.connected}, ошибок: {stats.errors}")
+        print(f"   Отправлено: {sent} сообщений ({sent / elapsed:.0f}/с, {stats.bytes_sent / elapsed / 1024:.0f} КБ/с)")
+        print(f"   Получено: {received} сообщений ({received / elapsed:.0f}/с, "
+              f"{stats.bytes_received / elapsed / 1024:.0f} КБ/с)")
+        print(f"   По типам: отправлено {dict(stats.sent)}")
+        print(f"             получено {dict(stats.received)}")
+        print(f"   Назначений у курьеров: {stats.assignments}, доставлено: {stats.delivered}")
+        if rtts:
+            print(f"   Задержка ping/pong ({len(rtts)} замеров): "
+                  f"p50 {percentile(rtts, 0.5) * 1000:.1f} мс, p90 {percentile(rtts, 0.9) * 1000:.1f} мс, "
+                  f"p99 {percentile(rtts, 0.99) * 1000:.1f} мс, max {rtts[-1] * 1000:.1f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Генератор нагрузки для сервера доставки')
+    parser.add_argument('--couriers', type=int, default=100, help='Число курьеров (соединений)')
+    parser.add_argument('--duration', type=float, default=30, help='Длительность, сек')
+    parser.add_argument('--ping-rate', type=float, default=1.0, help='ping в секунду на курьера')
+    parser.add_argument('--update-rate', type=float, default=0.2,
+                        help='Обновлений местоположения в секунду на курьера')
+    parser.add_argument('--delivery-rate', type=float, default=0.1,
+                        help='Интенсивность доставки: 1/среднее время доставки заказа, 1/сек')
+    parser.add_argument('--order-rate', type=float, default=10, help='Новых заказов в секунду (всего)')
+    parser.add_argument('--binary', action='store_true', help='Бинарный протокол вместо строк JSON')
+    parser.add_argument('--courier-id-base', type=int, default=100000, help='Первый id курьера')
+    parser.add_argument('--order-id-base', type=int, default=1000000, help='Первый id заказа')
+    parser.add_argument('--connect-concurrency', type=int, default=100,
+                        help='Одновременных попыток подключения')
+    parser.add_argument('--report-interval', type=float, default=5, help='Период промежуточных отчетов, сек')
+    parser.add_argument('--seed', type=int, default=1, help='Зерно генератора случайных чисел')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(LoadGenerator(args).run())
+    except KeyboardInterrupt:
+        print("\n🛑 Остановлено")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Метрики сервера: счетчики и гистограммы задержек.
+
+Запись - один bisect и три сложения под общей блокировкой, поэтому метрики
+можно не выключать в работе. Гистограммы логарифмические: перцентиль
+оценивается с точностью до ширины корзины (~19%).
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+from config import METRICS_ENABLED
+
+# Верхние границы корзин, с: от 1 мкс до ~100 с с шагом 2^(1/4)
+BUCKET_BOUNDS = tuple(1e-6 * 2 ** (i / 4) for i in range(107))
+
+
+class Histogram:
+    """Распределение длительностей по логарифмическим корзинам"""
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)  # Последняя - все, что длиннее
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction):
+        """Оценка перцентиля, с: верхняя граница корзины, не больше максимума"""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                bound = BUCKET_BOUNDS[index] if index < len(BUCKET_BOUNDS) else self.max
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "avg_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.percentile(0.5) * 1000,
+            "p90_ms": self.percentile(0.9) * 1000,
+            "p99_ms": self.percentile(0.99) * 1000,
+            "max_ms": self.max * 1000,
+            "total_s": self.total
+        }
+
+
+class Metrics:
+    """Именованные счетчики и гистограммы задержек одного процесса"""
+
+    def __init__(self, enabled: bool = METRICS_ENABLED):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.started = time.time()
+
+    def add(self, name, value=1):
+        """Увеличивает счетчик"""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        """Записывает длительность в гистограмму name"""
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.record(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        """Замеряет длительность блока with"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def snapshot(self):
+        """Сводка для ответа get_metrics"""
+        with self.lock:
+            counters = dict(self.counters)
+            latency = {name: histogram.summary() for name, histogram in self.histograms.items()}
+        return {
+            "enabled": self.enabled,
+            "uptime": time.time() - self.started,
+            "counters": counters,
+            "latency": latency
+        }
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.started = time.time()
+
+
+# Общий реестр процесса: в него пишут сервер, рассылка и сериализация
+registry = Metrics()
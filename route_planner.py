@@ -0,0 +1,127 @@
+"""Маршруты курьеров: порядок объезда текущих заказов.
+
+Маршрут начинается в текущем местоположении курьера и проходит точки
+доставки его заказов. Новый заказ вставляется туда, где он меньше всего
+удлиняет путь (эвристика вставки), затем порядок улучшается 2-opt в
+пределах ROUTE_OPTIMIZATION_BUDGET. Маршрут хранится для каждого курьера
+и меняется по месту: при вставке и снятии заказа он не строится заново.
+"""
+import time
+
+import geo
+from config import ROUTE_OPTIMIZATION_BUDGET
+
+try:
+    import numpy as np
+except ImportError:  # NumPy - необязательная зависимость
+    np = None
+
+
+class RoutePlanner:
+    """Порядок объезда заказов для каждого курьера"""
+
+    def __init__(self, time_budget: float = ROUTE_OPTIMIZATION_BUDGET):
+        self.time_budget = time_budget
+        self.routes = {}  # {id курьера: [заказ, ...] в порядке объезда}
+
+    def route(self, courier):
+        """Заказы курьера в порядке объезда.
+
+        Если заказы курьера заменены целиком (например, при восстановлении
+        из журнала), маршрут строится вставкой всех заказов по очереди.
+        """
+        stops = self.routes.get(courier.id)
+        if stops is not None and len(stops) == len(courier.current_orders):
+            return stops
+
+        stops = self.routes[courier.id] = []
+        for order in courier.current_orders:
+            _, position, _ = self._best_insertion(courier.location, stops, order.destination)
+            stops.insert(position, order)
+        self._optimize(courier.location, stops)
+        return stops
+
+    def evaluate(self, courier, order):
+        """Лучшая вставка заказа в маршрут курьера.
+
+        Возвращает (удлинение маршрута, позиция вставки, путь до заказа
+        по маршруту), расстояния в км. Для курьера без заказов удлинение
+        и путь равны расстоянию от курьера до заказа.
+        """
+        return self._best_insertion(courier.location, self.route(courier), order.destination)
+
+    @staticmethod
+    def _best_insertion(origin, stops, point):
+        previous = origin
+        travelled = 0.0  # Путь от начала маршрута до previous
+        best = None
+        for position, stop in enumerate(stops):
+            leg = geo.distance(previous, stop.destination)
+            to_point = geo.distance(previous, point)
+            extra = to_point + geo.distance(point, stop.destination) - leg
+            if best is None or extra < best[0]:
+                best = (extra, position, travelled + to_point)
+            travelled += leg
+            previous = stop.destination
+
+        to_point = geo.distance(previous, point)
+        if best is None or to_point < best[0]:
+            best = (to_point, len(stops), travelled + to_point)
+        return best
+
+    def evaluate_many(self, courier, distances_from):
+        """То же, что evaluate, сразу для многих точек (NumPy).
+
+        distances_from(точка) возвращает массив расстояний от точки до
+        каждой из оцениваемых точек, км. Возвращает массивы удлинения
+        маршрута и пути до каждой точки по маршруту, км.
+        """
+        stops = self.route(courier)
+        points = [courier.location] + [stop.destination for stop in stops]
+        to_point = np.vstack([distances_from(point) for point in points])  # (остановки + 1) × N
+        if not stops:
+            return to_point[0], to_point[0]
+
+        legs = [geo.distance(points[i], points[i + 1]) for i in range(len(stops))]
+        travelled = [0.0]
+        for leg in legs:
+            travelled.append(travelled[-1] + leg)
+
+        # Строка p - вставка перед остановкой p, последняя строка - в конец маршрута
+        extras = np.vstack([to_point[:-1] + to_point[1:] - np.array(legs)[:, None], to_point[-1:]])
+        best = np.argmin(extras, axis=0)
+        columns = np.arange(extras.shape[1])
+        return extras[best, columns], np.array(travelled)[best] + to_point[best, columns]
+
+    def insert(self, courier, order):
+        """Вставляет заказ в маршрут курьера и улучшает порядок"""
+        stops = self.route(courier)
+        _, position, _ = self._best_insertion(courier.location, stops, order.destination)
+        stops.insert(position, order)
+        self._optimize(courier.location, stops)
+
+    def remove(self, courier, order):
+        """Убирает заказ из маршрута, остальные остановки сохраняют порядок"""
+        stops = self.routes.get(courier.id)
+        if stops is not None and order in stops:
+            stops.remove(order)
+
+    def _optimize(self, origin, stops):
+        """2-opt для пути с закрепленным началом и свободным концом"""
+        deadline = time.perf_counter() + self.time_budget
+        improved = True
+        while improved and time.perf_counter() < deadline:
+            improved = False
+            for i in range(len(stops) - 1):
+                before = origin if i == 0 else stops[i - 1].destination
+                for k in range(i + 1, len(stops)):
+                    # Разворот stops[i..k]: меняются только отрезки на границах
+                    first = stops[i].destination
+                    last = stops[k].destination
+                    delta = geo.distance(before, last) - geo.distance(before, first)
+                    if k + 1 < len(stops):
+                        after = stops[k + 1].destination
+                        delta += geo.distance(first, after) - geo.distance(last, after)
+                    if delta < -1e-9:
+                        stops[i:k + 1] = stops[i:k + 1][::-1]
+                        improved = True
@@ -1,59 +1,230 @@
 import socket
 import json
+import os
+import sys
 import time
 import threading
 from datetime import datetime
 from data_loader import DataLoader
+from fanout import FanoutEngine, SocketChannel, EncodedMessage, SNAPSHOT, DELTA, PERIODIC, REPLY
+from wire_protocol import StreamDecoder, BINARY_PROTOCOL
+from dispatch_scheduler import DispatchScheduler
+from state_loop import StateLoop
+from subscriptions import Subscription, courier_topics
+from journal import Journal, recover
+from metrics import registry as metrics
 from agents import DispatcherAgent, MonitorAgent, TrafficAgent, OrderAgent, CourierAgent
-from config import SERVER_HOST, SERVER_PORT, BUFFER_SIZE
+from config import SERVER_HOST, SERVER_PORT, BUFFER_SIZE, SERVER_BACKLOG, SERVER_MODE, PERIODIC_INTERVAL
+from config import COURIER_ACTIVE_TIMEOUT, JOURNAL_ENABLED, JOURNAL_DIR, ORDER_STREAM_CHUNK, DISPATCH_SHARDS
+from config import DISPATCH_POOL_WORKERS, CONNECT_SNAPSHOT_DELAY, ASSIGNMENT_ACK_TIMEOUT, ASSIGNMENT_PUSH_ATTEMPTS
+
+ORDER_REQUIRED_FIELDS = ("id", "destination", "weight", "priority", "time_window")
 
 
 class CourierServer:
-    def __init__(self):
-        # Загружаем только заказы из файла, курьеров создаем динамически
-        data = DataLoader.load_input_data("input_data.json")
+    def __init__(self, journal_dir=JOURNAL_DIR if JOURNAL_ENABLED else None, orders_file="input_data.json",
+                 shards=DISPATCH_SHARDS, pool_workers=DISPATCH_POOL_WORKERS):
         self.dispatcher = DispatcherAgent()
         self.monitor = MonitorAgent()
         self.traffic_agent = TrafficAgent()
 
-        # Создаем заказы из файла
-        for order_data in data.get("orders", []):
-            order = OrderAgent(
-                order_id=order_data["id"],
-                destination=order_data["destination"],
-                weight=order_data["weight"],
-                priority=order_data["priority"],
-                time_window=order_data["time_window"],
-                description=order_data.get("description", "")
-            )
-            self.dispatcher.add_order(order)
+        # После сбоя состояние восстанавливается из журнала, иначе - из входного файла
+        recovered = None
+        if journal_dir:
+            started = time.perf_counter()
+            recovered = recover(journal_dir)
+            print(f"💽 Журнал: {os.path.abspath(journal_dir)}")
+            if recovered:
+                self.restore_state(recovered)
+                print(f"♻️ Состояние восстановлено из журнала: версия {recovered['seq']}, "
+                      f"применено записей {recovered['replayed']}, "
+                      f"{(time.perf_counter() - started) * 1000:.0f} мс")
 
         self.clients = {}  # {client_socket: {"address": address, "courier_id": id}}
+        self.courier_connections = {}  # {id курьера: подключение} для адресной отправки назначений
+        self.pending_acks = {}  # {id заказа: {"courier_id", "attempt", "sent"}} - ждут assignment_ack
+        self.dispatcher.assignment_listener = self.push_assignment
         self.running = True
+        self.fanout = FanoutEngine()
+        # Состояние меняет только поток состояния: обработчики ставят в него команды
+        self.state_loop = StateLoop(self.broadcast_system_status)
+        self._status_cache = None  # ((пачка, версия), EncodedMessage) последнего снимка
+        # Курьеры, которых клиенты видят активными: {id: время обновления} в порядке обновления
+        self.active_courier_ids = {}
         self.dispatcher.traffic_data["factor"] = self.traffic_agent.get_traffic_factor()
+        self.scheduler = DispatchScheduler(self.run_dispatch_pass)
+
+        # Проходы распределения: по регионам в процессах-воркерах или в процессе сервера
+        self.shard_router = None
+        if shards > 1:
+            from sharding import ShardRouter
+            self.shard_router = ShardRouter(self.dispatcher, shards)
+            print(f"🧩 Распределение по регионам: {shards} процессов")
+
+        # Иначе расчет можно вынести в пул процессов по снимку состояния
+        self.dispatch_pool = None
+        if pool_workers > 0 and self.shard_router is None:
+            from dispatch_pool import DispatchPool
+            self.dispatch_pool = DispatchPool(self.dispatcher, pool_workers)
+            print(f"🧮 Расчет назначений в пуле процессов: {pool_workers}")
+
+        # Журнал начинается со снимка текущего состояния
+        self.journal = None
+        if journal_dir:
+            self.journal = Journal(journal_dir)
+            self.journal.write_snapshot(self._journal_snapshot())
 
         print(f"Сервер инициализирован. Заказов: {len(self.dispatcher.orders)}")
 
+        # Заказы из файла загружаются потоково, пока сервер уже принимает подключения;
+        # курьеров создаем динамически
+        self.ingestion_thread = None
+        if not recovered and orders_file:
+            self.ingestion_thread = self.start_order_ingestion(orders_file)
+
+    def start_order_ingestion(self, filename):
+        """Запускает потоковую загрузку заказов из файла в фоне"""
+        thread = threading.Thread(target=self.ingest_orders, args=(filename,), daemon=True)
+        thread.start()
+        return thread
+
+    def ingest_orders(self, filename, chunk_size=ORDER_STREAM_CHUNK):
+        """Добавляет заказы из файла пачками по chunk_size.
+
+        В памяти разбора - не больше одной пачки; каждая пачка применяется
+        одной командой в потоке состояния и дает один повод планировщику
+        распределения. Следующая пачка читается, когда применена предыдущая.
+        """
+        started = time.perf_counter()
+        added = skipped = 0
+        for chunk in DataLoader.iter_order_chunks(filename, chunk_size):
+            if not self.running:
+                break
+            chunk_added = self.state_loop.call(self._add_order_chunk, chunk)
+            added += chunk_added
+            skipped += len(chunk) - chunk_added
+
+        print(f"📥 Из {filename} загружено заказов: {added} (пропущено {skipped}) "
+              f"за {time.perf_counter() - started:.1f} с")
+        return added
+
+    def _add_order_chunk(self, chunk):
+        """Добавляет пачку заказов из файла. Возвращает число добавленных"""
+        new_orders = []
+        for order_data in chunk:
+            order = self._create_order(order_data, verbose=False) if self._valid_order(order_data) else None
+            if order is not None:
+                new_orders.append(order)
+        if new_orders:
+            self.scheduler.request(orders=new_orders, urgent=any(order.priority == "high" for order in new_orders))
+        return len(new_orders)
+
+    @staticmethod
+    def _valid_order(order_data):
+        return isinstance(order_data, dict) and all(key in order_data for key in ORDER_REQUIRED_FIELDS)
+
+    def restore_state(self, state):
+        """Пересоздает агентов из восстановленного журналом состояния"""
+        for data in state["orders"].values():
+            order = OrderAgent(
+                order_id=data["id"],
+                destination=data["destination"],
+                weight=data["weight"],
+                priority=data["priority"],
+                time_window=data["time_window"],
+                description=data.get("description", ""),
+                created_time=data["created_time"]
+            )
+            order._status = sys.intern(data["status"])  # До регистрации: реестры заполнятся в add_order
+            order.assigned_courier = data["assigned_courier"]
+            self.dispatcher.add_order(order)
+
+        for data in state["couriers"].values():
+            courier = CourierAgent(
+                agent_id=data["id"],
+                location=data["location"],
+                transport_type=data["transport_type"],
+                max_capacity=data["max_capacity"],
+                name=data["name"]
+            )
+            courier.current_orders = [self.dispatcher.orders[order_id] for order_id in data["current_orders"]
+                                      if order_id in self.dispatcher.orders]
+            courier.current_capacity = data["current_capacity"]
+            # До первого courier_update курьер не на связи: новых заказов не получает
+            # (его назначения сохраняются, статус придет с обновлением)
+            courier._status = "offline"
+            courier.last_update = 0  # Активным курьер станет после переподключения
+            self.dispatcher.add_courier(courier)
+
+        self.dispatcher.assignments = state["assignments"]
+        self.dispatcher.active_assignments = {
+            order_id: assignment for order_id, assignment in state["active_assignments"].items()
+            if order_id in self.dispatcher.orders and self.dispatcher.orders[order_id].status == "assigned"}
+
+        self.traffic_agent.update_traffic(state["traffic"])
+        self.dispatcher.tracker.seq = state["seq"]
+        self.monitor.update_statistics(self.dispatcher)
+
+    def _journal_snapshot(self):
+        """Полное состояние для снимка журнала (в потоке состояния)"""
+        return {
+            "seq": self.dispatcher.tracker.seq,
+            "couriers": [c.to_dict() for c in self.dispatcher.couriers.values()],
+            "orders": [o.to_dict() for o in self.dispatcher.orders.values()],
+            "assignments": list(self.dispatcher.assignments),
+            "active_assignments": list(self.dispatcher.active_assignments.values()),
+            "traffic": self.traffic_agent.current_condition
+        }
+
+    def register_client(self, client_socket, address, channel):
+        """Регистрирует новое подключение и его очередь отправки (в потоке состояния)"""
+        print(f"🔗 Подключен клиент: {address}")
+        self.clients[client_socket] = {"address": address, "courier_id": None, "decoder": StreamDecoder(),
+                                       "subscription": Subscription()}
+        self.fanout.attach(client_socket, channel)
+
+        # Новый клиент получает снимок своих тем, дальше - только дельты. Снимок
+        # откладывается: курьер успеет представиться и не получит весь парк
+        self.state_loop.submit_later(CONNECT_SNAPSHOT_DELAY, self._send_first_status, client_socket)
+
+    def _send_first_status(self, client_socket):
+        """Первый снимок клиенту, если он еще не получил снимок своих тем"""
+        client = self.clients.get(client_socket)
+        if client is not None and client["subscription"].seq is None:
+            self.send_status(client_socket)
+
+    def unregister_client(self, client_socket, address):
+        """Удаляет подключение из списка клиентов (в потоке состояния; сокет закрывает вызывающий)"""
+        if client_socket in self.clients:
+            courier_id = self.clients[client_socket].get("courier_id")
+            if courier_id and courier_id in self.dispatcher.couriers:
+                print(f"🚫 Курьер {courier_id} отключен")
+                # Можно пометить курьера как offline или удалить
+                # self.dispatcher.couriers[courier_id].status = "offline"
+            if self.courier_connections.get(courier_id) is client_socket:
+                del self.courier_connections[courier_id]
+
+            del self.clients[client_socket]
+        self.fanout.detach(client_socket)
+        print(f"🔌 Клиент {address} отключен")
+
     def handle_client(self, client_socket, address):
         """Обрабатывает подключения клиентов"""
-        print(f"🔗 Подключен клиент: {address}")
-        self.clients[client_socket] = {"address": address, "courier_id": None}
+        self.state_loop.call(self.register_client, client_socket, address,
+                             SocketChannel(client_socket, self.fanout.stats))
+        decoder = self.clients[client_socket]["decoder"]
 
         try:
-            buffer = ""
             while self.running:
                 try:
-                    data = client_socket.recv(BUFFER_SIZE).decode('utf-8')
+                    data = client_socket.recv(BUFFER_SIZE)
                     if not data:
                         break
 
-                    buffer += data
-
-                    # Обрабатываем полные сообщения (разделенные \n)
-                    while '\n' in buffer:
-                        message_str, buffer = buffer.split('\n', 1)
-                        if message_str.strip():
-                            self.process_message(message_str.strip(), client_socket)
+                    # Обрабатываем полные сообщения (строки JSON или бинарные кадры)
+                    decoder.feed(data)
+                    for message in decoder.messages():
+                        self.process_message(message, client_socket)
 
                 except socket.timeout:
                     continue
@@ -66,50 +237,267 @@ class CourierServer:
         except Exception as e:
             print(f"❌ Ошибка с клиентом {address}: {e}")
         finally:
-            # Удаляем курьера при отключении
-            if client_socket in self.clients:
-                courier_id = self.clients[client_socket].get("courier_id")
-                if courier_id and courier_id in self.dispatcher.couriers:
-                    print(f"🚫 Курьер {courier_id} отключен")
-                    # Можно пометить курьера как offline или удалить
-                    # self.dispatcher.couriers[courier_id].status = "offline"
-
-                del self.clients[client_socket]
+            # Удаляем курьера при отключении: после всех его команд в очереди
+            self.state_loop.call(self.unregister_client, client_socket, address)
             client_socket.close()
-            print(f"🔌 Клиент {address} отключен")
 
     def process_message(self, message, client_socket):
-        """Обрабатывает сообщения от клиентов"""
+        """Обрабатывает сообщения от клиентов (строку JSON или декодированный кадр)"""
+        command = self.parse_message(message, client_socket)
+        if command is not None:
+            # Командой в поток состояния, не дожидаясь ее применения
+            self.state_loop.submit(*command)
+
+    def parse_message(self, message, client_socket):
+        """Служебные запросы обрабатывает сразу, для остальных сообщений
+        возвращает команду потока состояния (функция, аргументы...) или None"""
+        started = time.perf_counter()
         try:
-            data = json.loads(message)
+            data = json.loads(message) if isinstance(message, str) else message
             message_type = data.get("type")
 
-            print(f"📨 Получено сообщение типа: {message_type} от {self.clients[client_socket]['address']}")
-
-            if message_type == "courier_update":
-                self.handle_courier_update(data, client_socket)
-            elif message_type == "new_order":
-                self.handle_new_order(data)
-            elif message_type == "order_delivered":
-                self.handle_order_delivered(data)
-            elif message_type == "emergency":
-                self.handle_emergency(data)
-            elif message_type == "traffic_update":
-                self.handle_traffic_update(data)
-            elif message_type == "get_status":
-                self.send_status(client_socket)
-            else:
-                print(f"❓ Неизвестный тип сообщения: {message_type}")
+            if message_type in ("ping", "get_metrics", "hello"):
+                # Служебные запросы состояние не меняют и обрабатываются сразу;
+                # hello - тоже: следующие байты клиента могут быть уже кадрами
+                if message_type == "ping":
+                    self.handle_ping(data, client_socket)
+                elif message_type == "hello":
+                    self.handle_hello(data, client_socket)
+                else:
+                    self.handle_get_metrics(client_socket)
+                metrics.observe(f"message.{message_type}", time.perf_counter() - started)
+                return None
+
+            return self._apply_message, message_type, data, client_socket, started
 
         except json.JSONDecodeError as e:
+            metrics.add("message_errors")
             print(f"❌ Ошибка декодирования JSON: {e}")
             print(f"📄 Полученное сообщение: {message}")
+            return None
+
+    def _apply_message(self, message_type, data, client_socket, started):
+        """Применяет сообщение клиента (в потоке состояния)"""
+        print(f"📨 Получено сообщение типа: {message_type} от {self.clients[client_socket]['address']}")
+        try:
+            self._dispatch_message(message_type, data, client_socket)
+        finally:
+            # Время обработки включает ожидание в очереди команд
+            metrics.observe(f"message.{message_type}", time.perf_counter() - started)
+
+    def _dispatch_message(self, message_type, data, client_socket):
+        """Вызывает обработчик сообщения"""
+        if message_type == "courier_update":
+            self.handle_courier_update(data, client_socket)
+        elif message_type == "courier_updates_batch":
+            self.handle_courier_updates_batch(data)
+        elif message_type == "new_order":
+            self.handle_new_order(data)
+        elif message_type == "new_orders_batch":
+            self.handle_new_orders_batch(data)
+        elif message_type == "order_delivered":
+            self.handle_order_delivered(data)
+        elif message_type == "emergency":
+            self.handle_emergency(data)
+        elif message_type == "traffic_update":
+            self.handle_traffic_update(data)
+        elif message_type == "assignment_ack":
+            self.handle_assignment_ack(data)
+        elif message_type == "subscribe":
+            self.handle_subscribe(data, client_socket)
+        elif message_type in ("get_status", "resync"):
+            self.send_status(client_socket)
+        else:
+            print(f"❓ Неизвестный тип сообщения: {message_type}")
+
+    def handle_ping(self, data, client_socket):
+        """Отвечает pong с тем же id; ответ идет через очередь отправки клиента"""
+        self.fanout.send(client_socket, {"type": "pong", "id": data.get("id"), "timestamp": time.time()})
+
+    def handle_get_metrics(self, client_socket):
+        """Отправляет сводку метрик: задержки по типам сообщений, распределение,
+        подготовка статуса, сериализация и рассылка"""
+        self.fanout.send(client_socket, {
+            "type": "metrics",
+            **metrics.snapshot(),
+            "fanout": self.fanout.stats.snapshot(),
+            "scheduler": self.scheduler.stats(),
+            "shards": self.shard_router.stats() if self.shard_router is not None else None,
+            "pool": self.dispatch_pool.stats() if self.dispatch_pool is not None else None,
+            "state": self.state_loop.stats(),
+            "pending_acks": len(self.pending_acks),
+            "clients": len(self.clients),
+            "timestamp": datetime.now().isoformat()
+        })
+
+    def handle_hello(self, data, client_socket):
+        """Согласует протокол: подтверждение уходит строкой JSON, дальше - кадры"""
+        if data.get("protocol") == BINARY_PROTOCOL:
+            ack = {"type": "hello_ack", "protocol": BINARY_PROTOCOL}
+            if self.fanout.switch_to_binary(client_socket, ack):
+                # Следующие байты клиента разбираются уже как кадры
+                self.clients[client_socket]["decoder"].binary = True
+                print(f"🔀 Клиент {self.clients[client_socket]['address']} перешел на бинарный протокол")
+        else:
+            self.fanout.send(client_socket, {"type": "hello_ack", "protocol": "json"})
+
+    def handle_subscribe(self, data, client_socket):
+        """Заменяет темы подписки клиента и отправляет снимок по новым темам"""
+        try:
+            subscription = Subscription(data.get("topics") or (), explicit=True)
+        except (TypeError, ValueError) as e:
+            print(f"❌ Некорректная подписка от {self.clients[client_socket]['address']}: {e}")
+            return
+        self.clients[client_socket]["subscription"] = subscription
+        print(f"📬 Клиент {self.clients[client_socket]['address']} подписан на: {', '.join(subscription.topics)}")
+        self.send_status(client_socket)
 
     def handle_courier_update(self, data, client_socket):
         """Обновляет данные курьера"""
+        courier, became_free = self._apply_courier_update(data)
+
+        # Сохраняем ID курьера для клиента; курьер без своей подписки
+        # получает только свои назначения
+        client = self.clients[client_socket]
+        if client["courier_id"] is None and not client["subscription"].explicit:
+            client["subscription"] = Subscription(courier_topics(courier.id))
+            self.send_status(client_socket)
+        client["courier_id"] = courier.id
+        # Подтверждения курьер объявляет один раз при регистрации; флаг живет в подключении
+        if "assignment_acks" in data:
+            client["assignment_acks"] = bool(data["assignment_acks"])
+
+        # Новые назначения курьера идут в это подключение; неподтвержденные - повторно
+        if self.courier_connections.get(courier.id) is not client_socket:
+            self.courier_connections[courier.id] = client_socket
+            self._resend_unacked(courier)
+
+        # Распределяем заказы, только если курьер стал доступен (подключение,
+        # выход из ЧП); обновление одного местоположения распределение не запускает
+        if became_free and self.dispatcher.order_index:
+            print(f"📦 Автораспределение заказов для курьера {courier.id}...")
+            # Проход планировщика разошлет обновленный статус всем клиентам
+            self.scheduler.request(couriers=[courier])
+
+    def push_assignment(self, courier, order, assignment):
+        """Отправляет назначение курьеру сразу после закрепления (слушатель диспетчера).
+
+        Курьер, объявивший assignment_acks, подтверждает назначение; без
+        подтверждения оно отправляется повторно, а затем перераспределяется.
+        """
+        client_socket = self.courier_connections.get(courier.id)
+        if client_socket is None:
+            return  # Курьер не на связи (или приходит через шлюз): назначение придет в дельте
+        self._send_assignment(client_socket, courier, order, assignment)
+        if self.clients[client_socket].get("assignment_acks"):
+            self._expect_ack(order.id, courier.id, 1)
+
+    def _send_assignment(self, client_socket, courier, order, assignment):
+        self.fanout.send(client_socket, {
+            "type": "assignment",
+            "courier_id": courier.id,
+            "order_id": order.id,
+            "estimated_time": assignment["estimated_time"],
+            "order": order.to_dict(),
+            "timestamp": datetime.now().isoformat()
+        })
+        metrics.add("assignment_pushes")
+
+    def _expect_ack(self, order_id, courier_id, attempt):
+        self.pending_acks[order_id] = {"courier_id": courier_id, "attempt": attempt, "sent": time.perf_counter()}
+        self.state_loop.submit_later(ASSIGNMENT_ACK_TIMEOUT, self._check_assignment_ack, order_id, attempt)
+
+    def handle_assignment_ack(self, data):
+        """Курьер подтвердил получение назначения"""
+        pending = self.pending_acks.get(data.get("order_id"))
+        if pending is None or pending["courier_id"] != data.get("courier_id"):
+            return  # Повторное подтверждение или заказ уже передан другому
+        del self.pending_acks[data["order_id"]]
+        metrics.observe("assignment.ack", time.perf_counter() - pending["sent"])
+        metrics.add("assignment_acks")
+
+    def _check_assignment_ack(self, order_id, attempt):
+        """Срок подтверждения истек: повторная отправка или перераспределение"""
+        pending = self.pending_acks.get(order_id)
+        if pending is None or pending["attempt"] != attempt:
+            return  # Подтверждено или уже отправлено повторно
+        order = self.dispatcher.orders.get(order_id)
+        courier = self.dispatcher.couriers.get(pending["courier_id"])
+        if order is None or courier is None or order.status != "assigned" or order.assigned_courier != courier.id:
+            del self.pending_acks[order_id]  # Заказ доставлен, снят или передан другому
+            return
+
+        if attempt < ASSIGNMENT_PUSH_ATTEMPTS:
+            client_socket = self.courier_connections.get(courier.id)
+            if client_socket is not None:
+                self._send_assignment(client_socket, courier, order, self.dispatcher.active_assignments[order_id])
+                metrics.add("assignment_resends")
+            self._expect_ack(order_id, courier.id, attempt + 1)
+            return
+
+        # Курьер не отвечает: все его заказы - другим (как при ЧП), сам курьер -
+        # offline и вне распределения до следующего обновления
+        orders = list(courier.current_orders)
+        print(f"⏰ Курьер {courier.id} не подтвердил заказ {order_id}, "
+              f"его заказы перераспределяются: {len(orders)}")
+        for released in orders:
+            self.pending_acks.pop(released.id, None)
+            self.dispatcher.unassign_order(released)
+        courier.status = "offline"
+        metrics.add("assignment_redispatches", len(orders))
+        self.scheduler.request(orders=orders, urgent=True)
+
+    def _resend_unacked(self, courier):
+        """Повторно отправляет неподтвержденные назначения в новое подключение курьера.
+
+        Подключение без assignment_acks подтверждать не будет: ожидание
+        подтверждений снимается, назначения курьер получит в снимке подписки.
+        """
+        client_socket = self.courier_connections[courier.id]
+        acks = self.clients[client_socket].get("assignment_acks")
+        for order_id, pending in list(self.pending_acks.items()):
+            if pending["courier_id"] != courier.id:
+                continue
+            if not acks:
+                del self.pending_acks[order_id]
+            elif order_id in self.dispatcher.active_assignments:
+                self._send_assignment(client_socket, courier, self.dispatcher.orders[order_id],
+                                      self.dispatcher.active_assignments[order_id])
+
+    def handle_courier_updates_batch(self, data):
+        """Применяет пачку обновлений курьеров (например, от шлюза парка):
+        один повод для распределения и одна рассылка на всю пачку"""
+        updates = data.get("updates", [])
+        invalid = [update for update in updates if not self._valid_courier_update(update)]
+        if invalid:
+            print(f"❌ Пачка обновлений курьеров отклонена: {len(invalid)} некорректных записей")
+            return
+
+        freed = {}
+        for update in updates:
+            courier, became_free = self._apply_courier_update(update, verbose=False)
+            if became_free:
+                freed[courier.id] = courier
+
+        print(f"🔄 Пачка обновлений курьеров: {len(updates)}, освободились: {len(freed)}")
+        self.scheduler.request(couriers=freed.values())
+
+    def _valid_courier_update(self, data):
+        """Проверяет, что обновление можно применить (новому курьеру нужны
+        местоположение и транспорт)"""
+        if not isinstance(data, dict) or "courier_id" not in data:
+            return False
+        if data["courier_id"] in self.dispatcher.couriers:
+            return True
+        return "location" in data and "transport_type" in data
+
+    def _apply_courier_update(self, data, verbose=True):
+        """Создает или обновляет курьера. Возвращает (курьер, признак того,
+        что у курьера появился свободный слот)"""
         courier_id = data["courier_id"]
 
         # Создаем или обновляем курьера
+        had_free_slot = False
         if courier_id not in self.dispatcher.couriers:
             # Создаем нового курьера
             courier = CourierAgent(
@@ -120,59 +508,76 @@ class CourierServer:
                 name=data.get("name", f"Courier_{courier_id}")
             )
             self.dispatcher.add_courier(courier)
-            print(f"👤 Зарегистрирован новый курьер: {courier.name} (ID: {courier_id})")
+            if verbose:
+                print(f"👤 Зарегистрирован новый курьер: {courier.name} (ID: {courier_id})")
         else:
             # Обновляем существующего курьера
             courier = self.dispatcher.couriers[courier_id]
+            had_free_slot = courier.has_free_slot()
 
         # Обновляем данные
-        courier.location = data.get("location", courier.location)
+        self.dispatcher.update_courier_location(courier, data.get("location", courier.location))
         courier.status = data.get("status", "available")
         courier.transport_type = data.get("transport_type", courier.transport_type)
         courier.name = data.get("name", courier.name)
         courier.last_update = time.time()
+        self.active_courier_ids.pop(courier_id, None)  # Переносим в конец: обновлен последним
+        self.active_courier_ids[courier_id] = courier.last_update
+        self.dispatcher.tracker.courier_changed(courier_id)
 
-        # Сохраняем ID курьера для клиента
-        self.clients[client_socket]["courier_id"] = courier_id
-
-        print(f"🔄 Обновлен курьер {courier_id}: {courier.status} в {courier.location}")
-
-        # Автоматически распределяем заказы при подключении курьера
-        pending_orders = [o for o in self.dispatcher.orders.values() if o.status == "pending"]
-        if pending_orders and courier.status == "available":
-            print(f"📦 Автораспределение заказов для курьера {courier_id}...")
-            self.dispatcher.assign_orders()
-            self.monitor.update_statistics(self.dispatcher)
-
-            # ✅ ВАЖНО: Рассылаем обновленный статус всем клиентам
-            self.broadcast_system_status()
+        if verbose:
+            print(f"🔄 Обновлен курьер {courier_id}: {courier.status} в {courier.location}")
+        return courier, courier.has_free_slot() and not had_free_slot
 
     def handle_new_order(self, data):
         """Добавляет новый заказ"""
-        order_data = data["order"]
+        order = self._create_order(data["order"])
+        if order is not None:
+            # Распределяем только новый заказ; срочный - без ожидания окна
+            self.scheduler.request(orders=[order], urgent=order.priority == "high")
+            print(f"✅ Заказ {order.id} передан на распределение")
+
+    def handle_new_orders_batch(self, data):
+        """Добавляет пачку заказов: один повод для распределения и одна рассылка на всю пачку"""
+        orders_data = data.get("orders", [])
+        invalid = [order_data for order_data in orders_data if not self._valid_order(order_data)]
+        if invalid:
+            print(f"❌ Пачка заказов отклонена: {len(invalid)} некорректных записей")
+            return
+
+        new_orders = []
+        for order_data in orders_data:
+            order = self._create_order(order_data, verbose=False)
+            if order is not None:
+                new_orders.append(order)
+
+        if not new_orders:
+            return
+
+        self.scheduler.request(orders=new_orders,
+                               urgent=any(order.priority == "high" for order in new_orders))
+        print(f"✅ Пачка заказов: добавлено {len(new_orders)}")
+
+    def _create_order(self, order_data, verbose=True):
+        """Создает заказ, если его еще нет. Возвращает заказ или None"""
         order_id = order_data["id"]
-
-        if order_id not in self.dispatcher.orders:
-            order = OrderAgent(
-                order_id=order_data["id"],
-                destination=order_data["destination"],
-                weight=order_data["weight"],
-                priority=order_data["priority"],
-                time_window=order_data["time_window"],
-                description=order_data.get("description", "")
-            )
-            self.dispatcher.add_order(order)
+        if order_id in self.dispatcher.orders:
+            if verbose:
+                print(f"⚠️ Заказ {order_id} уже существует")
+            return None
+
+        order = OrderAgent(
+            order_id=order_data["id"],
+            destination=order_data["destination"],
+            weight=order_data["weight"],
+            priority=order_data["priority"],
+            time_window=order_data["time_window"],
+            description=order_data.get("description", "")
+        )
+        self.dispatcher.add_order(order)
+        if verbose:
             print(f"📝 Добавлен новый заказ: {order_id} - {order.description}")
-
-            # Распределяем заказ
-            self.dispatcher.assign_orders()
-            self.monitor.update_statistics(self.dispatcher)
-            print(f"✅ Заказ {order_id} распределен")
-
-            # ✅ Рассылаем обновленный статус
-            self.broadcast_system_status()
-        else:
-            print(f"⚠️ Заказ {order_id} уже существует")
+        return order
 
     def handle_order_delivered(self, data):
         """Отмечает заказ как доставленный"""
@@ -193,11 +598,9 @@ class CourierServer:
 
             print(f"✅ Заказ {order_id} доставлен курьером {courier_id}")
 
-            # Обновляем статистику
-            self.monitor.update_statistics(self.dispatcher)
-
-            # Рассылаем обновление статуса
-            self.broadcast_system_status()
+            # У курьера освободилось место - предлагаем ему ближайшие заказы,
+            # проход планировщика обновит статистику и разошлет статус
+            self.scheduler.request(couriers=[courier])
         else:
             print(f"❌ Ошибка доставки: курьер {courier_id} или заказ {order_id} не найден")
 
@@ -207,15 +610,20 @@ class CourierServer:
 
         if emergency_type == "courier_unavailable":
             courier_id = data["courier_id"]
-            self.dispatcher.handle_emergency(courier_id)
+            courier = self.dispatcher.couriers.get(courier_id)
+            released = list(courier.current_orders) if courier else []
+            if self.dispatcher.handle_emergency(courier_id, redispatch=False):
+                # Снятые заказы перераспределяются без ожидания окна
+                self.scheduler.request(orders=released, urgent=True)
             print(f"🚨 Обработана ЧП с курьером {courier_id}")
+            return
         elif emergency_type == "traffic_accident":
             self.traffic_agent.update_traffic("heavy")
             self.dispatcher.traffic_data["factor"] = self.traffic_agent.get_traffic_factor()
             print("🚦 Обновлены данные о трафике: пробки из-за аварии")
 
         self.monitor.update_statistics(self.dispatcher)
-        self.broadcast_system_status()
+        self.state_loop.request_publish()
 
     def handle_traffic_update(self, data):
         """Обновляет данные о трафике"""
@@ -224,57 +632,64 @@ class CourierServer:
         if result:
             self.dispatcher.traffic_data["factor"] = result["factor"]
             print(f"🚦 Обновлено состояние трафика: {result['description']}")
-            self.broadcast_system_status()
+            self.state_loop.request_publish()
 
     def send_status(self, client_socket):
-        """Отправляет текущий статус системы клиенту"""
-        status_data = self._prepare_status_data()
-
-        try:
-            response = json.dumps(status_data, ensure_ascii=False) + "\n"
-            client_socket.send(response.encode('utf-8'))
-        except Exception as e:
-            print(f"❌ Ошибка отправки статуса: {e}")
+        """Отправляет клиенту снимок состояния по темам его подписки.
+
+        Подписчики на все состояние из одной пачки команд получают один и тот же
+        снимок: он собирается и сериализуется один раз. Изменения, сделанные
+        в пачке после него, придут следующей дельтой.
+        """
+        subscription = self.clients[client_socket]["subscription"]
+        if not subscription.everything:
+            with metrics.timer("status.filtered"):
+                active_couriers = self._active_couriers()
+                self._refresh_statistics()
+                status_data = subscription.filter_status(
+                    self.dispatcher, self.dispatcher.tracker.seq, active_couriers, self.monitor.statistics,
+                    self.traffic_agent.current_condition, datetime.now().isoformat())
+            self.fanout.send(client_socket, status_data, SNAPSHOT)
+            return
+
+        key = (self.state_loop.batch, self.dispatcher.tracker.seq)
+        if self._status_cache is None or self._status_cache[0] != key:
+            self._status_cache = (key, EncodedMessage(self._prepare_status_data(), self.fanout.stats))
+        subscription.seq = self.dispatcher.tracker.seq
+        self.fanout.send(client_socket, self._status_cache[1], SNAPSHOT)
+
+    def _active_couriers(self):
+        """Только активные курьеры (обновленные за последние 5 минут,
+        см. expire_inactive_couriers)"""
+        couriers = self.dispatcher.couriers
+        return [couriers[courier_id] for courier_id in self.active_courier_ids if courier_id in couriers]
+
+    def _refresh_statistics(self):
+        """Статистика по счетчикам реестров, без перебора курьеров и заказов.
+        Утилизация - доля занятых курьеров среди активных"""
+        self.monitor.update_statistics(self.dispatcher)
+        active = len(self.active_courier_ids)
+        busy = self.dispatcher.courier_count("busy") + self.dispatcher.courier_count("emergency")
+        self.monitor.statistics["courier_utilization"] = min(busy, active) / active * 100 if active else 0
 
     def _prepare_status_data(self):
-        """Подготавливает данные статуса"""
-        # Только активные курьеры (обновленные за последние 5 минут)
-        active_couriers = []
-        current_time = time.time()
-        for courier in self.dispatcher.couriers.values():
-            if current_time - courier.last_update < 300:  # 5 минут
-                active_couriers.append(courier)
-
-        # Активные назначения
-        active_assignments = []
-        for assignment in self.dispatcher.assignments:
-            courier_id = assignment.get('courier_id')
-            if courier_id in [c.id for c in active_couriers]:
-                # Проверяем, существует ли еще заказ и он не доставлен
-                order_id = assignment.get('order_id')
-                if (order_id in self.dispatcher.orders and
-                        self.dispatcher.orders[order_id].status != "delivered"):
-                    active_assignments.append(assignment)
-
-        # Корректная статистика
-        orders_list = list(self.dispatcher.orders.values())
-        total_orders = len(orders_list)
-        delivered_orders = len([o for o in orders_list if o.status == "delivered"])
-        in_progress_orders = len([o for o in orders_list if o.status == "assigned"])
-        pending_orders = len([o for o in orders_list if o.status == "pending"])
-
-        # Обновляем статистику монитора
-        self.monitor.statistics.update({
-            "total_orders": total_orders,
-            "delivered": delivered_orders,
-            "in_progress": in_progress_orders,
-            "pending": pending_orders,
-            "courier_utilization": (len([c for c in active_couriers if c.current_orders]) / len(
-                active_couriers) * 100) if active_couriers else 0
-        })
+        """Подготавливает полный снимок статуса (при подключении и resync)"""
+        with metrics.timer("status.snapshot"):
+            return self._build_status_data()
+
+    def _build_status_data(self):
+        active_couriers = self._active_couriers()
+
+        # Все незавершенные назначения: курьер может снова стать активным
+        # (переподключение, восстановление из журнала), а дельты назначений
+        # повторно не присылаются. Клиенты скрывают назначения невидимых курьеров.
+        active_assignments = list(self.dispatcher.active_assignments.values())
+
+        self._refresh_statistics()
 
         return {
             "type": "system_status",
+            "seq": self.dispatcher.tracker.seq,
             "couriers": [c.to_dict() for c in active_couriers],
             "orders": [o.to_dict() for o in self.dispatcher.orders.values()],
             "assignments": active_assignments,
@@ -283,58 +698,201 @@ class CourierServer:
             "timestamp": datetime.now().isoformat()
         }
 
+    def _prepare_status_delta(self):
+        """Подготавливает дельту: только изменившиеся с прошлой версии объекты"""
+        with metrics.timer("status.delta"):
+            return self._build_status_delta()
+
+    def _build_status_delta(self):
+        seq, courier_ids, removed_courier_ids, order_ids, assigned_ids, unassigned_ids = \
+            self.dispatcher.tracker.next_version()
+
+        couriers = [self.dispatcher.couriers[courier_id].to_dict()
+                    for courier_id in courier_ids if courier_id in self.dispatcher.couriers]
+        orders = [self.dispatcher.orders[order_id].to_dict()
+                  for order_id in order_ids if order_id in self.dispatcher.orders]
+        assignments = [self.dispatcher.active_assignments[order_id]
+                       for order_id in assigned_ids if order_id in self.dispatcher.active_assignments]
+
+        self._refresh_statistics()
+
+        return {
+            "type": "state_delta",
+            "seq": seq,
+            "base_seq": seq - 1,
+            "couriers": couriers,
+            "removed_couriers": list(removed_courier_ids),
+            "orders": orders,
+            "assignments": assignments,
+            "removed_assignments": list(unassigned_ids),
+            "statistics": self.monitor.statistics,
+            "traffic": self.traffic_agent.current_condition,
+            "timestamp": datetime.now().isoformat()
+        }
+
     def broadcast_system_status(self):
-        """Рассылает статус системы всем клиентам"""
-        status_data = self._prepare_status_data()
-        self.broadcast_message(status_data)
-
-    def broadcast_message(self, message):
-        """Отправляет сообщение всем подключенным клиентам"""
-        disconnected_clients = []
-        for client_socket in list(self.clients.keys()):
-            try:
-                response = json.dumps(message, ensure_ascii=False) + "\n"
-                client_socket.send(response.encode('utf-8'))
-            except:
-                disconnected_clients.append(client_socket)
-
-        # Удаляем отключенных клиентов
-        for client_socket in disconnected_clients:
-            if client_socket in self.clients:
-                courier_id = self.clients[client_socket].get("courier_id")
-                print(f"🗑️ Удален отключенный клиент (курьер {courier_id})")
-                del self.clients[client_socket]
+        """Рассылает всем клиентам изменения состояния с прошлой рассылки
+        (в потоке состояния: после пачки команд, запросивших рассылку)"""
+        status_delta = self._prepare_status_delta()
+        if self.journal is not None:
+            self.journal.append_version(status_delta)
+        self.publish_delta(status_delta)
+        self.send_pending_snapshots()
+
+    def publish_delta(self, status_delta):
+        """Рассылает дельту по подпискам: подписчикам на все - общую (сериализуется
+        один раз), остальным - собранную из их тем, если в ней что-то есть"""
+        everything = []
+        filtered = 0
+        with metrics.timer("status.route"):
+            for handle, client in self.clients.items():
+                subscription = client["subscription"]
+                if subscription.seq is None:
+                    continue  # Первый снимок еще не отправлен, он будет свежее дельты
+                if subscription.everything:
+                    subscription.seq = status_delta["seq"]
+                    everything.append(handle)
+                    continue
+                message = subscription.filter_delta(status_delta)
+                if message is not None:
+                    self.fanout.send(handle, message, DELTA)
+                    filtered += 1
+        metrics.add("filtered_deltas", filtered)
+        if everything:
+            self.fanout.broadcast(status_delta, DELTA, handles=everything)
+
+    def send_pending_snapshots(self):
+        """Отправляет свежий снимок клиентам, у которых выброшены дельты"""
+        for handle in self.fanout.lagging():
+            if handle in self.clients:
+                self.send_status(handle)
+
+    def expire_inactive_couriers(self):
+        """Исключает из состояния клиентов курьеров, давно не выходивших на связь.
+
+        active_courier_ids упорядочен по времени обновления, поэтому просматриваются
+        только истекшие курьеры в начале, а не все курьеры.
+        """
+        deadline = time.time() - COURIER_ACTIVE_TIMEOUT
+        while self.active_courier_ids:
+            courier_id, last_update = next(iter(self.active_courier_ids.items()))
+            if last_update > deadline:
+                break
+            del self.active_courier_ids[courier_id]
+            self.dispatcher.tracker.courier_removed(courier_id)
+
+    def broadcast_message(self, message, kind=REPLY):
+        """Отправляет сообщение всем подключенным клиентам.
+
+        Сообщение сериализуется один раз и ставится в очереди отправки,
+        медленные клиенты обрабатываются по SLOW_CONSUMER_POLICY.
+        """
+        self.fanout.broadcast(message, kind)
 
     def periodic_tasks(self):
         """Периодические задачи сервера"""
         while self.running:
-            time.sleep(10)
-
-            # Обновляем статистику
-            self.monitor.update_statistics(self.dispatcher)
-
-            # Автоматически распределяем заказы
-            pending_orders = [o for o in self.dispatcher.orders.values() if o.status == "pending"]
-            active_couriers = [c for c in self.dispatcher.couriers.values()
-                               if time.time() - c.last_update < 300 and c.status == "available"]
-
-            if pending_orders and active_couriers:
-                print(f"🔄 Автораспределение: {len(pending_orders)} заказов, {len(active_couriers)} курьеров")
-                self.dispatcher.assign_orders()
-                self.monitor.update_statistics(self.dispatcher)
-                # ✅ Рассылаем обновление после автораспределения
-                self.broadcast_system_status()
-
-            # Рассылаем обновление статуса
-            update_msg = {
-                "type": "periodic_update",
-                "statistics": self.monitor.statistics,
-                "timestamp": datetime.now().isoformat()
-            }
-            self.broadcast_message(update_msg)
-
-            print(f"📊 Сервер: {len(self.clients)} клиентов, {len(self.dispatcher.orders)} заказов, "
-                  f"{self.monitor.statistics['delivered']} доставлено")
+            time.sleep(PERIODIC_INTERVAL)
+            self.state_loop.submit(self.run_periodic_tick)
+
+    def run_periodic_tick(self):
+        """Один шаг периодических задач: статистика, распределение, рассылка (в потоке состояния)"""
+        # Обновляем статистику
+        self.expire_inactive_couriers()
+        self._refresh_statistics()
+
+        # Автоматически распределяем заказы
+        pending_count = self.dispatcher.order_count("pending")
+        available_count = self.dispatcher.courier_count("available")
+
+        if pending_count and available_count:
+            print(f"🔄 Автораспределение: {pending_count} заказов, {available_count} курьеров")
+            # Полный проход (с рассылкой) выполнит планировщик
+            self.scheduler.request(full=True)
+
+        # Рассылаем обновление статуса
+        update_msg = {
+            "type": "periodic_update",
+            "statistics": self.monitor.statistics,
+            "timestamp": datetime.now().isoformat()
+        }
+        self.fanout.broadcast(update_msg, PERIODIC, handles=[
+            handle for handle, client in self.clients.items()
+            if client["subscription"].everything or client["subscription"].stats])
+        self.send_pending_snapshots()
+
+        # Компактный снимок, чтобы восстановление не проигрывало длинный журнал
+        if self.journal is not None and self.journal.needs_snapshot():
+            self.journal.write_snapshot(self._journal_snapshot())
+
+        fanout_stats = self.fanout.stats.snapshot()
+        scheduler_stats = self.scheduler.stats()
+        print(f"📊 Сервер: {len(self.clients)} клиентов, {len(self.dispatcher.orders)} заказов, "
+              f"{self.monitor.statistics['delivered']} доставлено | рассылка: "
+              f"заменено {fanout_stats['coalesced']}, отброшено {fanout_stats['dropped']}, "
+              f"отключено {fanout_stats['disconnected']} | распределение: "
+              f"проходов {scheduler_stats['passes']}, поводов на проход {scheduler_stats['absorbed_avg']:.1f} "
+              f"(макс. {scheduler_stats['absorbed_max']}), задержка {scheduler_stats['latency_avg_ms']:.0f} мс "
+              f"(макс. {scheduler_stats['latency_max_ms']:.0f})")
+
+    def run_dispatch_pass(self, orders, couriers, full):
+        """Проход распределения по накопленным поводам и одна рассылка (из планировщика)"""
+        snapshot = self.state_loop.call(self._start_dispatch_pass, orders, couriers, full)
+        if snapshot is not None:
+            self._run_pool_pass(snapshot)
+
+    def _start_dispatch_pass(self, orders, couriers, full):
+        """Выполняет проход на месте или возвращает снимок для пула процессов (в потоке состояния)"""
+        candidates = None if full else self._dispatch_candidates(orders, couriers)
+        if self.dispatch_pool is not None:
+            with metrics.timer("dispatch.snapshot"):
+                snapshot = self.dispatch_pool.snapshot(candidates)
+            if snapshot is not None:
+                return snapshot
+
+        engine = self.shard_router or self.dispatcher
+        if full:
+            with metrics.timer("dispatch.assign_orders"):
+                engine.assign_orders()
+        else:
+            with metrics.timer("dispatch.incremental"):
+                engine.dispatch_orders(candidates)
+        self.monitor.update_statistics(self.dispatcher)
+        self.state_loop.request_publish()
+        return None
+
+    def _dispatch_candidates(self, orders, couriers):
+        """Новые и снятые заказы плюс ожидающие рядом с освободившимися курьерами"""
+        candidates = {order.id: order for order in orders}
+        for order in self.dispatcher.orders_near_couriers(couriers):
+            candidates.setdefault(order.id, order)
+        return list(candidates.values())
+
+    def _run_pool_pass(self, snapshot):
+        """Расчет по снимку в пуле процессов: поток состояния тем временем применяет
+        команды клиентов, закрепление - снова командой в потоке состояния"""
+        try:
+            with metrics.timer("dispatch.solve"):
+                proposals = self.dispatch_pool.solve(snapshot)
+        except Exception as e:
+            print(f"❌ Пул распределения недоступен ({e}), проходы выполняются в процессе сервера")
+            self.dispatch_pool.close()
+            self.dispatch_pool = None
+            self.scheduler.request(full=True)
+            return
+
+        stale = self.state_loop.call(self._commit_pool_pass, snapshot, proposals)
+        if stale:
+            # Курьеры изменились, пока шел расчет: эти заказы - в следующий проход
+            self.scheduler.request(orders=stale)
+
+    def _commit_pool_pass(self, snapshot, proposals):
+        """Закрепляет предложения пула (в потоке состояния). Возвращает устаревшие заказы"""
+        with metrics.timer("dispatch.commit"):
+            stale = self.dispatch_pool.commit(snapshot, proposals)
+        self.monitor.update_statistics(self.dispatcher)
+        self.state_loop.request_publish()
+        return stale
 
     def start_server(self):
         """Запускает сервер"""
@@ -344,7 +902,7 @@ class CourierServer:
 
         try:
             server_socket.bind((SERVER_HOST, SERVER_PORT))
-            server_socket.listen(5)
+            server_socket.listen(SERVER_BACKLOG)
             print(f"🚀 Сервер запущен на {SERVER_HOST}:{SERVER_PORT}")
             print("⏳ Ожидание подключений...")
 
@@ -377,12 +935,54 @@ class CourierServer:
         finally:
             self.running = False
             server_socket.close()
-            # Сохраняем результаты перед выходом
-            from data_loader import DataLoader
+            self.shutdown()
+
+    def shutdown(self, save=True):
+        """Сохраняет результаты перед выходом. save=False - только останавливает
+        потоки и процессы, без снимка журнала и output_results.json (замеры, проверки)"""
+        # Оставшийся проход планировщика еще идет через поток состояния,
+        # после его остановки состояние меняет только вызывающий поток
+        self.scheduler.stop()
+        self.state_loop.stop()
+        if self.shard_router is not None:
+            self.shard_router.close()
+        if self.dispatch_pool is not None:
+            self.dispatch_pool.close()
+        if self.journal is not None:
+            if save:
+                self.journal.write_snapshot(self._journal_snapshot())
+            self.journal.close()
+        if save:
             DataLoader.save_output_data(self.dispatcher, self.monitor)
-            print("🔴 Сервер остановлен")
+        print("🔴 Сервер остановлен")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Сервер системы доставки')
+    parser.add_argument('--mode', choices=['threaded', 'asyncio'], default=SERVER_MODE,
+                        help='Модель ввода-вывода: поток на клиента или цикл событий asyncio')
+    parser.add_argument('--orders', default="input_data.json",
+                        help='Файл заказов (JSON или NDJSON), загружается потоково')
+    parser.add_argument('--shards', type=int, default=DISPATCH_SHARDS,
+                        help='Число процессов-регионов для распределения (0 - в процессе сервера)')
+    parser.add_argument('--pool-workers', type=int, default=DISPATCH_POOL_WORKERS,
+                        help='Процессов для расчета назначений по снимку (0 - в процессе сервера)')
+    parser.add_argument('--journal', nargs='?', const=JOURNAL_DIR, default=JOURNAL_DIR if JOURNAL_ENABLED else None,
+                        metavar='DIR', help=f'Вести журнал и восстанавливаться из него (каталог, по умолчанию {JOURNAL_DIR})')
+
+    args = parser.parse_args()
+
+    if args.mode == "asyncio":
+        from async_server import AsyncCourierServer
+        server = AsyncCourierServer(journal_dir=args.journal, orders_file=args.orders, shards=args.shards,
+                                    pool_workers=args.pool_workers)
+    else:
+        server = CourierServer(journal_dir=args.journal, orders_file=args.orders, shards=args.shards,
+                               pool_workers=args.pool_workers)
+    server.start_server()
 
 
 if __name__ == "__main__":
-    server = CourierServer()
-    server.start_server()
\ No newline at end of file
+    main()
\ No newline at end of file
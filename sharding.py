@@ -0,0 +1,522 @@
+"""Распределение по регионам города в отдельных процессах.
+
+Город делится на регионы медианными разрезами (k-d дерево) по точкам
+курьеров и заказов. Каждым регионом владеет процесс-воркер со своим
+DispatcherAgent: в нем курьеры, находящиеся в регионе, и ожидающие заказы
+с точкой доставки в регионе. Роутер в процессе сервера узнает об
+изменениях курьеров и заказов от StateTracker диспетчера и перед каждым
+проходом досылает воркерам только их, воркеры распределяют заказы
+параллельно и возвращают предложенные назначения, а закрепляет их
+диспетчер сервера - он остается единственным владельцем состояния
+(журнал, рассылки, статусы).
+
+Заказ у границы региона (ближе SHARD_BORDER_KM), который владелец не
+смог назначить или назначает с опозданием, передается соседнему региону
+вторым раундом; опоздание владельца закрепляется, только если сосед не
+успевает тоже.
+
+Когда в одном регионе курьеров становится больше SHARD_REBALANCE_RATIO
+от среднего, регионы строятся заново по текущим точкам, а воркеры
+получают свои данные с нуля.
+"""
+import math
+import multiprocessing
+import os
+import sys
+
+import geo
+from agents import DispatcherAgent, CourierAgent, OrderAgent
+from config import (DISPATCH_SHARDS, SHARD_BORDER_KM, SHARD_MIN_ORDERS, SHARD_REBALANCE_RATIO,
+                    SHARD_REBALANCE_MIN_PASSES, GEO_REFERENCE_LATITUDE)
+
+KM_PER_DEGREE = geo.EARTH_RADIUS_KM * math.pi / 180
+
+
+class ShardMap:
+    """Регионы города: k-d дерево медианных разрезов.
+
+    Узел - (ось, значение, левое поддерево, правое поддерево), ось 0 -
+    широта, 1 - долгота; лист - номер региона. Регионы на краях не
+    ограничены, поэтому любая точка попадает в какой-то регион.
+    """
+
+    def __init__(self, tree, lon_scale: float):
+        self.tree = tree
+        self.km_per_degree = (KM_PER_DEGREE, KM_PER_DEGREE * lon_scale)
+
+    @classmethod
+    def from_points(cls, points, count, lon_scale: float = geo.lon_scale(GEO_REFERENCE_LATITUDE)):
+        """Делит точки на count регионов с примерно равным числом точек.
+
+        Разрез идет по оси с большим разбросом в километрах, число регионов
+        делится пополам (при нечетном - с долями по числу регионов).
+        """
+        scale = (1.0, lon_scale)
+        shard_ids = iter(range(count))
+
+        def split(points, count):
+            if count == 1:
+                return next(shard_ids)
+            spreads = [(max(p[axis] for p in points) - min(p[axis] for p in points)) * scale[axis]
+                       if points else 0.0 for axis in (0, 1)]
+            axis = 0 if spreads[0] >= spreads[1] else 1
+            points = sorted(points, key=lambda p: p[axis])
+            left_count = count // 2
+            middle = len(points) * left_count // count
+            value = points[middle][axis] if points else 0.0
+            return (axis, value, split(points[:middle], left_count), split(points[middle:], count - left_count))
+
+        return cls(split(list(points), count), lon_scale)
+
+    def locate(self, point):
+        """(регион, расстояние до ближайшей границы в км, регион за этой границей)"""
+        node = self.tree
+        border_km = math.inf
+        beyond = None
+        while not isinstance(node, int):
+            axis, value, left, right = node
+            gap = abs(point[axis] - value) * self.km_per_degree[axis]
+            if point[axis] < value:
+                node, other = left, right
+            else:
+                node, other = right, left
+            if gap < border_km:
+                border_km, beyond = gap, other
+        return node, border_km, self._leaf(beyond, point) if beyond is not None else None
+
+    @staticmethod
+    def _leaf(node, point):
+        """Регион поддерева, ближайший к точке вдоль его разрезов"""
+        while not isinstance(node, int):
+            axis, value, left, right = node
+            node = left if point[axis] < value else right
+        return node
+
+
+# Данные для процессов передаются кортежами: так меньше байт, и их нельзя изменить
+def order_payload(order):
+    # Окно передается готовым: у воркера может быть другой DAY_ZERO (см. time_windows)
+    return (order.id, order.destination, order.weight, order.priority, order.time_window, order.created_time,
+            order.window_start, order.window_end)
+
+
+def courier_payload(courier, route):
+    return (courier.id, courier.location, courier.transport_type, courier.max_capacity, courier.status,
+            courier.current_capacity, tuple(order_payload(order) for order in route))
+
+
+def _make_order(payload, status="pending"):
+    order_id, destination, weight, priority, time_window, created_time, window_start, window_end = payload
+    order = OrderAgent(order_id, destination, weight, priority, time_window, created_time=created_time)
+    order.window_start, order.window_end = window_start, window_end
+    order._status = status
+    return order
+
+
+class ShardDispatcher(DispatcherAgent):
+    """Диспетчер региона в процессе-воркере.
+
+    Назначения он закрепляет только у себя, чтобы в пределах прохода не
+    отдать курьеру больше, чем тот может взять; роутеру они возвращаются
+    как предложения (id курьера, id заказа, с опозданием ли).
+    """
+
+    def __init__(self, engine, mode):
+        super().__init__(engine=engine, mode=mode)
+        self.proposals = []
+
+    def _commit_assignment(self, courier, order, delivery_time, score):
+        self.proposals.append((courier.id, order.id, self.current_minute + delivery_time > order.window_end))
+        return super()._commit_assignment(courier, order, delivery_time, score)
+
+    def apply_sync(self, sync):
+        """Применяет изменения региона, присланные роутером"""
+        if sync.get("reset"):
+            # Регионы построены заново: все нужное придет в этой же синхронизации
+            for courier_id in list(self.couriers):
+                self.remove_courier(courier_id)
+            for order_id in list(self.orders):
+                self.remove_order(order_id)
+        for courier_id in sync["removed_couriers"]:
+            self.remove_courier(courier_id)
+        for order_id in sync["removed_orders"]:
+            self.remove_order(order_id)
+        for payload in sync["couriers"]:
+            self._replace_courier(payload)
+        for payload in sync["orders"]:
+            self.remove_order(payload[0])
+            self.add_order(_make_order(payload))
+
+    def _replace_courier(self, payload):
+        courier_id, location, transport_type, max_capacity, status, current_capacity, route = payload
+        self.remove_courier(courier_id)
+        courier = CourierAgent(courier_id, location, transport_type, max_capacity)
+        courier.current_orders = [_make_order(order, "assigned") for order in route]
+        courier.current_capacity = current_capacity
+        courier._status = status
+        self.add_courier(courier)
+        self.routes.routes[courier_id] = list(courier.current_orders)  # Порядок объезда - как на сервере
+
+    def run(self, request):
+        """Один раунд прохода: синхронизация и распределение.
+
+        Возвращает предложения и пограничные заказы, которые стоит
+        передать соседу (не назначены или назначены с опозданием).
+        """
+        if request.get("sync"):
+            self.apply_sync(request["sync"])
+        minute = request["clock"]
+        self.clock = lambda: minute
+        self.current_minute = minute
+        self.traffic_data["factor"] = request["traffic"]
+
+        guests = [_make_order(payload) for payload in request.get("guests", ())]
+        for order in guests:
+            self.add_order(order)
+
+        self.proposals = []
+        if request.get("full"):
+            self.assign_orders()
+        else:
+            orders = [self.orders[order_id] for order_id in request.get("order_ids", ()) if order_id in self.orders]
+            if orders or guests:
+                self.dispatch_orders(orders + guests)
+
+        late = {order_id for _, order_id, is_late in self.proposals if is_late}
+        handoff = [order_id for order_id in request.get("border_ids", ())
+                   if order_id in late or (order_id in self.orders and self.orders[order_id].status == "pending")]
+
+        # Гости принадлежат другому региону, а журнал назначений и изменений воркеру не нужен
+        for order in guests:
+            self.remove_order(order.id)
+        self.assignments.clear()
+        self.tracker.next_version()
+        return {"proposals": self.proposals, "handoff": handoff, "available": self.courier_count("available")}
+
+
+def shard_worker(conn, engine, mode):
+    """Цикл процесса региона: запрос роутера -> ответ; None - завершение"""
+    sys.stdout = open(os.devnull, "w")  # Назначения печатает сервер, когда закрепляет их
+    dispatcher = ShardDispatcher(engine, mode)
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        conn.send(dispatcher.run(request))
+
+
+class ShardRouter:
+    """Проходы распределения по регионам в процессах-воркерах.
+
+    Повторяет интерфейс проходов DispatcherAgent (assign_orders,
+    dispatch_orders). Проходы меньше SHARD_MIN_ORDERS заказов выполняются
+    диспетчером сервера: передача данных стоила бы дороже самого прохода.
+
+    Роутер - наблюдатель StateTracker диспетчера: id измененных курьеров и
+    заказов копятся в грязных множествах, и синхронизация перед проходом
+    стоит пропорционально изменениям, а не числу курьеров и заказов.
+    """
+
+    def __init__(self, dispatcher: DispatcherAgent, count: int = DISPATCH_SHARDS,
+                 border_km: float = SHARD_BORDER_KM, min_orders: int = SHARD_MIN_ORDERS):
+        self.dispatcher = dispatcher
+        self.count = count
+        self.border_km = border_km
+        self.min_orders = min_orders
+        self.map = None  # Строится по точкам первого прохода по регионам и при перекосе
+        self.passes_since_rebuild = 0
+        self.rebuilt_skew = 1.0  # Перекос сразу после построения: сильнее регионы по этим точкам не выровнять
+
+        # Процессы запускаются через spawn: у сервера уже работают потоки
+        context = multiprocessing.get_context("spawn")
+        self.workers = []  # [(процесс, соединение)]
+        for shard in range(count):
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target=shard_worker, args=(child_conn, dispatcher.engine, dispatcher.mode),
+                                      name=f"shard-{shard}", daemon=True)
+            process.start()
+            child_conn.close()
+            self.workers.append((process, parent_conn))
+
+        # Что уже отправлено воркерам
+        self.courier_shards = {}  # {id курьера: (местоположение, регион)}
+        self.courier_signatures = {}  # {id курьера: отпечаток состояния}
+        self.shard_couriers = [0] * count  # Курьеров в каждом регионе
+        self.order_regions = {}  # {id заказа: (регион, регион-сосед или None)} для отправленных
+        self.sent_orders = [set() for _ in range(count)]
+        self.border_orders = [set() for _ in range(count)]  # Отправленные заказы у границы
+        self.reset_workers = False  # Регионы перестроены: воркеры начинают с нуля
+
+        # Изменилось с прошлой синхронизации (или воркер мог изменить у себя)
+        self.dirty_couriers = set()
+        self.dirty_orders = set()
+        dispatcher.tracker.observers.append(self)
+
+        self.metrics = {"passes": 0, "local_passes": 0, "proposals": 0, "committed": 0,
+                        "rejected": 0, "handed_off": 0, "handoff_committed": 0, "rebalances": 0,
+                        "synced_couriers": 0, "synced_orders": 0}
+
+    # Наблюдатель StateTracker: вызывается в потоке состояния при каждом изменении
+    def courier_changed(self, courier_id):
+        self.dirty_couriers.add(courier_id)
+
+    def courier_removed(self, courier_id):
+        self.dirty_couriers.add(courier_id)  # Скрыт от клиентов; есть ли он у диспетчера - решит _sync
+
+    def order_changed(self, order_id):
+        self.dirty_orders.add(order_id)
+
+    def assign_orders(self):
+        """Полный проход по всем ожидающим заказам"""
+        dispatcher = self.dispatcher
+        if dispatcher.order_count("pending") < self.min_orders or not self.workers:
+            self.metrics["local_passes"] += 1
+            dispatcher.assign_orders()
+            return
+        if not dispatcher.deadline_index or not dispatcher.available_couriers():
+            return
+        self._run_pass(None)
+
+    def dispatch_orders(self, orders):
+        """Инкрементальный проход по переданным заказам; возвращает новые назначения"""
+        dispatcher = self.dispatcher
+        pending_orders = [order for order in orders if order.status == "pending"]
+        if len(pending_orders) < self.min_orders or not self.workers:
+            self.metrics["local_passes"] += 1
+            return dispatcher.dispatch_orders(pending_orders)
+        first_new = len(dispatcher.assignments)
+        self._run_pass(pending_orders)
+        return dispatcher.assignments[first_new:]
+
+    def _run_pass(self, orders):
+        dispatcher = self.dispatcher
+        dispatcher.current_minute = dispatcher.clock()
+        if self.map is None:
+            self._rebuild_map()
+
+        syncs = self._sync()
+        if self._unbalanced():
+            self._rebuild_map()
+            syncs = self._sync()
+            self.rebuilt_skew = self._skew()
+        self.passes_since_rebuild += 1
+
+        if orders is None:
+            order_ids = [[] for _ in range(self.count)]
+            border_ids = [list(border) for border in self.border_orders]
+        else:
+            order_ids = [[] for _ in range(self.count)]
+            border_ids = [[] for _ in range(self.count)]
+            for order in orders:
+                shard, neighbour = self._order_region(order)
+                order_ids[shard].append(order.id)
+                if neighbour is not None:
+                    border_ids[shard].append(order.id)
+
+        common = {"clock": dispatcher.current_minute, "traffic": dispatcher.traffic_data.get("factor", 1.0)}
+        try:
+            # Первый раунд: каждый регион распределяет свои заказы
+            replies = self._exchange({shard: dict(common, sync=syncs[shard], full=orders is None,
+                                                  order_ids=order_ids[shard], border_ids=border_ids[shard])
+                                      for shard in range(self.count)})
+
+            # Второй раунд: пограничные заказы, с которыми владелец не справился, - соседу,
+            # если у того остались свободные курьеры
+            guests = {}
+            handed_off = set()
+            for shard, reply in replies.items():
+                for order_id in reply["handoff"]:
+                    neighbour = self.order_regions[order_id][1]
+                    if not replies[neighbour]["available"]:
+                        continue
+                    guests.setdefault(neighbour, []).append(order_payload(dispatcher.orders[order_id]))
+                    handed_off.add(order_id)
+            handoff_replies = self._exchange({shard: dict(common, guests=payloads)
+                                              for shard, payloads in guests.items()}) if guests else {}
+        except (EOFError, OSError) as e:
+            print(f"❌ Воркер региона недоступен ({e}), распределение продолжается в процессе сервера")
+            self.close()
+            if orders is None:
+                dispatcher.assign_orders()
+            else:
+                dispatcher.dispatch_orders(orders)
+            return
+
+        self.metrics["passes"] += 1
+        self.metrics["handed_off"] += len(handed_off)
+
+        # Сначала назначения без опоздания: свои, затем соседские; опоздания - в последнюю очередь
+        held = []
+        for reply in replies.values():
+            for courier_id, order_id, late in reply["proposals"]:
+                self._invalidate(courier_id, order_id)
+                if late and order_id in handed_off:
+                    held.append((courier_id, order_id, False))
+                else:
+                    self._commit(courier_id, order_id, False)
+        handoff_late = []
+        for reply in handoff_replies.values():
+            for courier_id, order_id, late in reply["proposals"]:
+                self._invalidate(courier_id, None)
+                if late:
+                    handoff_late.append((courier_id, order_id, True))
+                else:
+                    self._commit(courier_id, order_id, True)
+        for courier_id, order_id, handoff in held + handoff_late:
+            self._commit(courier_id, order_id, handoff)
+
+    def _exchange(self, requests):
+        """Отправляет запросы воркерам и ждет всех ответов: регионы считаются параллельно"""
+        for shard, request in requests.items():
+            self.workers[shard][1].send(request)
+        return {shard: self.workers[shard][1].recv() for shard in requests}
+
+    def _commit(self, courier_id, order_id, handoff):
+        dispatcher = self.dispatcher
+        self.metrics["proposals"] += 1
+        courier = dispatcher.couriers.get(courier_id)
+        order = dispatcher.orders.get(order_id)
+        if courier is None or order is None or dispatcher.apply_assignment(courier, order) is None:
+            self.metrics["rejected"] += 1
+            return
+        self.metrics["committed"] += 1
+        if handoff:
+            self.metrics["handoff_committed"] += 1
+
+    def _invalidate(self, courier_id, order_id):
+        """Воркер изменил курьера (и заказ) у себя: при следующей синхронизации
+        они будут отправлены заново в том виде, в каком их закрепил сервер"""
+        self.courier_signatures.pop(courier_id, None)
+        self.dirty_couriers.add(courier_id)
+        if order_id is not None:
+            self.dirty_orders.add(order_id)
+
+    def _order_region(self, order):
+        region = self.order_regions.get(order.id)
+        if region is None:
+            shard, border_km, neighbour = self.map.locate(order.destination)
+            region = self.order_regions[order.id] = (shard, neighbour if border_km < self.border_km else None)
+        return region
+
+    def _sync(self):
+        """Изменения для каждого воркера с прошлой синхронизации (только грязные id)"""
+        dispatcher = self.dispatcher
+        syncs = [{"couriers": [], "removed_couriers": [], "orders": [], "removed_orders": []}
+                 for _ in range(self.count)]
+        if self.reset_workers:
+            for sync in syncs:
+                sync["reset"] = True
+            self.reset_workers = False
+
+        couriers, self.dirty_couriers = self.dirty_couriers, set()
+        for courier_id in couriers:
+            courier = dispatcher.couriers.get(courier_id)
+            previous = self.courier_shards.get(courier_id)
+            if courier is None:
+                if previous is not None:
+                    self._move_courier(courier_id, previous[1], None)
+                    syncs[previous[1]]["removed_couriers"].append(courier_id)
+                continue
+
+            if previous is not None and previous[0] == courier.location:
+                shard = previous[1]
+            else:
+                shard = self.map.locate(courier.location)[0]
+                self.courier_shards[courier_id] = (courier.location, shard)
+                if previous is None:
+                    self.shard_couriers[shard] += 1
+                elif previous[1] != shard:
+                    # Курьер переехал в другой регион
+                    self._move_courier(courier_id, previous[1], shard)
+                    syncs[previous[1]]["removed_couriers"].append(courier_id)
+
+            route = dispatcher.routes.route(courier)
+            signature = (courier.location, courier.status, courier.current_capacity, courier.max_capacity,
+                         tuple(order.id for order in route))
+            if self.courier_signatures.get(courier_id) != signature:
+                self.courier_signatures[courier_id] = signature
+                syncs[shard]["couriers"].append(courier_payload(courier, route))
+                self.metrics["synced_couriers"] += 1
+
+        orders, self.dirty_orders = self.dirty_orders, set()
+        for order_id in orders:
+            order = dispatcher.orders.get(order_id)
+            if order is not None and order.status == "pending":
+                # Новый ожидающий заказ или измененный воркером - отправляется целиком
+                shard, neighbour = self._order_region(order)
+                self.sent_orders[shard].add(order_id)
+                if neighbour is not None:
+                    self.border_orders[shard].add(order_id)
+                syncs[shard]["orders"].append(order_payload(order))
+                self.metrics["synced_orders"] += 1
+                continue
+            region = self.order_regions.pop(order_id, None)
+            if region is not None and order_id in self.sent_orders[region[0]]:
+                self.sent_orders[region[0]].discard(order_id)
+                self.border_orders[region[0]].discard(order_id)
+                syncs[region[0]]["removed_orders"].append(order_id)
+        return syncs
+
+    def _move_courier(self, courier_id, shard, new_shard):
+        """Учитывает уход курьера из региона shard (new_shard None - из диспетчера)"""
+        self.shard_couriers[shard] -= 1
+        self.courier_signatures.pop(courier_id, None)
+        if new_shard is None:
+            del self.courier_shards[courier_id]
+        else:
+            self.shard_couriers[new_shard] += 1
+
+    def _skew(self):
+        """Курьеров в самом загруженном регионе относительно среднего"""
+        total = sum(self.shard_couriers)
+        return max(self.shard_couriers) * self.count / total if total else 1.0
+
+    def _unbalanced(self):
+        """В одном регионе курьеров больше SHARD_REBALANCE_RATIO от среднего и
+        больше, чем сразу после прошлого построения (иначе перестройка не поможет)"""
+        if self.passes_since_rebuild < SHARD_REBALANCE_MIN_PASSES or sum(self.shard_couriers) < self.count:
+            return False
+        return self._skew() > max(SHARD_REBALANCE_RATIO, self.rebuilt_skew)
+
+    def _rebuild_map(self):
+        """Строит регионы по текущим точкам; воркеры получат свои данные заново"""
+        dispatcher = self.dispatcher
+        pending = dispatcher.orders_by_status.get("pending", ())
+        points = [courier.location for courier in dispatcher.couriers.values()]
+        points += [dispatcher.orders[order_id].destination for order_id in pending]
+        if self.map is not None:
+            self.metrics["rebalances"] += 1
+            self.reset_workers = True
+            print(f"🧩 Регионы перестроены: курьеров по регионам было {self.shard_couriers}")
+        self.map = ShardMap.from_points(points, self.count)
+        self.passes_since_rebuild = 0
+
+        self.courier_shards.clear()
+        self.courier_signatures.clear()
+        self.shard_couriers = [0] * self.count
+        self.order_regions.clear()
+        self.sent_orders = [set() for _ in range(self.count)]
+        self.border_orders = [set() for _ in range(self.count)]
+        self.dirty_couriers = set(dispatcher.couriers)
+        self.dirty_orders = set(pending)
+
+    def stats(self):
+        return dict(self.metrics, shards=len(self.workers), shard_couriers=list(self.shard_couriers))
+
+    def close(self):
+        """Останавливает воркеров; дальше все проходы идут в процессе сервера"""
+        for process, conn in self.workers:
+            try:
+                conn.send(None)
+                conn.close()
+            except OSError:
+                pass
+            process.join(timeout=1.0)
+            if process.is_alive():
+                process.terminate()
+        self.workers = []
+        if self in self.dispatcher.tracker.observers:
+            self.dispatcher.tracker.observers.remove(self)
@@ -0,0 +1,116 @@
+"""Пространственный индекс на равномерной сетке широта/долгота"""
+import heapq
+import math
+
+from config import SPATIAL_CELL_SIZE
+
+
+class GridIndex:
+    """Хранит точки по ячейкам сетки и ищет ближайшие к заданной точке.
+
+    Долгота умножается на lon_scale (косинус широты города), чтобы ячейки
+    и расстояния в сетке были равными по обеим осям в километрах.
+    """
+
+    def __init__(self, cell_size: float = SPATIAL_CELL_SIZE, lon_scale: float = 1.0):
+        self.cell_size = cell_size
+        self.lon_scale = lon_scale
+        self.cells = {}  # {(row, col): {item_id, ...}}
+        self.positions = {}  # {item_id: (lat, lon * lon_scale, (row, col))}
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, item_id):
+        return item_id in self.positions
+
+    def _cell_of(self, lat, lon):
+        return math.floor(lat / self.cell_size), math.floor(lon / self.cell_size)
+
+    def insert(self, item_id, location):
+        """Добавляет точку или переносит ее в новую ячейку"""
+        lat, lon = location
+        lon *= self.lon_scale
+        cell = self._cell_of(lat, lon)
+        previous = self.positions.get(item_id)
+        if previous is not None and previous[2] != cell:
+            self._discard_from_cell(item_id, previous[2])
+        self.positions[item_id] = (lat, lon, cell)
+        self.cells.setdefault(cell, set()).add(item_id)
+
+    def remove(self, item_id):
+        """Удаляет точку из индекса"""
+        previous = self.positions.pop(item_id, None)
+        if previous is not None:
+            self._discard_from_cell(item_id, previous[2])
+
+    def _discard_from_cell(self, item_id, cell):
+        members = self.cells.get(cell)
+        if members is None:
+            return
+        members.discard(item_id)
+        if not members:
+            del self.cells[cell]
+
+    def _ring_cells(self, center, radius):
+        """Ячейки на расстоянии ровно radius (по Чебышеву) от центральной"""
+        row, col = center
+        if radius == 0:
+            yield center
+            return
+        for c in range(col - radius, col + radius + 1):
+            yield row - radius, c
+            yield row + radius, c
+        for r in range(row - radius + 1, row + radius):
+            yield r, col - radius
+            yield r, col + radius
+
+    def nearest(self, point, k: int = 1, predicate=None):
+        """Возвращает до k ближайших id, для которых predicate(id) истинно.
+
+        Поиск идет кольцами ячеек от ячейки точки. Кольцо расширяется,
+        пока не найдено k подходящих точек, которые заведомо ближе
+        любой точки из еще не просмотренных колец.
+        """
+        if not self.positions or k <= 0:
+            return []
+
+        lat, lon = point
+        lon *= self.lon_scale
+        center = self._cell_of(lat, lon)
+        best = []  # max-куча из (-расстояние, id)
+        seen = 0
+
+        def consider(item_id):
+            item_lat, item_lon, _ = self.positions[item_id]
+            if predicate is not None and not predicate(item_id):
+                return
+            distance = math.hypot(item_lat - lat, item_lon - lon)
+            if len(best) < k:
+                heapq.heappush(best, (-distance, item_id))
+            elif distance < -best[0][0]:
+                heapq.heapreplace(best, (-distance, item_id))
+
+        radius = 0
+        while seen < len(self.positions):
+            # Дальние кольца почти пусты - дешевле просмотреть оставшиеся ячейки напрямую
+            if 8 * radius > len(self.cells):
+                for cell, members in self.cells.items():
+                    if max(abs(cell[0] - center[0]), abs(cell[1] - center[1])) >= radius:
+                        for item_id in members:
+                            consider(item_id)
+                break
+
+            for cell in self._ring_cells(center, radius):
+                members = self.cells.get(cell)
+                if members:
+                    seen += len(members)
+                    for item_id in members:
+                        consider(item_id)
+
+            # Точки за пределами кольца radius не ближе radius * cell_size
+            if len(best) == k and -best[0][0] <= radius * self.cell_size:
+                break
+            radius += 1
+
+        return [item_id for _, item_id in sorted(best, key=lambda entry: -entry[0])]
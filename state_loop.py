@@ -0,0 +1,181 @@
+"""Поток состояния: единственный поток, который меняет состояние сервера"""
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from metrics import registry as metrics
+from config import STATE_QUEUE_LIMIT, STATE_BATCH_LIMIT
+
+
+class StateLoop:
+    """Очередь команд к состоянию сервера и поток, который их применяет.
+
+    Команда - вызов функции. Обработчики клиентов, загрузка заказов,
+    периодические задачи и планировщик распределения ставят команды в
+    очередь, а поток состояния забирает их пачками до STATE_BATCH_LIMIT и
+    применяет по порядку. Если команды пачки запросили рассылку
+    (request_publish), publish() вызывается один раз после пачки. Поэтому
+    состояние не нужно защищать блокировками, а версии дельт идут в порядке
+    изменений.
+
+    Очередь ограничена STATE_QUEUE_LIMIT: при переполнении submit ждет,
+    и обратное давление доходит до сокетов клиентов. Цикл событий asyncio
+    ждать не должен: он вызывает submit_nowait, а место в очереди ждет
+    через wait_for_space в пуле потоков.
+    """
+
+    def __init__(self, publish, limit: int = STATE_QUEUE_LIMIT, batch_limit: int = STATE_BATCH_LIMIT):
+        self.publish = publish
+        self.limit = limit
+        self.batch_limit = batch_limit
+        self.condition = threading.Condition()
+        self.queue = deque()  # (функция, аргументы, Future)
+        self.delayed = []  # Куча (срок, номер, функция, аргументы) отложенных команд
+        self._delayed_ids = itertools.count()
+        self.running = True
+        self._publish_requested = False
+        self.batch = 0  # Номер текущей пачки
+
+        self.metrics = {
+            "commands": 0,  # Применено команд
+            "batches": 0,  # Пачек
+            "batch_max": 0,  # Максимум команд в пачке
+            "publishes": 0,  # Рассылок после пачек
+            "errors": 0,  # Команд, завершившихся исключением
+            "cancelled": 0,  # Команд, отмененных до выполнения
+            "queue_max": 0,  # Максимальная длина очереди
+            "waits": 0  # Сколько раз submit ждал места в очереди
+        }
+
+        self.thread = threading.Thread(target=self._loop, name="state-loop", daemon=True)
+        self.thread.start()
+
+    def in_loop(self):
+        """Вызов идет из потока состояния"""
+        return threading.current_thread() is self.thread
+
+    def submit(self, function, *args):
+        """Ставит команду в очередь и возвращает Future с ее результатом.
+
+        Из самого потока состояния и после остановки команда выполняется сразу.
+        """
+        return self._submit(function, args, block=True)
+
+    def submit_nowait(self, function, *args):
+        """Как submit, но при полной очереди не ждет, а возвращает None"""
+        return self._submit(function, args, block=False)
+
+    def wait_for_space(self):
+        """Ждет места в очереди (или остановки потока)"""
+        with self.condition:
+            while len(self.queue) >= self.limit and self.running:
+                self.condition.wait()
+
+    def _submit(self, function, args, block):
+        future = Future()
+        if not self.in_loop():
+            with self.condition:
+                if self.running:
+                    if len(self.queue) >= self.limit:
+                        self.metrics["waits"] += 1
+                        if not block:
+                            return None
+                        while len(self.queue) >= self.limit and self.running:
+                            self.condition.wait()
+                    self.queue.append((function, args, future))
+                    self.metrics["queue_max"] = max(self.metrics["queue_max"], len(self.queue))
+                    self.condition.notify_all()
+                    return future
+            # Поток остановлен: дожидаемся, пока он применит оставшееся
+            self.thread.join()
+        self._run(function, args, future)
+        return future
+
+    def submit_later(self, delay, function, *args):
+        """Ставит команду в очередь через delay секунд (при остановке не выполняется)"""
+        with self.condition:
+            heapq.heappush(self.delayed, (time.perf_counter() + delay, next(self._delayed_ids), function, args))
+            self.condition.notify_all()
+
+    def call(self, function, *args):
+        """Выполняет команду в потоке состояния и ждет результата"""
+        return self.submit(function, *args).result()
+
+    def request_publish(self):
+        """Просит разослать изменения после текущей пачки"""
+        if self.in_loop():
+            self._publish_requested = True
+        else:
+            self.submit(self.publish)
+
+    def stats(self):
+        """Сводка: сколько команд поглощает пачка и как заполнена очередь"""
+        with self.condition:
+            stats = dict(self.metrics)
+            stats["queue"] = len(self.queue)
+        stats["batch_avg"] = stats["commands"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+    def _loop(self):
+        while True:
+            with self.condition:
+                self._move_due()
+                while not self.queue and self.running:
+                    self.condition.wait(self.delayed[0][0] - time.perf_counter() if self.delayed else None)
+                    self._move_due()
+                if not self.queue:
+                    return
+                batch = [self.queue.popleft() for _ in range(min(len(self.queue), self.batch_limit))]
+                self.condition.notify_all()  # Освободилось место для ждущих submit
+            self._apply(batch)
+
+    def _move_due(self):
+        """Переносит в очередь отложенные команды, срок которых наступил"""
+        now = time.perf_counter()
+        while self.delayed and self.delayed[0][0] <= now:
+            _, _, function, args = heapq.heappop(self.delayed)
+            self.queue.append((function, args, Future()))
+
+    def _apply(self, batch):
+        started = time.perf_counter()
+        self.batch += 1
+        for function, args, future in batch:
+            self._run(function, args, future)
+        published = self._publish_requested
+        if published:
+            self._publish_requested = False
+            self._run(self.publish, (), Future())
+        metrics.observe("state.batch", time.perf_counter() - started)
+
+        with self.condition:
+            self.metrics["publishes"] += published
+            self.metrics["commands"] += len(batch)
+            self.metrics["batches"] += 1
+            self.metrics["batch_max"] = max(self.metrics["batch_max"], len(batch))
+
+    def _run(self, function, args, future):
+        if not future.set_running_or_notify_cancel():
+            # Ждавший отменил команду (например, задача asyncio при остановке сервера)
+            with self.condition:
+                self.metrics["cancelled"] += 1
+            return
+        try:
+            result = function(*args)
+        except Exception as e:
+            with self.condition:
+                self.metrics["errors"] += 1
+            print(f"❌ Ошибка команды {getattr(function, '__name__', function)}: {e}")
+            future.set_exception(e)
+            return
+        future.set_result(result)
+
+    def stop(self):
+        """Применяет оставшиеся команды и останавливает поток"""
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if not self.in_loop():
+            self.thread.join()
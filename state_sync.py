@@ -0,0 +1,128 @@
+"""Версионированное состояние системы: журнал изменений на сервере и реплика у клиентов"""
+import threading
+
+
+class StateTracker:
+    """Собирает id измененных курьеров, заказов и назначений между рассылками"""
+
+    def __init__(self):
+        self.seq = 0  # Номер последней разосланной версии
+        self.lock = threading.Lock()
+        self._couriers = set()
+        self._removed_couriers = set()
+        self._orders = set()
+        self._assignments = set()  # id заказов с новым назначением
+        self._removed_assignments = set()  # id заказов, назначение которых снято
+        # Другие потребители изменений (например, ShardRouter): получают id сразу,
+        # методами courier_changed, courier_removed и order_changed
+        self.observers = []
+
+    def courier_changed(self, courier_id):
+        with self.lock:
+            self._couriers.add(courier_id)
+            self._removed_couriers.discard(courier_id)
+        for observer in self.observers:
+            observer.courier_changed(courier_id)
+
+    def courier_removed(self, courier_id):
+        with self.lock:
+            self._couriers.discard(courier_id)
+            self._removed_couriers.add(courier_id)
+        for observer in self.observers:
+            observer.courier_removed(courier_id)
+
+    def order_changed(self, order_id):
+        with self.lock:
+            self._orders.add(order_id)
+        for observer in self.observers:
+            observer.order_changed(order_id)
+
+    def assignment_added(self, order_id):
+        with self.lock:
+            self._assignments.add(order_id)
+            self._removed_assignments.discard(order_id)
+
+    def assignment_removed(self, order_id):
+        with self.lock:
+            self._assignments.discard(order_id)
+            self._removed_assignments.add(order_id)
+
+    def next_version(self):
+        """Забирает накопленные изменения и присваивает им новый номер версии.
+
+        Возвращает (seq, курьеры, удаленные курьеры, заказы, назначения,
+        снятые назначения).
+        """
+        with self.lock:
+            self.seq += 1
+            changes = (self.seq, self._couriers, self._removed_couriers, self._orders,
+                       self._assignments, self._removed_assignments)
+            self._couriers = set()
+            self._removed_couriers = set()
+            self._orders = set()
+            self._assignments = set()
+            self._removed_assignments = set()
+        return changes
+
+
+class StateReplica:
+    """Локальная копия состояния сервера, собираемая из снимка и дельт"""
+
+    def __init__(self):
+        self.seq = None
+        self.couriers = {}
+        self.orders = {}
+        self.assignments = {}  # {order_id: назначение}
+        self.statistics = {}
+        self.traffic = "normal"
+        self.timestamp = None
+
+    def apply_snapshot(self, message):
+        """Заменяет состояние полным снимком (system_status)"""
+        self.couriers = {c["id"]: c for c in message.get("couriers", [])}
+        self.orders = {o["id"]: o for o in message.get("orders", [])}
+        self.assignments = {a["order_id"]: a for a in message.get("assignments", [])}
+        self._apply_common(message)
+        self.seq = message.get("seq")
+
+    def apply_delta(self, message) -> bool:
+        """Применяет дельту (state_delta). Возвращает False, если пропущена
+        версия и нужна повторная синхронизация"""
+        if self.seq is None or message.get("base_seq") != self.seq:
+            return False
+
+        for courier in message.get("couriers", []):
+            self.couriers[courier["id"]] = courier
+        for courier_id in message.get("removed_couriers", []):
+            self.couriers.pop(courier_id, None)
+        for order in message.get("orders", []):
+            self.orders[order["id"]] = order
+        for order_id in message.get("removed_assignments", []):
+            self.assignments.pop(order_id, None)
+        for assignment in message.get("assignments", []):
+            self.assignments[assignment["order_id"]] = assignment
+
+        self._apply_common(message)
+        self.seq = message["seq"]
+        return True
+
+    def _apply_common(self, message):
+        if "statistics" in message:
+            self.statistics = message["statistics"]
+        if "traffic" in message:
+            self.traffic = message["traffic"]
+        self.timestamp = message.get("timestamp", self.timestamp)
+
+    def to_status(self):
+        """Представление реплики в формате сообщения system_status"""
+        active_courier_ids = set(self.couriers)
+        return {
+            "type": "system_status",
+            "seq": self.seq,
+            "couriers": list(self.couriers.values()),
+            "orders": list(self.orders.values()),
+            "assignments": [a for a in self.assignments.values() if a.get("courier_id") in active_courier_ids],
+            "statistics": self.statistics,
+            "traffic": self.traffic,
+            "timestamp": self.timestamp
+        }
@@ -0,0 +1,205 @@
+"""Подписки клиентов на темы рассылки.
+
+Темы:
+    *                   - все состояние (по умолчанию; мониторы)
+    stats               - статистика и трафик, periodic_update
+    assignments:<id>    - назначения курьера <id> и их заказы (по умолчанию для курьера)
+    orders:pending      - ожидающие заказы
+    couriers            - все активные курьеры
+    couriers:<юг>,<запад>,<север>,<восток> - курьеры внутри прямоугольника координат
+
+Подписчик на "*" получает общие снимки и дельты. Остальным сервер
+собирает снимок и дельты только из их тем; дельта уходит, только если
+в ней есть что-то для подписчика, и ее base_seq - версия, которую клиент
+получил последней, так что StateReplica клиента работает без изменений.
+"""
+ALL = "*"
+STATS = "stats"
+PENDING_ORDERS = "orders:pending"
+COURIERS = "couriers"
+ASSIGNMENTS_PREFIX = "assignments:"
+COURIERS_PREFIX = "couriers:"
+
+
+def courier_key(courier_id):
+    """Id курьера в подписке. Темы - строки, поэтому id из тем и id из
+    назначений сравниваются в одном виде: 7 и "7" - один курьер, "a1" - как есть"""
+    return str(courier_id)
+
+
+def courier_topics(courier_id):
+    """Подписка курьера по умолчанию: только свои назначения.
+
+    Статистика меняется почти каждый проход, поэтому курьер получает ее,
+    только если сам подпишется на "stats".
+    """
+    return [f"{ASSIGNMENTS_PREFIX}{courier_key(courier_id)}"]
+
+
+def _find_courier(dispatcher, key):
+    """Курьер диспетчера по id из подписки (в реестре id бывают и числами)"""
+    courier = dispatcher.couriers.get(key)
+    if courier is None and key.lstrip("-").isdigit():
+        courier = dispatcher.couriers.get(int(key))
+    return courier
+
+
+def _parse_region(text):
+    south, west, north, east = (float(value) for value in text.split(","))
+    if south > north or west > east:
+        raise ValueError(f"пустой прямоугольник: {text}")
+    return south, west, north, east
+
+
+class Subscription:
+    """Темы одного подключения и то, что клиент уже знает (для дельт)"""
+
+    def __init__(self, topics=(ALL,), explicit=False):
+        self.topics = []
+        self.everything = False
+        self.stats = False
+        self.pending_orders = False
+        self.all_couriers = False
+        self.courier_ids = set()  # Чьи назначения получает клиент (см. courier_key)
+        self.regions = []  # Прямоугольники (юг, запад, север, восток)
+
+        for topic in topics:
+            if not isinstance(topic, str):
+                raise ValueError(f"тема должна быть строкой: {topic!r}")
+            if topic == ALL:
+                self.everything = True
+            elif topic == STATS:
+                self.stats = True
+            elif topic == PENDING_ORDERS:
+                self.pending_orders = True
+            elif topic == COURIERS:
+                self.all_couriers = True
+            elif topic.startswith(ASSIGNMENTS_PREFIX):
+                courier_id = topic[len(ASSIGNMENTS_PREFIX):]
+                if not courier_id:
+                    raise ValueError(f"не указан id курьера: {topic}")
+                self.courier_ids.add(courier_id)
+            elif topic.startswith(COURIERS_PREFIX):
+                self.regions.append(_parse_region(topic[len(COURIERS_PREFIX):]))
+            else:
+                raise ValueError(f"неизвестная тема: {topic}")
+            self.topics.append(topic)
+
+        self.explicit = explicit  # Клиент подписался сам; иначе сервер подбирает темы по роли
+        self.seq = None  # Версия, которую клиент получил последней; None - снимка еще не было
+        self.known_orders = set()  # Заказы назначений, которые клиент видит
+        self.known_couriers = set()  # Курьеры регионов, которые клиент видит
+        self.last_statistics = None
+        self.last_traffic = None
+
+    def _in_regions(self, location):
+        if self.all_couriers:
+            return True
+        lat, lon = location[0], location[1]
+        return any(south <= lat <= north and west <= lon <= east
+                   for south, west, north, east in self.regions)
+
+    def filter_status(self, dispatcher, seq, active_couriers, statistics, traffic, timestamp):
+        """Снимок system_status только с темами подписки (заполняет known_*)"""
+        couriers = [courier.to_dict() for courier in active_couriers
+                    if (self.all_couriers or self.regions) and self._in_regions(courier.location)]
+        self.known_couriers = {courier["id"] for courier in couriers}
+
+        assignments = []
+        order_ids = []
+        for key in sorted(self.courier_ids):
+            courier = _find_courier(dispatcher, key)
+            for order in courier.current_orders if courier is not None else ():
+                assignment = dispatcher.active_assignments.get(order.id)
+                if assignment is not None:
+                    assignments.append(assignment)
+                    order_ids.append(order.id)
+        self.known_orders = set(order_ids)
+        if self.pending_orders:
+            order_ids.extend(dispatcher.orders_by_status.get("pending", ()))
+
+        message = {
+            "type": "system_status",
+            "seq": seq,
+            "topics": self.topics,
+            "couriers": couriers,
+            "orders": [dispatcher.orders[order_id].to_dict() for order_id in order_ids],
+            "assignments": assignments,
+            "timestamp": timestamp
+        }
+        if self.stats:
+            message["statistics"] = statistics
+            message["traffic"] = traffic
+            self.last_statistics = dict(statistics)
+            self.last_traffic = traffic
+        self.seq = seq
+        return message
+
+    def filter_delta(self, delta):
+        """Дельта только с темами подписки или None, если клиенту нечего сообщить"""
+        couriers = []
+        removed_couriers = []
+        if self.all_couriers or self.regions:
+            for courier in delta["couriers"]:
+                if self._in_regions(courier["location"]):
+                    couriers.append(courier)
+                    self.known_couriers.add(courier["id"])
+                elif courier["id"] in self.known_couriers:
+                    # Курьер уехал из региона - для подписчика он удален
+                    removed_couriers.append(courier["id"])
+                    self.known_couriers.discard(courier["id"])
+            for courier_id in delta["removed_couriers"]:
+                if courier_id in self.known_couriers:
+                    removed_couriers.append(courier_id)
+                    self.known_couriers.discard(courier_id)
+
+        assignments = []
+        removed_assignments = []
+        if self.courier_ids:
+            for assignment in delta["assignments"]:
+                order_id = assignment["order_id"]
+                if courier_key(assignment["courier_id"]) in self.courier_ids:
+                    assignments.append(assignment)
+                    self.known_orders.add(order_id)
+                elif order_id in self.known_orders:
+                    # Заказ передан другому курьеру
+                    removed_assignments.append(order_id)
+                    self.known_orders.discard(order_id)
+            for order_id in delta["removed_assignments"]:
+                if order_id in self.known_orders:
+                    removed_assignments.append(order_id)
+                    self.known_orders.discard(order_id)
+
+        # Заказы назначений (смена статуса попадает в дельту и для новых назначений)
+        # и по теме - ожидающие вместе с теми, что только что перестали ожидать
+        orders = []
+        if self.courier_ids or self.pending_orders:
+            released = set(removed_assignments)
+            just_assigned = {assignment["order_id"] for assignment in delta["assignments"]}
+            for order in delta["orders"]:
+                if (order["id"] in self.known_orders or order["id"] in released
+                        or self.pending_orders and (order["status"] == "pending" or order["id"] in just_assigned)):
+                    orders.append(order)
+
+        message = {
+            "type": "state_delta",
+            "seq": delta["seq"],
+            "base_seq": self.seq,
+            "couriers": couriers,
+            "removed_couriers": removed_couriers,
+            "orders": orders,
+            "assignments": assignments,
+            "removed_assignments": removed_assignments,
+            "timestamp": delta["timestamp"]
+        }
+        changed = couriers or removed_couriers or orders or assignments or removed_assignments
+        if self.stats and (delta["statistics"] != self.last_statistics or delta["traffic"] != self.last_traffic):
+            message["statistics"] = delta["statistics"]
+            message["traffic"] = delta["traffic"]
+            self.last_statistics = dict(delta["statistics"])
+            self.last_traffic = delta["traffic"]
+            changed = True
+        if not changed:
+            return None
+        self.seq = delta["seq"]
+        return message
@@ -0,0 +1,123 @@
+"""Временные окна доставки: разбор "HH:MM-HH:MM" и индекс заказов по сроку"""
+import bisect
+import time
+from datetime import date
+from functools import lru_cache
+
+from config import TIME_WINDOW_PENALTY, PRIORITY_WEIGHT
+
+MINUTES_PER_DAY = 24 * 60
+FULL_DAY = (0, MINUTES_PER_DAY)
+# Минуты отсчитываются от полуночи дня запуска процесса и после следующей
+# полуночи продолжаются (24:10 - это 1450), чтобы окна на завтра сравнивались
+# с текущим временем без перехода через ноль
+DAY_ZERO = date.today()
+
+
+@lru_cache(maxsize=4096)
+def parse_time_window(text):
+    """Окно "HH:MM-HH:MM" в минуты от полуночи: (начало, конец).
+
+    Окно через полночь ("22:00-01:00") заканчивается на следующие сутки.
+    Неразборчивое окно не ограничивает доставку: весь день.
+    Окон немного разных, поэтому каждая строка разбирается один раз.
+    """
+    try:
+        start_text, end_text = text.split("-")
+        start = _parse_clock(start_text)
+        end = _parse_clock(end_text)
+    except (AttributeError, ValueError):
+        return FULL_DAY
+    if end < start:
+        end += MINUTES_PER_DAY
+    return start, end
+
+
+def _parse_clock(text):
+    hours, minutes = text.strip().split(":")
+    hours, minutes = int(hours), int(minutes)
+    if not (0 <= hours <= 24 and 0 <= minutes < 60):
+        raise ValueError(text)
+    return hours * 60 + minutes
+
+
+def minute_of(timestamp):
+    """Местное время момента timestamp в минутах от полуночи DAY_ZERO"""
+    moment = time.localtime(timestamp)
+    days = (date(moment.tm_year, moment.tm_mon, moment.tm_mday) - DAY_ZERO).days
+    return days * MINUTES_PER_DAY + moment.tm_hour * 60 + moment.tm_min + moment.tm_sec / 60
+
+
+def current_minute():
+    """Текущее местное время в минутах от полуночи DAY_ZERO"""
+    return minute_of(time.time())
+
+
+def order_window(text, created_time):
+    """Окно заказа, созданного в момент created_time: (начало, конец) в минутах от
+    полуночи DAY_ZERO.
+
+    Окно относится к суткам создания заказа. Если к созданию оно уже закончилось
+    (в 23:50 заказ на "08:00-10:00"), это окно следующих суток; если заказ создан
+    после полуночи внутри окна через полночь ("22:00-01:00" в 00:30) - окно,
+    начавшееся накануне.
+    """
+    return _order_window(text, int(created_time))
+
+
+@lru_cache(maxsize=4096)
+def _order_window(text, created_second):
+    # Заказы пачки (загрузка, журнал) созданы в одну секунду: окно считается один раз
+    start, end = parse_time_window(text)
+    created = minute_of(created_second)
+    day = created // MINUTES_PER_DAY * MINUTES_PER_DAY
+    if end < created - day:
+        day += MINUTES_PER_DAY
+    elif end > MINUTES_PER_DAY and created - day < end - MINUTES_PER_DAY:
+        day -= MINUTES_PER_DAY
+    return day + start, day + end
+
+
+def window_penalty(order):
+    """Штраф за опоздание к концу окна; с приоритетным заказом - в PRIORITY_WEIGHT раз больше"""
+    return TIME_WINDOW_PENALTY * (PRIORITY_WEIGHT if order.priority == "high" else 1)
+
+
+def dispatch_key(order):
+    """Порядок распределения: сначала высокий приоритет, затем ближайший срок окна"""
+    return order.priority != "high", order.window_end, order.created_time, order.id
+
+
+class DeadlineIndex:
+    """Ожидающие заказы, упорядоченные по dispatch_key.
+
+    Хранится отсортированный список ключей: вставка и удаление - бинарный
+    поиск, а проход распределения идет от самых срочных заказов и может
+    остановиться, не просматривая остальные.
+    """
+
+    def __init__(self):
+        self.keys = []
+        self.order_keys = {}  # {id заказа: ключ}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def insert(self, order):
+        self.remove(order.id)
+        key = dispatch_key(order)
+        bisect.insort(self.keys, key)
+        self.order_keys[order.id] = key
+
+    def remove(self, order_id):
+        key = self.order_keys.pop(order_id, None)
+        if key is None:
+            return
+        position = bisect.bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            del self.keys[position]
+
+    def order_ids(self):
+        """id заказов от самого срочного; индекс можно менять во время обхода"""
+        for key in list(self.keys):
+            yield key[-1]
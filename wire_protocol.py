@@ -0,0 +1,315 @@
+"""Протокол обмена: строки JSON через \\n и согласуемый бинарный формат с длиной кадра.
+
+Клиент, желающий бинарный формат, первым сообщением отправляет строку
+{"type": "hello", "protocol": "binary/1"}. Сервер отвечает строкой
+{"type": "hello_ack", "protocol": "binary/1"}, после чего обе стороны
+передают кадры: 4 байта длины (big-endian) и полезная нагрузка, в которой
+первый байт - тег формата. Частые сообщения (courier_update,
+order_delivered, state_delta) кодируются компактно, остальные - JSON.
+Клиенты без hello продолжают работать строками JSON.
+"""
+import json
+import struct
+
+BINARY_PROTOCOL = "binary/1"
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+
+# Теги кадров
+TAG_JSON = 0
+TAG_COURIER_UPDATE = 1
+TAG_ORDER_DELIVERED = 2
+TAG_STATE_DELTA = 3
+
+# Словари для кодирования строковых значений одним байтом
+COURIER_STATUSES = ("available", "busy", "offline", "emergency")
+ORDER_STATUSES = ("pending", "assigned", "in_progress", "delivered", "cancelled")
+PRIORITIES = ("high", "normal", "low")
+TRANSPORTS = ("foot", "bicycle", "car", "motorcycle")
+
+COURIER_UPDATE_KEYS = {"type", "courier_id", "location", "status", "name", "transport_type"}
+ORDER_DELIVERED_KEYS = {"type", "courier_id", "order_id"}
+STATE_DELTA_KEYS = {"type", "seq", "base_seq", "couriers", "removed_couriers", "orders",
+                    "assignments", "removed_assignments", "statistics", "traffic", "timestamp"}
+COURIER_KEYS = {"id", "location", "transport_type", "max_capacity", "current_capacity",
+                "current_orders", "status", "name"}
+ORDER_KEYS = {"id", "destination", "weight", "priority", "time_window", "description",
+              "status", "assigned_courier", "created_time"}
+ASSIGNMENT_KEYS = {"courier_id", "order_id", "estimated_time", "score"}
+
+_FRAME_HEADER = struct.Struct(">I")
+_COURIER_UPDATE = struct.Struct(">iddBB")
+_ORDER_DELIVERED = struct.Struct(">ii")
+_DELTA_HEADER = struct.Struct(">QqIIIII")
+_COURIER = struct.Struct(">iddBddBB")
+_ORDER = struct.Struct(">idddBBBBid")
+_ASSIGNMENT = struct.Struct(">iid")
+
+
+class _Writer:
+    def __init__(self, tag):
+        self.buffer = bytearray([tag])
+
+    def pack(self, fmt: struct.Struct, *values):
+        self.buffer += fmt.pack(*values)
+
+    def ints(self, values):
+        self.buffer += struct.pack(f">I{len(values)}i", len(values), *values)
+
+    def text(self, value, size_format=">H"):
+        data = value.encode('utf-8')
+        self.buffer += struct.pack(size_format, len(data)) + data
+
+
+class _Reader:
+    def __init__(self, payload):
+        self.payload = payload
+        self.offset = 1
+
+    def unpack(self, fmt: struct.Struct):
+        values = fmt.unpack_from(self.payload, self.offset)
+        self.offset += fmt.size
+        return values
+
+    def ints(self):
+        (count,) = struct.unpack_from(">I", self.payload, self.offset)
+        values = struct.unpack_from(f">{count}i", self.payload, self.offset + 4)
+        self.offset += 4 + 4 * count
+        return list(values)
+
+    def text(self, size_format=">H"):
+        (size,) = struct.unpack_from(size_format, self.payload, self.offset)
+        start = self.offset + struct.calcsize(size_format)
+        self.offset = start + size
+        return self.payload[start:self.offset].decode('utf-8')
+
+
+def _encode_courier_update(message):
+    writer = _Writer(TAG_COURIER_UPDATE)
+    lat, lon = message["location"]
+    writer.pack(_COURIER_UPDATE, message["courier_id"], lat, lon,
+                COURIER_STATUSES.index(message["status"]), TRANSPORTS.index(message["transport_type"]))
+    writer.text(message["name"])
+    return writer.buffer
+
+
+def _decode_courier_update(reader):
+    courier_id, lat, lon, status, transport = reader.unpack(_COURIER_UPDATE)
+    return {
+        "type": "courier_update",
+        "courier_id": courier_id,
+        "location": [lat, lon],
+        "status": COURIER_STATUSES[status],
+        "name": reader.text(),
+        "transport_type": TRANSPORTS[transport]
+    }
+
+
+def _encode_order_delivered(message):
+    writer = _Writer(TAG_ORDER_DELIVERED)
+    writer.pack(_ORDER_DELIVERED, message["courier_id"], message["order_id"])
+    return writer.buffer
+
+
+def _decode_order_delivered(reader):
+    courier_id, order_id = reader.unpack(_ORDER_DELIVERED)
+    return {"type": "order_delivered", "courier_id": courier_id, "order_id": order_id}
+
+
+def _encode_state_delta(message):
+    couriers = message["couriers"]
+    orders = message["orders"]
+    assignments = message["assignments"]
+    if (any(set(c) != COURIER_KEYS for c in couriers) or any(set(o) != ORDER_KEYS for o in orders)
+            or any(set(a) != ASSIGNMENT_KEYS for a in assignments)):
+        raise ValueError("нестандартные поля")
+
+    writer = _Writer(TAG_STATE_DELTA)
+    writer.pack(_DELTA_HEADER, message["seq"], message["base_seq"], len(couriers), len(orders),
+                len(assignments), len(message["removed_couriers"]), len(message["removed_assignments"]))
+
+    for courier in couriers:
+        lat, lon = courier["location"]
+        writer.pack(_COURIER, courier["id"], lat, lon, TRANSPORTS.index(courier["transport_type"]),
+                    courier["max_capacity"], courier["current_capacity"],
+                    COURIER_STATUSES.index(courier["status"]), len(courier["current_orders"]))
+        writer.buffer += struct.pack(f">{len(courier['current_orders'])}i", *courier["current_orders"])
+        writer.text(courier["name"])
+
+    for order in orders:
+        lat, lon = order["destination"]
+        assigned = order["assigned_courier"]
+        writer.pack(_ORDER, order["id"], lat, lon, order["weight"], PRIORITIES.index(order["priority"]),
+                    ORDER_STATUSES.index(order["status"]), assigned is not None, 0,
+                    assigned if assigned is not None else 0, order["created_time"])
+        writer.text(order["time_window"])
+        writer.text(order["description"])
+
+    for assignment in assignments:
+        writer.pack(_ASSIGNMENT, assignment["courier_id"], assignment["order_id"], assignment["score"])
+        writer.text(assignment["estimated_time"])
+
+    writer.ints(message["removed_couriers"])
+    writer.ints(message["removed_assignments"])
+
+    # Небольшие поля с произвольной структурой - в JSON
+    tail = {"statistics": message["statistics"], "traffic": message["traffic"],
+            "timestamp": message["timestamp"]}
+    writer.text(json.dumps(tail, ensure_ascii=False), ">I")
+    return writer.buffer
+
+
+def _decode_state_delta(reader):
+    seq, base_seq, courier_count, order_count, assignment_count, _, _ = reader.unpack(_DELTA_HEADER)
+
+    couriers = []
+    for _ in range(courier_count):
+        courier_id, lat, lon, transport, max_capacity, current_capacity, status, order_total = \
+            reader.unpack(_COURIER)
+        current_orders = list(struct.unpack_from(f">{order_total}i", reader.payload, reader.offset))
+        reader.offset += 4 * order_total
+        couriers.append({
+            "id": courier_id,
+            "location": [lat, lon],
+            "transport_type": TRANSPORTS[transport],
+            "max_capacity": max_capacity,
+            "current_capacity": current_capacity,
+            "current_orders": current_orders,
+            "status": COURIER_STATUSES[status],
+            "name": reader.text()
+        })
+
+    orders = []
+    for _ in range(order_count):
+        order_id, lat, lon, weight, priority, status, has_courier, _, assigned, created_time = \
+            reader.unpack(_ORDER)
+        orders.append({
+            "id": order_id,
+            "destination": [lat, lon],
+            "weight": weight,
+            "priority": PRIORITIES[priority],
+            "time_window": reader.text(),
+            "description": reader.text(),
+            "status": ORDER_STATUSES[status],
+            "assigned_courier": assigned if has_courier else None,
+            "created_time": created_time
+        })
+
+    assignments = []
+    for _ in range(assignment_count):
+        courier_id, order_id, score = reader.unpack(_ASSIGNMENT)
+        assignments.append({
+            "courier_id": courier_id,
+            "order_id": order_id,
+            "estimated_time": reader.text(),
+            "score": score
+        })
+
+    message = {
+        "type": "state_delta",
+        "seq": seq,
+        "base_seq": base_seq,
+        "couriers": couriers,
+        "removed_couriers": reader.ints(),
+        "orders": orders,
+        "assignments": assignments,
+        "removed_assignments": reader.ints()
+    }
+    message.update(json.loads(reader.text(">I")))
+    return message
+
+
+_ENCODERS = {
+    "courier_update": (COURIER_UPDATE_KEYS, _encode_courier_update),
+    "order_delivered": (ORDER_DELIVERED_KEYS, _encode_order_delivered),
+    "state_delta": (STATE_DELTA_KEYS, _encode_state_delta),
+}
+
+_DECODERS = {
+    TAG_COURIER_UPDATE: _decode_courier_update,
+    TAG_ORDER_DELIVERED: _decode_order_delivered,
+    TAG_STATE_DELTA: _decode_state_delta,
+}
+
+
+def encode_frame(message) -> bytes:
+    """Кодирует сообщение в бинарный кадр (компактно, если тип это позволяет)"""
+    payload = None
+    encoder = _ENCODERS.get(message.get("type"))
+    if encoder is not None and set(message) == encoder[0]:
+        try:
+            payload = encoder[1](message)
+        except (struct.error, ValueError, TypeError, KeyError, AttributeError):
+            payload = None  # Значения не укладываются в компактный формат
+
+    if payload is None:
+        payload = bytes([TAG_JSON]) + json.dumps(message, ensure_ascii=False).encode('utf-8')
+    return _FRAME_HEADER.pack(len(payload)) + payload
+
+
+def decode_frame(payload: bytes):
+    """Декодирует полезную нагрузку кадра в словарь сообщения"""
+    tag = payload[0]
+    if tag == TAG_JSON:
+        return json.loads(payload[1:].decode('utf-8'))
+    decoder = _DECODERS.get(tag)
+    if decoder is None:
+        raise ValueError(f"неизвестный тег кадра: {tag}")
+    return decoder(_Reader(payload))
+
+
+def encode_line(message) -> bytes:
+    """Кодирует сообщение строкой JSON"""
+    return (json.dumps(message, ensure_ascii=False) + "\n").encode('utf-8')
+
+
+def encode(message, binary: bool = False) -> bytes:
+    return encode_frame(message) if binary else encode_line(message)
+
+
+class StreamDecoder:
+    """Разбирает входящий поток байт на сообщения.
+
+    В режиме строк возвращает строки JSON, в бинарном режиме - словари.
+    Режим можно переключить между сообщениями (после hello/hello_ack),
+    оставшиеся в буфере байты будут разобраны уже в новом режиме.
+    """
+
+    def __init__(self, max_message_size: int = MAX_FRAME_SIZE):
+        self.buffer = bytearray()
+        self.binary = False
+        self.max_message_size = max_message_size
+        self.scanned = 0  # Сколько байт начала буфера уже проверено на \n
+
+    def feed(self, data: bytes):
+        self.buffer += data
+
+    def messages(self):
+        buffer = self.buffer
+        while True:
+            if self.binary:
+                if len(buffer) < _FRAME_HEADER.size:
+                    return
+                (size,) = _FRAME_HEADER.unpack_from(buffer)
+                if size == 0 or size > self.max_message_size:
+                    raise ValueError(f"недопустимый размер кадра: {size}")
+                end = _FRAME_HEADER.size + size
+                if len(buffer) < end:
+                    return
+                payload = bytes(buffer[_FRAME_HEADER.size:end])
+                del buffer[:end]
+                yield decode_frame(payload)
+            else:
+                # Поиск продолжается с места остановки: длинная строка,
+                # приходящая по частям, не просматривается заново
+                newline = buffer.find(b"\n", self.scanned)
+                if newline < 0:
+                    self.scanned = len(buffer)
+                    if len(buffer) > self.max_message_size:
+                        raise ValueError(f"строка длиннее {self.max_message_size} байт")
+                    return
+                self.scanned = 0
+                line = bytes(buffer[:newline])
+                del buffer[:newline + 1]
+                text = line.decode('utf-8').strip()
+                if text:
+                    yield text